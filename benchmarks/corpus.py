@@ -0,0 +1,144 @@
+"""Deterministic synthetic snippet corpora for the benchmarks.
+
+The same seed and size always produce the same snippets. Languages, tags and
+sizes are skewed the way a real library is: a few languages and tags
+dominate, most snippets are a screenful of code and a few run to hundreds of
+lines.
+
+    python -m benchmarks.corpus 100000 corpus.jsonl.gz
+"""
+import argparse
+import json
+import random
+import sys
+
+DEFAULT_SEED = 20240601
+
+# (language, weight)
+LANGUAGES = (
+    ("Python", 30), ("JavaScript", 18), ("TypeScript", 10), ("Java", 8), ("Go", 7), ("C++", 6),
+    ("C", 5), ("Rust", 5), ("Bash", 4), ("SQL", 4), ("Ruby", 3),
+)
+WORDS = (
+    "cache", "retry", "parse", "config", "user", "token", "request", "response", "queue", "worker",
+    "buffer", "stream", "file", "path", "date", "time", "json", "yaml", "csv", "http", "client",
+    "server", "socket", "thread", "lock", "pool", "batch", "index", "search", "sort", "filter",
+    "merge", "split", "format", "encode", "decode", "hash", "crypt", "auth", "session", "log",
+    "metric", "event", "handler", "router", "model", "schema", "query", "table", "row", "column",
+)
+VERBS = ("get", "load", "save", "build", "make", "read", "write", "update", "delete", "check", "find", "compute")
+TAG_COUNT = 200
+
+TEMPLATES = {
+    "Python": ("def {name}({a}, {b}=None):", "    {a} = {b} or {n}", "    return {a}",
+               "    for {a} in {b}:", "        if {a} > {n}:", "            {b}.append({a})",
+               "    # {word} handling", "class {Name}:", "    def {verb}(self, {a}):",
+               "        self.{a} = {a}"),
+    "JavaScript": ("function {name}({a}, {b}) {{", "  const {a} = {b} || {n};", "  return {a};", "}}",
+                   "  for (const {a} of {b}) {{", "    if ({a} > {n}) {b}.push({a});", "  }}",
+                   "  // {word} handling", "export const {name} = ({a}) => {a} * {n};"),
+    "TypeScript": ("export function {name}({a}: number, {b}: string): string {{", "  return `${{{b}}}{n}`;",
+                   "}}", "interface {Name} {{", "  {a}: string;", "  {b}?: number;", "}}",
+                   "  // {word} handling", "const {a}: {Name}[] = [];"),
+    "Java": ("public class {Name} {{", "    private int {a} = {n};", "    public int {verb}(int {b}) {{",
+             "        return {a} + {b};", "    }}", "}}", "    // {word} handling",
+             "        System.out.println({a});"),
+    "Go": ("func {Name}({a} int, {b} string) (int, error) {{", "\t{a} := {n}", "\treturn {a}, nil", "}}",
+           "\tfor _, {a} := range {b} {{", "\t\tfmt.Println({a})", "\t}}", "\t// {word} handling"),
+    "C++": ("#include <vector>", "int {name}(std::vector<int>& {a}) {{", "    int {b} = {n};",
+            "    for (auto& x : {a}) {b} += x;", "    return {b};", "}}", "    // {word} handling",
+            "    std::cout << {b} << std::endl;"),
+    "C": ("#include <stdio.h>", "int {name}(int {a}, int {b}) {{", "    int r = {a} * {n};",
+          "    printf(\"%d\\n\", r);", "    return r + {b};", "}}", "    /* {word} handling */"),
+    "Rust": ("fn {name}({a}: i32, {b}: &str) -> i32 {{", "    let mut {a} = {a} + {n};", "    {a}",
+             "}}", "    println!(\"{{}}\", {b});", "    // {word} handling", "impl {Name} {{"),
+    "Bash": ("#!/bin/bash", "{a}=\"${{1:-{n}}}\"", "if [[ -z \"${a}\" ]]; then", "  echo \"{word}\"",
+             "fi", "for f in *.{word}; do", "  echo \"$f\"", "done"),
+    "SQL": ("SELECT {a}, {b} FROM {word}s", "WHERE {a} > {n}", "ORDER BY {b} DESC;",
+            "CREATE TABLE {word}s ({a} INTEGER PRIMARY KEY, {b} TEXT);",
+            "INSERT INTO {word}s ({a}, {b}) VALUES ({n}, '{word}');", "-- {word} report"),
+    "Ruby": ("def {name}({a}, {b} = nil)", "  {a} = {b} || {n}", "  {a}", "end",
+             "  {b}.each do |x|", "    puts x", "  end", "  # {word} handling"),
+}
+
+
+def _weighted(rng, pairs):
+    return rng.choices([value for value, _ in pairs], weights=[weight for _, weight in pairs])[0]
+
+
+def snippet_lines(rng):
+    # Log-normal around ~20 lines, capped so a single snippet stays realistic
+    return max(3, min(int(rng.lognormvariate(3.0, 0.9)), 600))
+
+
+def generate(count, seed=DEFAULT_SEED):
+    """Yield count snippet dicts in the app's import/export format."""
+    rng = random.Random(seed)
+    tags = [f"{rng.choice(WORDS)}-{index}" if index >= len(WORDS) else WORDS[index] for index in range(TAG_COUNT)]
+    # Zipf-like: the first tags are by far the most common
+    tag_weights = [1 / (rank + 1) for rank in range(TAG_COUNT)]
+    for index in range(count):
+        language = _weighted(rng, LANGUAGES)
+        template = TEMPLATES[language]
+        word, other = rng.choice(WORDS), rng.choice(WORDS)
+        verb = rng.choice(VERBS)
+        fields = {
+            "name": f"{verb}_{word}_{index}", "Name": f"{word.title()}{other.title()}{index}",
+            "a": word, "b": other, "verb": verb, "word": word,
+        }
+        lines = [
+            rng.choice(template).format(n=rng.randrange(1000), **fields)
+            for _ in range(snippet_lines(rng))
+        ]
+        chosen = {rng.choices(tags, weights=tag_weights)[0] for _ in range(rng.randint(1, 4))}
+        day = 1 + index % 28
+        yield {
+            "title": f"{verb.title()} {word} {other} #{index}",
+            "code": "\n".join(lines),
+            "language": language,
+            "tags": ", ".join(sorted(chosen)),
+            "description": f"How to {verb} {word} with {other}" if rng.random() < 0.4 else "",
+            "favorite": int(rng.random() < 0.05),
+            "created_at": f"2024-{1 + index % 12:02d}-{day:02d} 12:00:00",
+            "last_modified": f"2024-{1 + index % 12:02d}-{day:02d} {index % 24:02d}:{index % 60:02d}:00",
+        }
+
+
+def populate(store, count, seed=DEFAULT_SEED, batch_size=5000):
+    """Fill a SnippetStore with count generated snippets in large transactions."""
+    batch = []
+    for snippet in generate(count, seed):
+        batch.append(snippet)
+        if len(batch) >= batch_size:
+            store.upsert_many(batch, commit=False)
+            batch = []
+    store.upsert_many(batch, commit=False)
+    store.commit()
+
+
+def write_file(path, count, seed=DEFAULT_SEED):
+    """Write a corpus in any format transfer.py reads (picked by extension)."""
+    import transfer
+    with open(path, "wb") as raw, transfer.open_writer(raw, path) as out:
+        jsonl = transfer.is_jsonl(path)
+        out.write("" if jsonl else "[")
+        for index, snippet in enumerate(generate(count, seed)):
+            if jsonl:
+                out.write(json.dumps(snippet, ensure_ascii=False) + "\n")
+            else:
+                out.write(("," if index else "") + json.dumps(snippet, ensure_ascii=False))
+        out.write("" if jsonl else "]")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic snippet corpus.")
+    parser.add_argument("count", type=int)
+    parser.add_argument("path", help=".json or .jsonl, optionally .gz/.zst")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    args = parser.parse_args(argv)
+    write_file(args.path, args.count, args.seed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
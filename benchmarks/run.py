@@ -0,0 +1,284 @@
+"""Timed scenarios for the list, search, save, transfer, detection and
+highlighting paths, runnable headless.
+
+    python -m benchmarks.run --size 100000 --output results.json
+    python -m benchmarks.run --baseline baseline.json --threshold 0.25
+    python -m benchmarks.run --save-baseline baseline.json
+
+Each scenario reports the min, median, p95 and mean of its timed runs in
+seconds. With --baseline, any scenario whose median is slower than the
+baseline's by more than the threshold is a regression and the exit status
+is 1. Tk scenarios run against a withdrawn root window and are skipped when
+no display is available.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks import corpus
+
+# Timings below this (seconds) are too noisy to call a regression
+NOISE_FLOOR = 0.001
+DEFAULT_THRESHOLD = 0.2
+PAGE_SIZE = 100
+SEARCH_QUERIES = ("cache", "parse json", "ret", "handling token", "session-1", "zzzz")
+TAG_FILTERS = ((("cache",), False), (("cache", "retry"), True), (("json", "yaml", "csv"), False))
+
+
+def measure(func, repeat, setup=None):
+    """Run func repeat times (calling setup untimed before each run); returns stats."""
+    timings = []
+    for _ in range(repeat):
+        argument = setup() if setup else None
+        started = time.perf_counter()
+        func(argument) if setup else func()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {
+        "runs": len(timings),
+        "min": timings[0],
+        "median": statistics.median(timings),
+        "p95": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "mean": statistics.fmean(timings),
+    }
+
+
+class Bench:
+    def __init__(self, size, seed, repeat, workdir):
+        from store import SnippetStore
+        self.size = size
+        self.seed = seed
+        self.repeat = repeat
+        self.workdir = workdir
+        self.db_path = os.path.join(workdir, "bench.db")
+        self.store = SnippetStore(self.db_path)
+        started = time.perf_counter()
+        corpus.populate(self.store, size, seed)
+        self.populate_seconds = time.perf_counter() - started
+        self.results = {}
+
+    def record(self, name, stats, **extra):
+        stats.update(extra)
+        self.results[name] = stats
+        print(f"{name:<32} median {stats['median'] * 1000:10.2f} ms   p95 {stats['p95'] * 1000:10.2f} ms",
+              file=sys.stderr)
+
+    def skip(self, name, reason):
+        self.results[name] = {"skipped": reason}
+        print(f"{name:<32} skipped: {reason}", file=sys.stderr)
+
+    # Store scenarios, mirroring load_snippets, on_list_scroll and save_snippet
+
+    def list_first_page(self):
+        self.record("list.first_page", measure(
+            lambda: self.store.page(self.store.list_query(""), limit=PAGE_SIZE), self.repeat
+        ))
+
+    def list_scroll(self):
+        def scroll():
+            query = self.store.list_query("")
+            rows, has_more = self.store.page(query, limit=PAGE_SIZE)
+            for _ in range(20):
+                if not has_more:
+                    break
+                rows, has_more = self.store.page(query, after=rows[-1][8:11], limit=PAGE_SIZE)
+        self.record("list.scroll_20_pages", measure(scroll, self.repeat))
+
+    def list_refresh_row(self):
+        query = self.store.list_query("")
+        ids = [row[0] for row in self.store.page(query, limit=PAGE_SIZE)[0]]
+        cycle = itertools.cycle(ids)
+        self.record("list.refresh_row", measure(lambda: self.store.list_row(query, next(cycle)), self.repeat * 10))
+
+    def search(self):
+        for text in SEARCH_QUERIES:
+            self.record(f"search.{text.replace(' ', '_')}", measure(
+                lambda: self.store.page(self.store.list_query(text), limit=PAGE_SIZE), self.repeat
+            ))
+
+    def tag_filter(self):
+        for tags, match_all in TAG_FILTERS:
+            name = ("all." if match_all else "any.") + "+".join(tags)
+            self.record(f"tags.{name}", measure(
+                lambda: self.store.page(self.store.list_query("", tags, match_all), limit=PAGE_SIZE), self.repeat
+            ))
+        self.record("tags.facet_counts", measure(self.store.tag_counts, self.repeat))
+
+    def save(self):
+        counter = itertools.count()
+        snippets = corpus.generate(self.repeat * 20, self.seed + 1)
+
+        def save_one():
+            snippet = next(snippets)
+            self.store.save(None, snippet["title"], snippet["code"] + f"\n# {next(counter)}",
+                            snippet["language"], snippet["tags"], snippet["description"])
+        self.record("save.insert", measure(save_one, self.repeat * 20))
+
+    # Transfers
+
+    def transfer(self):
+        import transfer
+        from store import SnippetStore
+        counter = itertools.count()
+        for suffix in (".json", ".jsonl.gz"):
+            path = os.path.join(self.workdir, "export" + suffix)
+            self.record(f"export{suffix}", measure(
+                lambda: transfer.export_snippets(self.store, path), max(1, self.repeat // 5)
+            ), bytes=os.path.getsize(path) if os.path.exists(path) else None)
+
+            def fresh_store():
+                # Every run imports into a new, empty database
+                target = os.path.join(self.workdir, f"import{suffix}-{next(counter)}.db")
+                return SnippetStore(target)
+
+            def import_into(store):
+                try:
+                    transfer.import_snippets(store, path)
+                finally:
+                    store.close()
+            self.record(f"import{suffix}", measure(import_into, max(1, self.repeat // 5), setup=fresh_store))
+
+    # Detection and highlighting (no widgets)
+
+    def guess_language(self):
+        import langdetect
+        samples = [snippet["code"] for snippet in corpus.generate(200, self.seed + 2)]
+        self.record("langdetect.detect_uncached_200", measure(
+            lambda: [langdetect.detect_uncached(code) for code in samples], max(1, self.repeat // 5)
+        ))
+
+    def highlight(self):
+        from pygments.lexers import get_lexer_by_name
+        from highlighter import lex_full, lex_incremental
+        lexer = get_lexer_by_name("python")
+        code = "\n".join(snippet["code"] for snippet in corpus.generate(400, self.seed + 3)
+                         if snippet["language"] == "Python")
+        result = lex_full(lexer, code)
+        middle = len(code) // 2
+        edited = code[:middle] + "x" + code[middle:]
+        self.record("highlight.lex_full", measure(lambda: lex_full(lexer, code), self.repeat), chars=len(code))
+        self.record("highlight.lex_incremental", measure(
+            lambda: lex_incremental(lexer, code, result, edited), self.repeat
+        ))
+
+    # Tk scenarios
+
+    def tk(self):
+        import tkinter as tk
+        from tkinter import ttk
+        try:
+            root = tk.Tk()
+        except tk.TclError as e:
+            for name in ("tk.tree_insert_page", "tk.preview_highlight"):
+                self.skip(name, f"no display ({e})")
+            return
+        root.withdraw()
+        try:
+            from highlighter import TextHighlighter
+            tree = ttk.Treeview(root, columns=("ID", "Title", "Language", "Tags", "Modified", "Favorite", "Size", "Match"),
+                                show="headings")
+            rows = self.store.page(self.store.list_query(""), limit=PAGE_SIZE)[0]
+
+            def insert_page():
+                tree.delete(*tree.get_children())
+                for row in rows:
+                    tree.insert("", tk.END, iid=str(row[0]), values=row[:8])
+                root.update_idletasks()
+            self.record("tk.tree_insert_page", measure(insert_page, self.repeat))
+
+            text = tk.Text(root)
+            highlighter = TextHighlighter(text)
+            code = next(s["code"] for s in corpus.generate(50, self.seed + 4) if s["language"] == "Python")
+
+            def highlight():
+                highlighter.reset()
+                text.delete("1.0", tk.END)
+                text.insert("1.0", code)
+                highlighter.highlight("Python")
+                root.update_idletasks()
+            self.record("tk.preview_highlight", measure(highlight, self.repeat))
+        finally:
+            root.destroy()
+
+    def run(self, scenarios):
+        for scenario in scenarios:
+            getattr(self, scenario)()
+        self.store.close()
+
+
+SCENARIOS = (
+    "list_first_page", "list_scroll", "list_refresh_row", "search", "tag_filter", "save",
+    "transfer", "guess_language", "highlight", "tk",
+)
+
+
+def compare(results, baseline, threshold):
+    """[(name, baseline median, current median, ratio)] of scenarios that regressed."""
+    regressions = []
+    for name, stats in results.items():
+        before = baseline.get("results", {}).get(name)
+        if not before or "median" not in before or "median" not in stats:
+            continue
+        if stats["median"] - before["median"] > NOISE_FLOOR and stats["median"] > before["median"] * (1 + threshold):
+            regressions.append((name, before["median"], stats["median"], stats["median"] / before["median"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the snippet manager benchmarks.")
+    parser.add_argument("--size", type=int, default=10000, help="corpus size (1k to 1M)")
+    parser.add_argument("--seed", type=int, default=corpus.DEFAULT_SEED)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--only", nargs="+", choices=SCENARIOS, help="run just these scenarios")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="compare against results saved earlier")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown of the median before it counts as a regression")
+    parser.add_argument("--save-baseline", help="write these results as the new baseline")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="snippet-bench-") as workdir:
+        print(f"Generating {args.size} snippets...", file=sys.stderr)
+        bench = Bench(args.size, args.seed, args.repeat, workdir)
+        bench.run(args.only or SCENARIOS)
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "size": args.size,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "populate_seconds": bench.populate_seconds,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+        },
+        "results": bench.results,
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as file:
+                json.dump(report, file, indent=2)
+    if not args.baseline:
+        return 0
+    with open(args.baseline, encoding="utf-8") as file:
+        baseline = json.load(file)
+    if baseline.get("meta", {}).get("size") != args.size:
+        print(f"warning: baseline was run with {baseline.get('meta', {}).get('size')} snippets", file=sys.stderr)
+    regressions = compare(bench.results, baseline, args.threshold)
+    for name, before, after, ratio in regressions:
+        print(f"REGRESSION {name}: {before * 1000:.2f} ms -> {after * 1000:.2f} ms ({ratio:.2f}x)", file=sys.stderr)
+    if not regressions:
+        print("No regressions against the baseline", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,329 @@
+"""Pygments-based syntax highlighting for Tk Text widgets.
+
+Tokens are mapped straight onto Text tags. Lexing results are kept in an LRU
+cache keyed by (content hash, lexer name), and edits re-lex only from the last
+line whose lexer state is known up to the first line where the state matches
+the previous run again. Once the editor is idle, a full lex runs in slices
+and corrects the few lines that re-lexing from the edit can't get right.
+"""
+import hashlib
+import itertools
+from collections import OrderedDict
+
+from pygments.lexer import RegexLexer
+from pygments.lexers import find_lexer_class, get_lexer_by_name
+from pygments.styles import get_style_by_name
+from pygments.token import Error, Token, Whitespace, _TokenType
+
+# Documents longer than this only get tags on the visible lines (plus a margin)
+VIEWPORT_THRESHOLD = 2000
+VIEWPORT_MARGIN = 50
+# The full lex that checks incremental results starts after this pause in
+# highlight() calls and lexes this many lines per idle callback
+VERIFY_DELAY_MS = 500
+VERIFY_SLICE_LINES = 200
+
+
+def _regex_tokens(lexer, text, pos, stack):
+    # Same algorithm as RegexLexer.get_tokens_unprocessed, but it can start at any
+    # offset and reports the state stack for tokens that begin a line, which is
+    # what lets a later run resume there.
+    tokendefs = lexer._tokens
+    statestack = list(stack)
+    statetokens = tokendefs[statestack[-1]]
+    while True:
+        for rexmatch, action, new_state in statetokens:
+            m = rexmatch(text, pos)
+            if m:
+                state = tuple(statestack) if pos == 0 or text[pos - 1] == '\n' else None
+                if action is not None:
+                    if type(action) is _TokenType:
+                        yield pos, action, m.group(), state
+                    else:
+                        for index, ttype, value in action(lexer, m):
+                            yield index, ttype, value, state if index == pos else None
+                pos = m.end()
+                if new_state is not None:
+                    if isinstance(new_state, tuple):
+                        for name in new_state:
+                            if name == '#pop':
+                                if len(statestack) > 1:
+                                    statestack.pop()
+                            elif name == '#push':
+                                statestack.append(statestack[-1])
+                            else:
+                                statestack.append(name)
+                    elif isinstance(new_state, int):
+                        if abs(new_state) >= len(statestack):
+                            del statestack[1:]
+                        else:
+                            del statestack[new_state:]
+                    elif new_state == '#push':
+                        statestack.append(statestack[-1])
+                    statetokens = tokendefs[statestack[-1]]
+                break
+        else:
+            if pos >= len(text):
+                break
+            state = tuple(statestack) if pos == 0 or text[pos - 1] == '\n' else None
+            if text[pos] == '\n':
+                statestack = ['root']
+                statetokens = tokendefs['root']
+                yield pos, Whitespace, '\n', state
+            else:
+                yield pos, Error, text[pos], state
+            pos += 1
+
+
+def _is_resumable(lexer):
+    return isinstance(lexer, RegexLexer) and \
+        type(lexer).get_tokens_unprocessed is RegexLexer.get_tokens_unprocessed
+
+
+def iter_lines(lexer, text, offset=0, stack=('root',)):
+    """Yield (start_state, [(start_col, end_col, ttype), ...]) for each line.
+
+    start_state is the lexer state stack at the start of the line, or None when
+    the line starts inside a token (or the lexer can't be resumed).
+    """
+    if _is_resumable(lexer):
+        tokens = _regex_tokens(lexer, text, offset, stack)
+    else:
+        tokens = ((pos, ttype, value, None) for pos, ttype, value in lexer.get_tokens_unprocessed(text))
+    line_start = offset
+    line_state = None
+    segments = []
+    for pos, ttype, value, state in tokens:
+        if not value:
+            continue
+        if pos == line_start and state is not None:
+            line_state = state
+        col = pos - line_start
+        for piece_index, piece in enumerate(value.split('\n')):
+            if piece_index:
+                yield line_state, segments
+                line_start += col + 1
+                col = 0
+                line_state = None
+                segments = []
+            if piece:
+                segments.append((col, col + len(piece), ttype))
+                col += len(piece)
+    yield line_state, segments
+
+
+class LexResult:
+    __slots__ = ("states", "lines")
+
+    def __init__(self, states, lines):
+        self.states = states
+        self.lines = lines
+
+
+class HighlightCache:
+    """Small LRU of LexResults keyed by (content hash, lexer name)."""
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        result = self.entries.get(key)
+        if result is not None:
+            self.entries.move_to_end(key)
+        return result
+
+    def put(self, key, result):
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+def lex_full(lexer, text):
+    states, lines = [], []
+    for state, segments in iter_lines(lexer, text):
+        states.append(state)
+        lines.append(segments)
+    return LexResult(states, lines)
+
+
+def lex_incremental(lexer, old_text, old, text):
+    """Re-lex text given the LexResult for old_text.
+
+    Returns (result, first, last, old_end): lines [first, last) of the new text
+    were re-lexed and replace lines [first, old_end) of the old result.
+
+    Lines before first keep their old tokens. That is wrong only when the
+    edit completes a construct that a single token regex spans across lines
+    and that was left open above it, e.g. */ typed below an unterminated /*
+    in JavaScript; a full lex of the new text then differs above the edit.
+    """
+    old_lines = old_text.split('\n')
+    new_lines = text.split('\n')
+    limit = min(len(old_lines), len(new_lines))
+    prefix = 0
+    while prefix < limit and old_lines[prefix] == new_lines[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old_lines[-1 - suffix] == new_lines[-1 - suffix]:
+        suffix += 1
+    # Also re-lex the line before the edit: lookaheads can reach across a newline
+    restart = max(min(prefix, len(old.states)) - 1, 0)
+    while restart > 0 and old.states[restart] is None:
+        restart -= 1
+    if old.states[restart] is None or not _is_resumable(lexer):
+        result = lex_full(lexer, text)
+        return result, 0, len(result.lines), len(old.lines)
+
+    shift = len(new_lines) - len(old_lines)
+    suffix_start = len(new_lines) - suffix
+    offset = sum(len(line) + 1 for line in new_lines[:restart])
+    states = old.states[:restart]
+    lines = old.lines[:restart]
+    for index, (state, segments) in enumerate(
+            iter_lines(lexer, text, offset, old.states[restart]), restart):
+        # Once an unchanged line starts in the same state as before, the rest of
+        # the document lexes exactly as it did last time
+        if index >= suffix_start and state is not None and state == old.states[index - shift]:
+            states.extend(old.states[index - shift:])
+            lines.extend(old.lines[index - shift:])
+            return LexResult(states, lines), restart, index, index - shift
+        states.append(state)
+        lines.append(segments)
+    return LexResult(states, lines), restart, len(lines), len(old.lines)
+
+
+class TextHighlighter:
+    """Keeps a Text widget's Pygments tags in sync with its contents."""
+
+    def __init__(self, widget, style="monokai", cache=None):
+        self.widget = widget
+        self.style = get_style_by_name(style)
+        self.cache = cache or HighlightCache()
+        self.lexers = {}
+        self.configured_tags = set()
+        self.verify_id = None
+        self.reset()
+        foreground = self._color(self.style.style_for_token(Token)) or "#f8f8f2"
+        widget.configure(background=self.style.background_color, foreground=foreground,
+                         insertbackground=foreground)
+
+    @staticmethod
+    def _color(style):
+        return f"#{style['color']}" if style and style.get('color') else None
+
+    def reset(self):
+        # Call after the widget's text was replaced wholesale (tags went with it)
+        self.cancel_verify()
+        self.text = None
+        self.lexer_name = None
+        self.result = None
+        self.tagged = bytearray()
+
+    def get_lexer(self, language):
+        if language not in self.lexers:
+            lexer = None
+            if language:
+                try:
+                    cls = find_lexer_class(language)
+                    lexer = cls() if cls else get_lexer_by_name(language.lower())
+                except Exception:
+                    lexer = None
+            self.lexers[language] = lexer
+        return self.lexers[language]
+
+    def highlight(self, language):
+        self.cancel_verify()
+        text = self.widget.get("1.0", "end-1c")
+        lexer = self.get_lexer(language)
+        if lexer is None:
+            self.clear_tags(1, self.widget.index("end").split('.')[0])
+            self.reset()
+            return
+        key = (hashlib.sha1(text.encode('utf-8', 'surrogatepass')).hexdigest(), lexer.name)
+        result = self.cache.get(key)
+        if result is None and self.result is not None and self.lexer_name == lexer.name:
+            result, first, last, old_end = lex_incremental(lexer, self.text, self.result, text)
+            self.tagged = self.tagged[:first] + bytearray(last - first) + self.tagged[old_end:]
+            self.clear_tags(first + 1, last + 1)
+            self.verify_id = self.widget.after(VERIFY_DELAY_MS, self._verify, key, iter_lines(lexer, text), [], [])
+        else:
+            if result is None:
+                result = lex_full(lexer, text)
+            self.clear_tags(1, len(result.lines) + 1)
+            self.tagged = bytearray(len(result.lines))
+        self.cache.put(key, result)
+        self.text, self.lexer_name, self.result = text, lexer.name, result
+        self.tag_visible()
+
+    def cancel_verify(self):
+        if self.verify_id is not None:
+            self.widget.after_cancel(self.verify_id)
+            self.verify_id = None
+
+    def _verify(self, key, pending, states, lines):
+        # Full lex of self.text, a slice per idle callback so typing stays responsive
+        count = len(lines)
+        for state, segments in itertools.islice(pending, VERIFY_SLICE_LINES):
+            states.append(state)
+            lines.append(segments)
+        if len(lines) - count == VERIFY_SLICE_LINES:
+            self.verify_id = self.widget.after_idle(self._verify, key, pending, states, lines)
+            return
+        self.verify_id = None
+        # Edited since, but not highlighted yet: that highlight() checks again
+        if self.widget.get("1.0", "end-1c") != self.text:
+            return
+        result = LexResult(states, lines)
+        self.cache.put(key, result)
+        old, self.result = self.result.lines, result
+        first, end = 0, len(lines)
+        while first < end and old[first] == lines[first]:
+            first += 1
+        while end > first and old[end - 1] == lines[end - 1]:
+            end -= 1
+        if first < end:
+            self.tagged[first:end] = bytearray(end - first)
+            self.clear_tags(first + 1, end + 1)
+            self.tag_visible()
+
+    def tag_visible(self):
+        if self.result is None:
+            return
+        total = len(self.result.lines)
+        if total <= VIEWPORT_THRESHOLD:
+            self.tag_lines(0, total)
+            return
+        first = int(self.widget.index("@0,0").split('.')[0]) - 1
+        last = int(self.widget.index(f"@0,{self.widget.winfo_height()}").split('.')[0])
+        self.tag_lines(max(first - VIEWPORT_MARGIN, 0), min(last + VIEWPORT_MARGIN, total))
+
+    def tag_lines(self, start, end):
+        ranges = {}
+        for index in range(start, end):
+            if self.tagged[index]:
+                continue
+            self.tagged[index] = 1
+            line = index + 1
+            for col_start, col_end, ttype in self.result.lines[index]:
+                ranges.setdefault(ttype, []).extend((f"{line}.{col_start}", f"{line}.{col_end}"))
+        for ttype, indices in ranges.items():
+            tag = self._tag_for(ttype)
+            if tag:
+                self.widget.tag_add(tag, *indices)
+
+    def clear_tags(self, first_line, last_line):
+        for tag in self.configured_tags:
+            self.widget.tag_remove(tag, f"{first_line}.0", f"{last_line}.0")
+
+    def _tag_for(self, ttype):
+        style = self.style.style_for_token(ttype)
+        color = self._color(style)
+        if not color:
+            return None
+        tag = f"pyg:{color}"
+        if tag not in self.configured_tags:
+            self.widget.tag_configure(tag, foreground=color)
+            self.configured_tags.add(tag)
+        return tag
@@ -0,0 +1,301 @@
+"""Harvest snippets from source trees on disk.
+
+The tree is walked in the calling process, skipping ignored names and files
+over the size limit; files whose size and mtime match the previous run are
+not even opened. The remaining files are read, hashed, language-detected and
+optionally split into function- and class-level snippets in a process pool,
+and the results are written through SnippetStore.upsert_many in large
+transactions. Each file is recorded in ingest_files in the same transaction
+as its snippets, so an interrupted or cancelled run resumes where it stopped,
+and the snippets it produced in ingest_snippets, so that when it changes the
+snippets it no longer produces are deleted.
+"""
+import fnmatch
+import hashlib
+import os
+from functools import partial
+
+import schema
+from langdetect import detect_from_hints, detect_uncached
+from similarity import bounded_map, spawn_pool
+from store import MAX_PARAMS
+from transfer import TransferCancelled
+
+# Matched against both the entry name and its path relative to the root
+DEFAULT_IGNORE = (
+    ".*", "node_modules", "__pycache__", "venv", "env", "build", "dist", "target", "vendor",
+    "*.min.js", "*.min.css", "*_pb2.py", "*.pb.go", "*.generated.*",
+)
+DEFAULT_EXTENSIONS = (
+    ".py", ".pyw", ".js", ".mjs", ".cjs", ".ts", ".tsx", ".java", ".kt", ".swift", ".c", ".h",
+    ".cpp", ".cc", ".cxx", ".hpp", ".cs", ".go", ".rs", ".rb", ".php", ".pl", ".lua", ".r",
+    ".sh", ".bash", ".zsh", ".ps1", ".sql",
+)
+MAX_FILE_SIZE = 256 * 1024
+# Files per worker task, and rows per write transaction
+FILES_PER_TASK = 64
+BATCH_SIZE = 5000
+# Keywords that introduce a definition in lexers that don't tag the defined
+# name as Name.Function or Name.Class
+DEFINITION_KEYWORDS = {
+    "def", "class", "function", "func", "fn", "sub", "struct", "interface", "trait",
+    "impl", "enum", "module", "type", "proc", "object",
+}
+# Only the first block is checked for NUL bytes to tell binary files apart
+BINARY_SNIFF_BYTES = 8192
+
+
+def is_ignored(name, relpath, patterns):
+    return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relpath, pattern) for pattern in patterns)
+
+
+def walk(root, ignore=DEFAULT_IGNORE, extensions=DEFAULT_EXTENSIONS, max_size=MAX_FILE_SIZE):
+    """Yield (path, mtime_ns, size) for every file under root worth ingesting.
+    extensions=None accepts any extension."""
+    root = os.path.abspath(root)
+    directories = [root]
+    while directories:
+        directory = directories.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            relpath = os.path.relpath(entry.path, root).replace(os.sep, "/")
+            if is_ignored(entry.name, relpath, ignore):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+                elif entry.is_file(follow_symlinks=False) and (
+                        extensions is None or entry.name.lower().endswith(tuple(extensions))):
+                    stat = entry.stat(follow_symlinks=False)
+                    if stat.st_size <= max_size:
+                        yield entry.path, stat.st_mtime_ns, stat.st_size
+            except OSError:
+                continue
+
+
+def _token_lines(code, lexer):
+    # Non-blank tokens per line as (column, ttype, text, continued), where
+    # continued marks a token (say a docstring) that began on an earlier line
+    lines = [[]]
+    column = 0
+    for ttype, value in lexer.get_tokens(code):
+        for index, part in enumerate(value.split("\n")):
+            if index:
+                lines.append([])
+                column = 0
+            if part.strip():
+                lines[-1].append((column + len(part) - len(part.lstrip()), ttype, part.strip(), index > 0))
+            column += len(part)
+    return lines
+
+
+def split_definitions(code, language):
+    """[(name, line, code)] of the top-level functions and classes in code, with
+    their leading comments and decorators; [] when none are found."""
+    from pygments.lexers import find_lexer_class
+    from pygments.token import Comment, Keyword, Name, Operator, Punctuation
+    cls = find_lexer_class(language)
+    if cls is None:
+        return []
+    lines = _token_lines(code, cls(stripnl=False))
+    source = code.split("\n")
+
+    def definition(tokens):
+        # A keyword at column 0 (def, class, fn, func, public, int, ...) followed
+        # by a function or class name on the same line
+        if not tokens or tokens[0][0] != 0 or tokens[0][1] not in Keyword or tokens[0][3]:
+            return None
+        names = [(index, text) for index, (_, ttype, text, _) in enumerate(tokens) if ttype in Name]
+        for index, text in names:
+            if tokens[index][1] in Name.Function or tokens[index][1] in Name.Class:
+                return text
+        if not names or not any(ttype in Keyword and text in DEFINITION_KEYWORDS for _, ttype, text, _ in tokens):
+            return None
+        # Prefer the name being called, so Go methods are named after the method, not the receiver
+        called = [text for index, text in names if index + 1 < len(tokens) and tokens[index + 1][2].startswith("(")]
+        return called[0] if called else names[0][1]
+
+    def leading(tokens):
+        # Comments and decorators directly above a definition belong to it
+        return bool(tokens) and tokens[0][0] == 0 and (
+            all(ttype in Comment for _, ttype, _, _ in tokens) or tokens[0][1] in Name.Decorator)
+
+    def continues(tokens):
+        # Blank or indented lines, closing brackets and Ruby/Lua "end" stay in the definition
+        if not tokens or tokens[0][0] > 0 or tokens[0][3]:
+            return True
+        _, ttype, text, _ = tokens[0]
+        return (ttype in Punctuation or ttype in Operator) and text[0] in ")]};{" or (
+            ttype in Keyword and text == "end")
+
+    pieces = []
+    end = 0
+    for number, tokens in enumerate(lines):
+        name = definition(tokens)
+        if name is None or number < end:
+            continue
+        start = number
+        while start > end and leading(lines[start - 1]):
+            start -= 1
+        end = number + 1
+        while end < len(lines) and definition(lines[end]) is None and continues(lines[end]):
+            end += 1
+        text = "\n".join(source[start:end]).rstrip()
+        if text:
+            pieces.append((name, start + 1, text))
+    return pieces
+
+
+def process_files(tasks, tags="", split=True):
+    """Read, hash, detect and split files for ingest_tree; runs in worker processes.
+
+    tasks are (path, relpath, mtime_ns, size, known_hash). Returns
+    (path, mtime_ns, size, file_hash, snippets) per file, with file_hash None
+    when the file couldn't be read and snippets None when its content matches
+    known_hash.
+    """
+    results = []
+    for path, relpath, mtime_ns, size, known_hash in tasks:
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+        except OSError:
+            results.append((path, mtime_ns, size, None, []))
+            continue
+        file_hash = hashlib.sha256(data).hexdigest()
+        if file_hash == known_hash:
+            results.append((path, mtime_ns, size, file_hash, None))
+            continue
+        try:
+            code = data.decode("utf-8-sig") if b"\0" not in data[:BINARY_SNIFF_BYTES] else ""
+        except UnicodeDecodeError:
+            code = ""
+        snippets = []
+        if code.strip():
+            language = detect_from_hints(code, path) or detect_uncached(code)
+            pieces = split_definitions(code, language) if split else []
+            for name, line, text in pieces or [(None, 1, code.strip("\n"))]:
+                snippets.append({
+                    "title": f"{name} ({relpath})" if name else relpath,
+                    "code": text,
+                    "language": language,
+                    "tags": tags,
+                    "description": f"{relpath}:{line}",
+                })
+        results.append((path, mtime_ns, size, file_hash, snippets))
+    return results
+
+
+def _replace_file_snippets(conn, produced, known):
+    """Link each file in produced to its snippets and delete the snippets that
+    files ingested before (those in known) no longer produce; returns how many
+    were deleted. Snippets another file still produces are kept."""
+    hashes = list({content_hash for _, file_hashes in produced for content_hash in file_hashes})
+    ids = {}
+    for start in range(0, len(hashes), MAX_PARAMS):
+        chunk = hashes[start:start + MAX_PARAMS]
+        ids.update(conn.execute(
+            f"SELECT content_hash, id FROM snippets WHERE content_hash IN ({', '.join('?' * len(chunk))})", chunk
+        ))
+    links, dropped = [], set()
+    for path, file_hashes in produced:
+        current = {ids[content_hash] for content_hash in file_hashes}
+        if path in known:
+            previous = conn.execute("SELECT snippet_id FROM ingest_snippets WHERE path=?", (path,))
+            dropped.update(snippet_id for (snippet_id,) in previous if snippet_id not in current)
+            conn.execute("DELETE FROM ingest_snippets WHERE path=?", (path,))
+        links.extend((path, snippet_id) for snippet_id in current)
+    conn.executemany("INSERT OR IGNORE INTO ingest_snippets(path, snippet_id) VALUES (?, ?)", links)
+    removed = [
+        (snippet_id,) for snippet_id in dropped
+        if conn.execute("SELECT 1 FROM ingest_snippets WHERE snippet_id=?", (snippet_id,)).fetchone() is None
+    ]
+    conn.executemany("DELETE FROM snippets WHERE id=?", removed)
+    return len(removed)
+
+
+def ingest_tree(store, root, tags="", split=True, ignore=DEFAULT_IGNORE, extensions=DEFAULT_EXTENSIONS,
+                max_size=MAX_FILE_SIZE, workers=None, progress=None, cancel=None):
+    """Add snippets from every file under root; see the module docstring.
+
+    Returns a dict of counts: files seen, unchanged files, files that failed
+    to read, the inserted/updated/skipped snippet counts of upsert_many, and
+    the snippets removed because their changed file no longer produces them.
+    """
+    root = os.path.abspath(root)
+    prefix = root.rstrip(os.sep) + os.sep
+    known = {
+        path: (mtime_ns, size, file_hash)
+        for path, mtime_ns, size, file_hash in store.conn.execute(
+            "SELECT path, mtime_ns, size, file_hash FROM ingest_files WHERE path >= ? AND path < ?",
+            (prefix, prefix + "\U0010ffff")
+        )
+    }
+    counts = {"files": 0, "unchanged": 0, "failed": 0, "inserted": 0, "updated": 0, "skipped": 0, "removed": 0}
+    tasks = []
+    for path, mtime_ns, size in walk(root, ignore, extensions, max_size):
+        counts["files"] += 1
+        previous = known.get(path)
+        if previous is not None and previous[:2] == (mtime_ns, size):
+            counts["unchanged"] += 1
+        else:
+            relpath = os.path.relpath(path, root).replace(os.sep, "/")
+            tasks.append((path, relpath, mtime_ns, size, previous[2] if previous else None))
+    batches = [tasks[start:start + FILES_PER_TASK] for start in range(0, len(tasks), FILES_PER_TASK)]
+    job = partial(process_files, tags=tags, split=split)
+    pool = None
+    if len(batches) > 1:
+        pool = spawn_pool(workers)
+        results = bounded_map(pool, job, batches, workers)
+    else:
+        results = map(job, batches)
+    # produced: (path, content hashes of its snippets) per file read this run
+    snippets, files, produced = [], [], []
+
+    def flush():
+        # Snippets and the files they came from commit together, which is what makes reruns resume
+        if snippets:
+            for key, value in store.upsert_many(snippets, "merge", commit=False).items():
+                counts[key] += value
+        counts["removed"] += _replace_file_snippets(store.conn, produced, known)
+        store.conn.executemany(
+            "INSERT OR REPLACE INTO ingest_files(path, mtime_ns, size, file_hash) VALUES (?, ?, ?, ?)", files
+        )
+        store.commit()
+        snippets.clear()
+        files.clear()
+        produced.clear()
+
+    done = 0
+    try:
+        for processed in results:
+            for path, mtime_ns, size, file_hash, file_snippets in processed:
+                if file_hash is None:
+                    counts["failed"] += 1
+                    continue
+                if file_snippets is None:
+                    counts["unchanged"] += 1
+                else:
+                    snippets.extend(file_snippets)
+                    produced.append((path, [
+                        schema.snippet_hash(snippet["code"], snippet["language"]) for snippet in file_snippets
+                    ]))
+                files.append((path, mtime_ns, size, file_hash))
+            done += len(processed)
+            if len(snippets) >= BATCH_SIZE or len(files) >= BATCH_SIZE:
+                flush()
+            if cancel is not None and cancel.is_set():
+                raise TransferCancelled()
+            if progress:
+                progress(done, len(tasks))
+        flush()
+    except BaseException:
+        store.conn.rollback()
+        raise
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    return counts
@@ -0,0 +1,218 @@
+"""Latency instrumentation for the GUI.
+
+Metrics keeps a rolling window of timings per operation and reports
+p50/p95/p99 over it. Operations are timed with Metrics.timed (a context
+manager and decorator). Tk callbacks of the app's root are timed by
+install_tk_hooks, SQL statements by the connection class from
+Metrics.connection_factory, and StallMonitor records main-loop stalls from a
+root.after heartbeat.
+"""
+import functools
+import sqlite3
+import threading
+import time
+import tkinter
+from collections import deque
+from datetime import datetime
+
+WINDOW_SIZE = 1000
+SLOW_QUERY_MS = 20
+SLOW_QUERIES_KEPT = 200
+HEARTBEAT_MS = 100
+STALL_THRESHOLD_MS = 200
+STALLS_KEPT = 100
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class LatencyWindow:
+    """The last WINDOW_SIZE timings of one operation, in seconds."""
+
+    def __init__(self, size=WINDOW_SIZE):
+        self.samples = deque(maxlen=size)
+        self.total = 0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.total += 1
+
+    def summary(self):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return None
+        return {
+            "count": self.total,
+            "window": len(ordered),
+            "p50_ms": percentile(ordered, 0.50) * 1000,
+            "p95_ms": percentile(ordered, 0.95) * 1000,
+            "p99_ms": percentile(ordered, 0.99) * 1000,
+            "max_ms": ordered[-1] * 1000,
+        }
+
+
+class Metrics:
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS):
+        self.slow_query_ms = slow_query_ms
+        self.windows = {}
+        self.slow_queries = deque(maxlen=SLOW_QUERIES_KEPT)
+        self.stalls = deque(maxlen=STALLS_KEPT)
+        self.lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self.lock:
+            window = self.windows.get(name)
+            if window is None:
+                window = self.windows[name] = LatencyWindow()
+            window.add(seconds)
+
+    def timed(self, name):
+        """Time a block (``with metrics.timed("x"):``) or a function (``@metrics.timed("x")``)."""
+        return _Timer(self, name)
+
+    def record_query(self, sql, seconds):
+        # Statements are grouped by their first keyword so the histogram stays readable
+        self.record("sql." + (sql.split(None, 1)[0].upper() if sql.strip() else "?"), seconds)
+        if seconds * 1000 >= self.slow_query_ms:
+            entry = (seconds, datetime.now().strftime("%H:%M:%S"), " ".join(sql.split()))
+            with self.lock:
+                self.slow_queries.append(entry)
+
+    def record_stall(self, seconds):
+        self.stalls.append((datetime.now().strftime("%H:%M:%S"), seconds))
+
+    def summaries(self):
+        """{name: summary}, slowest p95 first."""
+        with self.lock:
+            summaries = {name: window.summary() for name, window in self.windows.items()}
+        return dict(sorted(
+            ((name, summary) for name, summary in summaries.items() if summary),
+            key=lambda item: -item[1]["p95_ms"]
+        ))
+
+    def slowest_queries(self, limit=20):
+        # Worker threads' connections append while this sorts
+        with self.lock:
+            queries = list(self.slow_queries)
+        return sorted(queries, reverse=True)[:limit]
+
+    def snapshot(self):
+        """Everything as JSON-serializable data, for bug reports."""
+        return {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "operations": self.summaries(),
+            "slow_queries": [
+                {"ms": seconds * 1000, "at": at, "sql": sql} for seconds, at, sql in self.slowest_queries(100)
+            ],
+            "stalls": [{"at": at, "ms": seconds * 1000} for at, seconds in self.stalls],
+        }
+
+    def connection_factory(self):
+        """A sqlite3.Connection subclass that times execute and executemany."""
+        metrics = self
+
+        class TimedConnection(sqlite3.Connection):
+            def execute(self, sql, parameters=()):
+                started = time.perf_counter()
+                try:
+                    return super().execute(sql, parameters)
+                finally:
+                    metrics.record_query(sql, time.perf_counter() - started)
+
+            def executemany(self, sql, parameters):
+                started = time.perf_counter()
+                try:
+                    return super().executemany(sql, parameters)
+                finally:
+                    metrics.record_query(sql, time.perf_counter() - started)
+
+        return TimedConnection
+
+
+class _Timer:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.record(self.name, time.perf_counter() - self.started)
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Timer(self.metrics, self.name):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def callback_name(func):
+    # after() wraps its callback in a local "callit"; report the real target instead
+    code = getattr(func, "__code__", None)
+    if code is not None and code.co_name == "callit" and "func" in code.co_freevars:
+        func = func.__closure__[code.co_freevars.index("func")].cell_contents
+    return getattr(func, "__qualname__", None) or type(func).__name__
+
+
+def install_tk_hooks(metrics, root):
+    """Time the Tk callbacks (commands, bindings, after) that widgets of root
+    register from now on; other Tk interpreters in the process are left
+    alone. Returns a function that restores the original wrapper, to call
+    when the app closes."""
+    original = tkinter.CallWrapper
+
+    class TimedCallWrapper(original):
+        def __init__(self, func, subst, widget):
+            super().__init__(func, subst, widget)
+            owner = getattr(widget, "_root", None)
+            # tkinter.CallWrapper is process-wide; only this app's callbacks get a name
+            self.name = "tk." + callback_name(func) if owner is not None and owner() is root else None
+
+        def __call__(self, *args):
+            if self.name is None:
+                return super().__call__(*args)
+            started = time.perf_counter()
+            try:
+                return super().__call__(*args)
+            finally:
+                metrics.record(self.name, time.perf_counter() - started)
+
+    tkinter.CallWrapper = TimedCallWrapper
+
+    def uninstall():
+        if tkinter.CallWrapper is TimedCallWrapper:
+            tkinter.CallWrapper = original
+    return uninstall
+
+
+class StallMonitor:
+    """Heartbeat on the Tk loop: a beat that fires late means the loop was blocked."""
+
+    def __init__(self, root, metrics, interval_ms=HEARTBEAT_MS, threshold_ms=STALL_THRESHOLD_MS):
+        self.root = root
+        self.metrics = metrics
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self.after_id = None
+        self.expected = None
+
+    def start(self):
+        self.expected = time.perf_counter() + self.interval
+        self.after_id = self.root.after(int(self.interval * 1000), self.beat)
+
+    def beat(self):
+        now = time.perf_counter()
+        lag = max(now - self.expected, 0.0)
+        self.metrics.record("loop.heartbeat_lag", lag)
+        if lag > self.threshold:
+            self.metrics.record_stall(lag)
+        self.start()
+
+    def stop(self):
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
@@ -0,0 +1,202 @@
+"""Language detection for snippets.
+
+A cheap first pass looks at shebangs, editor modelines, file-extension hints and
+keyword frequencies. Anything it can't decide confidently falls back to the
+Pygments analysers of a short list of lexers. Results are cached in the snippet
+database keyed by content hash, and detection can run on a worker thread.
+"""
+import hashlib
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import schema
+
+# Lexer names (as used by Pygments) for common aliases, interpreters and extensions
+ALIASES = {
+    "py": "Python", "python": "Python", "python3": "Python", "pyw": "Python",
+    "js": "JavaScript", "javascript": "JavaScript", "node": "JavaScript", "mjs": "JavaScript", "cjs": "JavaScript",
+    "ts": "TypeScript", "typescript": "TypeScript", "deno": "TypeScript", "tsx": "TypeScript",
+    "java": "Java", "kt": "Kotlin", "kotlin": "Kotlin", "swift": "Swift",
+    "c": "C", "h": "C", "cpp": "C++", "cc": "C++", "cxx": "C++", "hpp": "C++", "c++": "C++",
+    "cs": "C#", "csharp": "C#", "go": "Go", "golang": "Go", "rs": "Rust", "rust": "Rust",
+    "rb": "Ruby", "ruby": "Ruby", "php": "PHP", "pl": "Perl", "perl": "Perl", "lua": "Lua",
+    "r": "S", "rscript": "S", "sh": "Bash", "bash": "Bash", "zsh": "Bash", "ksh": "Bash",
+    "ps1": "PowerShell", "powershell": "PowerShell", "pwsh": "PowerShell",
+    "sql": "SQL", "html": "HTML", "htm": "HTML", "css": "CSS", "json": "JSON",
+    "yaml": "YAML", "yml": "YAML", "md": "Markdown", "markdown": "Markdown", "mk": "Makefile",
+    "make": "Makefile", "makefile": "Makefile",
+}
+
+# Languages the Pygments fallback is limited to unless configured otherwise
+DEFAULT_SHORTLIST = (
+    "Python", "JavaScript", "TypeScript", "Java", "C", "C++", "C#", "Go", "Rust", "Ruby",
+    "PHP", "Bash", "SQL", "HTML", "CSS", "JSON", "YAML",
+)
+
+# Weighted patterns that are characteristic of a language
+KEYWORDS = {
+    "Python": [(r"^\s*def \w+\(.*\):", 3), (r"^\s*(?:from [\w.]+ )?import \w+", 2), (r"\bself\.", 1),
+               (r"^\s*elif\b", 3), (r"\bNone\b", 1), (r"^\s*class \w+(?:\(.*\))?:", 3), (r":\s*$", 1)],
+    "JavaScript": [(r"\bfunction\s*\w*\(", 2), (r"\b(?:const|let)\s+\w+\s*=", 2), (r"=>", 1),
+                   (r"\bconsole\.log\(", 3), (r"\brequire\(", 2), (r"\bdocument\.", 2), (r"===", 2)],
+    "TypeScript": [(r"\binterface\s+\w+\s*\{", 3), (r":\s*(?:string|number|boolean|any)\b", 3),
+                   (r"\bexport\s+type\b", 3), (r"\bimplements\b", 1)],
+    "Java": [(r"\bpublic\s+(?:static\s+)?(?:final\s+)?class\b", 3), (r"\bSystem\.out\.print", 3),
+             (r"\bprivate\s+\w+(?:<.*>)?\s+\w+\s*[;=]", 2), (r"@Override\b", 3), (r"^\s*package\s+[\w.]+;", 3)],
+    "C": [(r"^\s*#include\s*<\w+\.h>", 3), (r"\bprintf\(", 2), (r"\bmalloc\(", 2), (r"\bint\s+main\s*\(", 2),
+          (r"->", 1)],
+    "C++": [(r"^\s*#include\s*<\w+>", 3), (r"\bstd::", 3), (r"\bcout\s*<<", 3), (r"\btemplate\s*<", 3),
+            (r"\bnamespace\s+\w+", 2)],
+    "C#": [(r"^\s*using\s+System", 3), (r"\bConsole\.Write", 3), (r"\bnamespace\s+[\w.]+", 1),
+           (r"\bpublic\s+(?:async\s+)?\w+\s+\w+\s*\(.*\)\s*$", 1), (r"\{\s*get;\s*set;\s*\}", 3)],
+    "Go": [(r"^\s*package\s+\w+\s*$", 3), (r"\bfunc\s+(?:\(\w+ \*?\w+\)\s*)?\w+\(", 3), (r":=", 2),
+           (r"\bfmt\.\w+\(", 3)],
+    "Rust": [(r"\bfn\s+\w+\s*(?:<.*>)?\(", 3), (r"\blet\s+mut\b", 3), (r"\bimpl\b", 2), (r"\w+!\(", 1),
+             (r"^\s*use\s+\w+::", 3)],
+    "Ruby": [(r"^\s*def\s+\w+[?!]?\s*$", 2), (r"^\s*end\s*$", 2), (r"\bputs\b", 2), (r"\battr_\w+\b", 3),
+             (r"\bdo\s*\|\w+\|", 3)],
+    "PHP": [(r"<\?php", 5), (r"\$\w+\s*=", 2), (r"\becho\b", 1), (r"->\w+\(", 1)],
+    "Bash": [(r"^\s*(?:if|while)\s+\[\[?", 3), (r"\bfi\s*$", 3), (r"\$\{?\w+\}?", 1), (r"^\s*echo\b", 1),
+             (r"^\s*export\s+\w+=", 3), (r"\bdone\s*$", 2)],
+    "SQL": [(r"(?i)\bselect\b.+\bfrom\b", 3), (r"(?i)\bcreate\s+table\b", 4), (r"(?i)\binsert\s+into\b", 4),
+            (r"(?i)\bwhere\b", 1), (r"(?i)\b(?:inner|left)\s+join\b", 3)],
+    "HTML": [(r"<!DOCTYPE html", 5), (r"</?(?:div|span|html|body|head|p|a)\b", 2)],
+    "CSS": [(r"^\s*[.#]?[\w-]+\s*\{", 1), (r"^\s*[\w-]+\s*:\s*[^;]+;\s*$", 2), (r"@media\b", 3)],
+    "JSON": [(r'^\s*[{\[]', 1), (r'^\s*"[^"]+"\s*:', 2)],
+    "YAML": [(r"^\s*[\w-]+:\s+\S", 1), (r"^\s*-\s+\w", 1), (r"^---\s*$", 3)],
+}
+KEYWORD_PATTERNS = {
+    language: [(re.compile(pattern, re.MULTILINE), weight) for pattern, weight in patterns]
+    for language, patterns in KEYWORDS.items()
+}
+
+# Cheap-pass scores below this, or not clearly ahead of the runner-up, go to Pygments
+MIN_KEYWORD_SCORE = 6
+KEYWORD_MARGIN = 1.5
+# Only this much of a snippet is scanned by the keyword pass and the analysers
+SAMPLE_CHARS = 20000
+
+SHEBANG_RE = re.compile(r"^#!\s*(?:/usr)?(?:/local)?/bin/(?:env\s+(?:-S\s+)?)?([\w.+-]+)")
+VIM_MODELINE_RE = re.compile(r"\bvim?:.*?\b(?:ft|filetype|syntax)=([\w+#-]+)")
+EMACS_MODELINE_RE = re.compile(r"-\*-\s*(?:.*?mode:\s*)?([\w+#-]+)\s*(?:;.*?)?-\*-", re.IGNORECASE)
+
+
+def content_hash(code):
+    return hashlib.sha1(code.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def detect_from_hints(code, filename=None):
+    """Shebang, modeline and file-extension hints; None when there are none."""
+    if filename:
+        name = os.path.basename(filename.strip()).lower()
+        ext = name.rsplit(".", 1)[-1] if "." in name else None
+        if name == "makefile" or ext in ALIASES:
+            return ALIASES[ext or name]
+    match = SHEBANG_RE.match(code)
+    if match:
+        interpreter = re.sub(r"[\d.]+$", "", match.group(1).lower()) or match.group(1).lower()
+        if interpreter in ALIASES:
+            return ALIASES[interpreter]
+    lines = code.splitlines()
+    for line in lines[:5] + lines[-5:]:
+        match = VIM_MODELINE_RE.search(line) or EMACS_MODELINE_RE.search(line)
+        if match and match.group(1).lower() in ALIASES:
+            return ALIASES[match.group(1).lower()]
+    return None
+
+
+def keyword_scores(code):
+    sample = code[:SAMPLE_CHARS]
+    scores = {}
+    for language, patterns in KEYWORD_PATTERNS.items():
+        score = sum(len(pattern.findall(sample)) * weight for pattern, weight in patterns)
+        if score:
+            scores[language] = score
+    return scores
+
+
+def detect_uncached(code, shortlist=DEFAULT_SHORTLIST):
+    """Keyword pass, then the Pygments analysers; no hints and no cache."""
+    scores = keyword_scores(code)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    if ranked and ranked[0][1] >= MIN_KEYWORD_SCORE and (
+            len(ranked) == 1 or ranked[0][1] >= ranked[1][1] * KEYWORD_MARGIN):
+        return ranked[0][0]
+    return guess_with_pygments(code, ranked[0][0] if ranked else "text", shortlist)
+
+
+def guess_with_pygments(code, default, shortlist=DEFAULT_SHORTLIST):
+    # Same idea as pygments.guess_lexer, but only over the shortlist
+    from pygments.lexers import find_lexer_class
+    sample = code[:SAMPLE_CHARS]
+    best, best_score = default, 0.0
+    for name in shortlist:
+        cls = find_lexer_class(name)
+        if cls is None:
+            continue
+        try:
+            score = cls.analyse_text(sample)
+        except Exception:
+            continue
+        if score == 1.0:
+            return name
+        if score > best_score:
+            best, best_score = name, score
+    return best
+
+
+class LanguageDetector:
+    """Detects snippet languages, caching results in the snippets database."""
+
+    def __init__(self, db_path, shortlist=DEFAULT_SHORTLIST):
+        self.db_path = db_path
+        self.shortlist = tuple(shortlist)
+        self.lock = threading.Lock()
+        self.conn = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="langdetect")
+
+    def _connection(self):
+        if self.conn is None:
+            self.conn = schema.connect(self.db_path, check_same_thread=False)
+            # A no-op once a SnippetStore has opened the database, which is the usual order
+            schema.migrate(self.conn)
+        return self.conn
+
+    def detect(self, code, filename=None):
+        language = detect_from_hints(code, filename)
+        if language:
+            return language
+        key = content_hash(code)
+        with self.lock:
+            row = self._connection().execute(
+                "SELECT language FROM language_cache WHERE content_hash=?", (key,)
+            ).fetchone()
+        if row:
+            return row[0]
+        language = self.detect_uncached(code)
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO language_cache VALUES (?, ?)", (key, language))
+            self.conn.commit()
+        return language
+
+    def detect_uncached(self, code):
+        return detect_uncached(code, self.shortlist)
+
+    def detect_async(self, code, callback, filename=None):
+        """Run detect() on the worker thread; callback(language) is called there too."""
+        def run():
+            try:
+                language = self.detect(code, filename)
+            except Exception:
+                language = "text"
+            callback(language)
+        return self.executor.submit(run)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
@@ -1,113 +1,398 @@
-import sqlite3
+import time
+STARTED = time.perf_counter()
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext, filedialog
 import ttkbootstrap as tb
-from ttkbootstrap.constants import *
-from pygments import highlight
-from pygments.lexers import guess_lexer, get_lexer_by_name, get_all_lexers
-from pygments.formatters import HtmlFormatter
-import pyperclip
+from ttkbootstrap.constants import INFO, WARNING, SUCCESS, DANGER
+import argparse
 import json
+import os
+import sys
 import webbrowser
 from datetime import datetime
-import os
+import queue
+import sqlite3
+import threading
+from langdetect import LanguageDetector
+from instrumentation import Metrics, StallMonitor, callback_name, install_tk_hooks
+from search import SearchWorker
+from store import DB_PATH, SnippetStore, DuplicateSnippetError
+import transfer
+IMPORTS_DONE = time.perf_counter()
+
+
+def user_cache_dir():
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser(r"~\AppData\Local")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "code-snippet-manager")
+
+
+# Lexer names for the language box, rebuilt only when the Pygments version changes
+LEXER_CACHE_PATH = os.path.join(user_cache_dir(), "lexers.json")
+
+# How often the Tk loop picks up results posted by worker threads (ms)
+UI_POLL_MS = 50
+TRANSFER_FILETYPES = [
+    ("JSON files", "*.json"), ("JSON Lines", "*.jsonl"),
+    ("Compressed", "*.json.gz *.jsonl.gz *.json.zst *.jsonl.zst"), ("All files", "*.*"),
+]
+
+# Virtualized list: rows fetched per page, pages kept in the Treeview, and how
+# close (as a fraction of the scroll range) to an edge the next page is fetched
+PAGE_SIZE = 100
+MAX_WINDOW_ROWS = PAGE_SIZE * 3
+PAGE_PREFETCH = 0.1
+
+def load_lexer_names(cache_path=LEXER_CACHE_PATH):
+    # get_all_lexers() imports importlib.metadata and walks every lexer and plugin
+    # entry point; the bare pygments package is cheap to import for its version
+    import pygments
+    try:
+        with open(cache_path, encoding="utf-8") as file:
+            cache = json.load(file)
+        if cache["pygments"] == pygments.__version__:
+            return cache["names"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    from pygments.lexers import get_all_lexers
+    names = sorted(name for name, _, _, _ in get_all_lexers())
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as file:
+            json.dump({"pygments": pygments.__version__, "names": names}, file)
+    except OSError:
+        pass
+    return names
+
+def format_size(size):
+    if size < 1024:
+        return f"{size} B"
+    return f"{size / 1024:.1f} KB" if size < 1024 * 1024 else f"{size / (1024 * 1024):.1f} MB"
 
 class SnippetManager:
-    def __init__(self):
+    def __init__(self, profile_startup=False, serve=None):
+        self.profile_startup = profile_startup
+        self.startup_phases = [("imports", IMPORTS_DONE - STARTED)]
+        self.phase_started = time.perf_counter()
         self.preview_after_id = None  # For delayed preview update
+        self.ui_calls = queue.Queue()  # Callbacks posted from worker threads
+        self.save_pending = False
+        self.highlighter = None  # Created on first preview so Pygments loads lazily
+        self.profiler = None
+        self.server = None  # Local API server, see start_server
+        self.metrics = Metrics()
         self.setup_database()
+        self.end_phase("setup_database")
+        self.detector = LanguageDetector(DB_PATH)
         self.setup_ui()
+        self.end_phase("setup_ui")
+        if serve is not None:
+            self.start_server(*serve)
+        self.root.after(UI_POLL_MS, self.process_ui_calls)
+        self.stall_monitor = StallMonitor(self.root, self.metrics)
+        self.stall_monitor.start()
+        # Let the window appear before filling it
+        self.root.after_idle(self.finish_startup)
+
+    def end_phase(self, name):
+        now = time.perf_counter()
+        self.startup_phases.append((name, now - self.phase_started))
+        self.phase_started = now
+
+    def finish_startup(self):
+        self.end_phase("window shown")
+        self.refresh_tags()
         self.load_snippets()
+        self.end_phase("load_snippets")
+        for note in self.store.migration_notes:
+            self.log_activity(note, 10000)
+        self.load_language_list()
+        if self.profile_startup:
+            for name, seconds in self.startup_phases:
+                print(f"{name:>16}: {seconds * 1000:8.1f} ms", file=sys.stderr)
+            print(f"{'total':>16}: {(time.perf_counter() - STARTED) * 1000:8.1f} ms", file=sys.stderr)
+
+    def load_language_list(self):
+        def work():
+            names = load_lexer_names()
+            self.call_in_ui(lambda: self.lang_combo.configure(values=names))
+        threading.Thread(target=work, name="lexer-names", daemon=True).start()
         
     def setup_database(self):
-        db_exists = os.path.exists("snippets.db")
-        self.conn = sqlite3.connect("snippets.db")
-        self.cursor = self.conn.cursor()
-        
-        if not db_exists:
-            self.cursor.execute("""
-                CREATE TABLE snippets (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    title TEXT NOT NULL,
-                    code TEXT NOT NULL,
-                    language TEXT NOT NULL,
-                    tags TEXT NOT NULL,
-                    description TEXT,
-                    favorite INTEGER DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_modified TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-        else:
-            existing_columns = [row[1] for row in self.cursor.execute("PRAGMA table_info(snippets)")]
-            if 'description' not in existing_columns:
-                self.cursor.execute("ALTER TABLE snippets ADD COLUMN description TEXT")
-            if 'created_at' not in existing_columns:
-                current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                self.cursor.execute("ALTER TABLE snippets ADD COLUMN created_at TIMESTAMP")
-                self.cursor.execute(f"UPDATE snippets SET created_at = '{current_time}'")
-            if 'last_modified' not in existing_columns:
-                current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                self.cursor.execute("ALTER TABLE snippets ADD COLUMN last_modified TIMESTAMP")
-                self.cursor.execute(f"UPDATE snippets SET last_modified = '{current_time}'")
-        self.conn.commit()
+        # Every connection of the app is timed, including the worker threads' ones
+        self.connection_factory = self.metrics.connection_factory()
+        self.store = SnippetStore(DB_PATH, factory=self.connection_factory)
+        self.searcher = SearchWorker(DB_PATH, self.on_search_results, limit=PAGE_SIZE,
+                                     on_error=self.on_search_error, factory=self.connection_factory)
+
+    def start_server(self, port=None, socket_path=None):
+        # Imported here so asyncio only loads when the server is wanted
+        from server import DEFAULT_PORT, SnippetServer
+        try:
+            server = SnippetServer(DB_PATH, port=DEFAULT_PORT if port is None else port, socket_path=socket_path,
+                                   on_change=lambda snippet_id: self.call_in_ui(self.on_external_change, snippet_id))
+            server.start_thread()
+        except OSError as e:
+            self.log_activity(f"API server not started: {e}", 10000)
+            return
+        self.server = server
+        self.log_activity(f"API server listening on {server.address}")
+
+    def on_external_change(self, snippet_id):
+        # A snippet added through the API server
+        self.refresh_tags()
+        self.apply_row_change(snippet_id)
 
     def load_snippets(self):
+        # Synchronous reload (startup, after imports); supersedes any search in flight
+        self.searcher.cancel()
+        list_query = self.store.list_query(self.search_var.get(), *self.tag_filter())
+        rows, has_more = self.store.page(list_query, limit=PAGE_SIZE)
+        self.show_first_page(list_query, rows, has_more)
+
+    def start_search(self):
+        self.search_timer = None
+        self.searcher.submit(self.search_var.get(), *self.tag_filter())
+
+    def on_search_results(self, generation, list_query, rows, has_more):
+        # Runs on the search thread
+        self.call_in_ui(self.apply_search_results, generation, list_query, rows, has_more)
+
+    def on_search_error(self, generation, error):
+        # Runs on the search thread
+        self.call_in_ui(self.log_activity, f"Search failed: {error}", 10000)
+
+    def apply_search_results(self, generation, list_query, rows, has_more):
+        if self.searcher.is_current(generation):
+            self.show_first_page(list_query, rows, has_more)
+
+    def tag_filter(self):
+        # (tags, match_all) for list_query from the sidebar selection
+        tags = [self.tag_names[index] for index in self.tag_list.curselection()]
+        return tags, self.tag_mode.get() == "all"
+
+    def refresh_tags(self):
+        # Facet counts are kept up to date by the database, so this is a small indexed read
+        selected = set(self.tag_filter()[0])
+        self.tag_names = []
+        self.tag_list.delete(0, tk.END)
+        for name, count in self.store.tag_counts():
+            self.tag_list.insert(tk.END, f"{name} ({count})")
+            if name in selected:
+                self.tag_list.selection_set(len(self.tag_names))
+            self.tag_names.append(name)
+
+    def on_tag_filter_change(self, *args):
+        if self.search_timer is not None:
+            self.root.after_cancel(self.search_timer)
+        self.start_search()
+
+    def clear_tag_filter(self):
+        self.tag_list.selection_clear(0, tk.END)
+        self.on_tag_filter_change()
+
+    def show_first_page(self, list_query, rows, has_more):
+        if self.page_after_id is not None:
+            self.root.after_cancel(self.page_after_id)
+            self.page_after_id = None
         self.snippet_tree.delete(*self.snippet_tree.get_children())
-        query = self.search_var.get().strip()
-        self.cursor.execute("""
-            SELECT 
-                id, 
-                title, 
-                language, 
-                tags, 
-                COALESCE(last_modified, created_at, CURRENT_TIMESTAMP) as modified_date,
-                favorite 
-            FROM snippets 
-            WHERE title LIKE ? OR tags LIKE ? OR language LIKE ?
-            ORDER BY favorite DESC, modified_date DESC
-        """, (f"%{query}%", f"%{query}%", f"%{query}%"))
-        for row in self.cursor.fetchall():
-            try:
-                modified_date = datetime.strptime(row[4], '%Y-%m-%d %H:%M:%S').strftime('%Y-%m-%d')
-            except Exception:
-                modified_date = "N/A"
-            fav = "⭐" if row[5] else ""
-            self.snippet_tree.insert("", tk.END, values=(row[0], row[1], row[2], row[3], modified_date, fav))
+        self.row_keys = {}
+        self.list_query = list_query
+        self.has_more_after = has_more
+        self.has_more_before = False
+        self.insert_rows(rows, 0)
+
+    def insert_rows(self, rows, index):
+        for offset, row in enumerate(rows):
+            iid = str(row[0])
+            self.snippet_tree.insert("", index + offset, iid=iid, values=self.row_values(row))
+            self.row_keys[iid] = row[8:11]
+
+    def row_values(self, row):
+        fav = "⭐" if row[5] else ""
+        return (row[0], row[1], row[2], row[3], row[4], fav, format_size(row[7]), row[6])
+
+    def on_list_scroll(self, first, last):
+        self.list_scroll.set(first, last)
+        if self.page_after_id is not None:
+            return
+        if float(last) >= 1 - PAGE_PREFETCH and self.has_more_after:
+            self.page_after_id = self.root.after_idle(self.load_next_page)
+        elif float(first) <= PAGE_PREFETCH and self.has_more_before:
+            self.page_after_id = self.root.after_idle(self.load_previous_page)
+
+    def load_next_page(self):
+        self.page_after_id = None
+        children = self.snippet_tree.get_children()
+        if not children:
+            return
+        top = self.first_visible_row()
+        rows, self.has_more_after = self.store.page(self.list_query, after=self.row_keys[children[-1]], limit=PAGE_SIZE)
+        self.insert_rows(rows, len(children))
+        removed = self.trim_window(keep_end=True)
+        self.scroll_to_row(top - removed)
+
+    def load_previous_page(self):
+        self.page_after_id = None
+        children = self.snippet_tree.get_children()
+        if not children:
+            return
+        top = self.first_visible_row()
+        rows, self.has_more_before = self.store.page(self.list_query, before=self.row_keys[children[0]], limit=PAGE_SIZE)
+        self.insert_rows(rows, 0)
+        self.trim_window(keep_end=False)
+        self.scroll_to_row(top + len(rows))
+
+    def trim_window(self, keep_end):
+        # Drop rows from the far side so only the visible window plus a margin stays loaded
+        children = self.snippet_tree.get_children()
+        excess = len(children) - MAX_WINDOW_ROWS
+        if excess <= 0:
+            return 0
+        dropped = children[:excess] if keep_end else children[-excess:]
+        self.snippet_tree.delete(*dropped)
+        for iid in dropped:
+            del self.row_keys[iid]
+        if keep_end:
+            self.has_more_before = True
+        else:
+            self.has_more_after = True
+        return excess
+
+    def first_visible_row(self):
+        return round(self.snippet_tree.yview()[0] * len(self.snippet_tree.get_children()))
+
+    def scroll_to_row(self, index):
+        total = len(self.snippet_tree.get_children())
+        if total:
+            self.snippet_tree.yview_moveto(max(index, 0) / total)
+
+    def apply_row_change(self, snippet_id):
+        # Re-query a single changed row through the current list query and patch it
+        # into the loaded window in sorted position instead of reloading the list
+        iid = str(snippet_id)
+        row = self.store.list_row(self.list_query, snippet_id)
+        if self.snippet_tree.exists(iid):
+            if row is None:
+                self.remove_row(snippet_id)
+                return
+            self.snippet_tree.item(iid, values=self.row_values(row))
+            del self.row_keys[iid]
+            index = self.row_position(row[8:11], iid)
+            if index is None:
+                self.remove_row(snippet_id)
+            else:
+                self.row_keys[iid] = row[8:11]
+                self.snippet_tree.move(iid, "", index)
+        elif row is not None:
+            index = self.row_position(row[8:11])
+            if index is not None:
+                self.insert_rows([row], index)
+
+    def remove_row(self, snippet_id):
+        iid = str(snippet_id)
+        if self.snippet_tree.exists(iid):
+            self.snippet_tree.delete(iid)
+            self.row_keys.pop(iid, None)
+
+    def row_position(self, key, exclude=None):
+        # Binary search over the loaded window (sorted by key, descending); None when the
+        # row sorts into a part of the result set that is not currently loaded
+        children = [iid for iid in self.snippet_tree.get_children() if iid != exclude]
+        low, high = 0, len(children)
+        while low < high:
+            mid = (low + high) // 2
+            if self.row_keys[children[mid]] > key:
+                low = mid + 1
+            else:
+                high = mid
+        if (low == 0 and self.has_more_before) or (low == len(children) and self.has_more_after):
+            return None
+        return low
+
+    def selected_snippet_id(self):
+        # The selected row may have been paged out of the Treeview while it is being edited
+        selected = self.snippet_tree.selection()
+        if selected:
+            return self.snippet_tree.item(selected)["values"][0]
+        return self.current_snippet_id
 
     def save_snippet(self):
+        if self.save_pending:
+            return
         title = self.title_entry.get().strip()
         code = self.code_text.get("1.0", tk.END).strip()
         tags = self.tags_entry.get().strip()
-        language = self.lang_combo.get() or self.guess_language(code)
+        language = self.lang_combo.get()
         description = self.description_text.get("1.0", tk.END).strip()
         if not title or not code:
             messagebox.showwarning("Missing Data", "Title and Code are required!")
             return
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        selected = self.snippet_tree.selection()
-        if selected:
-            snippet_id = self.snippet_tree.item(selected)["values"][0]
-            self.cursor.execute("""
-                UPDATE snippets 
-                SET title=?, code=?, language=?, tags=?, description=?, 
-                    last_modified=?
-                WHERE id=?
-            """, (title, code, language, tags, description, current_time, snippet_id))
-        else:
-            self.cursor.execute("""
-                INSERT INTO snippets (
-                    title, code, language, tags, description, 
-                    created_at, last_modified
-                ) 
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (title, code, language, tags, description, current_time, current_time))
-        self.conn.commit()
+        snippet_id = self.selected_snippet_id()
+        if language:
+            self.write_snippet(snippet_id, title, code, language, tags, description)
+            return
+        # Detect on the worker thread and finish the save back on the Tk thread
+        self.save_pending = True
+        self.log_activity("Detecting language...")
+        self.detector.detect_async(code, lambda detected: self.call_in_ui(
+            self.write_snippet, snippet_id, title, code, detected, tags, description
+        ), filename=title)
+
+    def write_snippet(self, snippet_id, title, code, language, tags, description):
+        self.save_pending = False
+        editing = self.current_snippet_id == snippet_id
+        if editing and not self.lang_combo.get():
+            self.lang_combo.set(language)
+        try:
+            snippet_id = self.store.save(snippet_id, title, code, language, tags, description)
+        except DuplicateSnippetError as e:
+            messagebox.showwarning("Duplicate Snippet", str(e))
+            return
+        except sqlite3.OperationalError as e:
+            self.warn_database_busy("Save", e)
+            return
+        if editing:
+            self.current_snippet_id = snippet_id
         self.log_activity("Snippet saved successfully!")
-        self.load_snippets()
+        self.refresh_tags()
+        self.apply_row_change(snippet_id)
+        if self.snippet_tree.exists(str(snippet_id)):
+            self.snippet_tree.see(str(snippet_id))
+
+    def warn_database_busy(self, action, error):
+        # An import or ingest holds the write lock until it commits; the editor keeps the changes
+        if self.transfer_cancel_event is not None:
+            detail = "A background job is writing to the database. Try again when it has finished."
+        else:
+            detail = str(error)
+        messagebox.showwarning(f"{action} Error", f"Could not write to the database: {detail}")
+
+    def call_in_ui(self, func, *args):
+        # Safe to call from any thread; func runs on the Tk thread
+        self.ui_calls.put((func, args))
+
+    def process_ui_calls(self):
+        try:
+            while True:
+                func, args = self.ui_calls.get_nowait()
+                try:
+                    with self.metrics.timed("ui_call." + callback_name(func)):
+                        func(*args)
+                except Exception as e:
+                    self.log_activity(f"Error: {e}")
+        except queue.Empty:
+            pass
+        self.root.after(UI_POLL_MS, self.process_ui_calls)
 
     def setup_ui(self):
         self.root = tb.Window(themename="darkly")
+        # Before any other widget registers a callback
+        self.uninstall_tk_hooks = install_tk_hooks(self.metrics, self.root)
         self.root.title("Code Snippet Manager Pro")
         self.root.geometry("1400x900")
         self.setup_menubar()
@@ -127,6 +412,7 @@ class SnippetManager:
         file_menu = tk.Menu(menubar, tearoff=0)
         file_menu.add_command(label="Export Snippets", command=self.export_snippets)
         file_menu.add_command(label="Import Snippets", command=self.import_snippets)
+        file_menu.add_command(label="Ingest Source Directory", command=self.ingest_directory)
         file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self.root.quit)
         menubar.add_cascade(label="File", menu=file_menu)
@@ -136,6 +422,10 @@ class SnippetManager:
         edit_menu.add_command(label="Delete Snippet", command=self.delete_snippet, accelerator="Ctrl+D")
         edit_menu.add_command(label="Copy Code", command=self.copy_to_clipboard, accelerator="Ctrl+C")
         menubar.add_cascade(label="Edit", menu=edit_menu)
+        tools_menu = tk.Menu(menubar, tearoff=0)
+        tools_menu.add_command(label="Find Similar Snippets", command=self.find_similar_snippets)
+        tools_menu.add_command(label="Find Duplicate Clusters", command=self.find_duplicate_clusters)
+        menubar.add_cascade(label="Tools", menu=tools_menu)
         help_menu = tk.Menu(menubar, tearoff=0)
         help_menu.add_command(label="About", command=self.show_about)
         help_menu.add_command(label="Visit Website", command=lambda: webbrowser.open("https://www.example.com"))
@@ -169,7 +459,23 @@ class SnippetManager:
         list_toolbar.pack(fill=tk.X, pady=(0, 5))
         ttk.Label(list_toolbar, text="Snippets", font=("Arial", 12, "bold")).pack(side=tk.LEFT)
         ttk.Button(list_toolbar, text="+ New", command=self.new_snippet, bootstyle=SUCCESS).pack(side=tk.RIGHT)
-        columns = ("ID", "Title", "Language", "Tags", "Modified", "Favorite")
+        tag_pane = ttk.Frame(left_pane)
+        tag_pane.pack(side=tk.LEFT, fill=tk.Y, padx=(0, 5))
+        tag_header = ttk.Frame(tag_pane)
+        tag_header.pack(fill=tk.X)
+        ttk.Label(tag_header, text="Tags", font=("Arial", 11, "bold")).pack(side=tk.LEFT)
+        ttk.Button(tag_header, text="Clear", command=self.clear_tag_filter, bootstyle="secondary-link").pack(side=tk.RIGHT)
+        self.tag_mode = tk.StringVar(value="any")
+        mode_frame = ttk.Frame(tag_pane)
+        mode_frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(mode_frame, text="Match:").pack(side=tk.LEFT)
+        ttk.Radiobutton(mode_frame, text="Any", value="any", variable=self.tag_mode, command=self.on_tag_filter_change).pack(side=tk.LEFT, padx=5)
+        ttk.Radiobutton(mode_frame, text="All", value="all", variable=self.tag_mode, command=self.on_tag_filter_change).pack(side=tk.LEFT)
+        self.tag_list = tk.Listbox(tag_pane, selectmode=tk.MULTIPLE, exportselection=False, width=20, font=("Arial", 10))
+        self.tag_list.pack(fill=tk.BOTH, expand=True)
+        self.tag_list.bind("<<ListboxSelect>>", self.on_tag_filter_change)
+        self.tag_names = []
+        columns = ("ID", "Title", "Language", "Tags", "Modified", "Favorite", "Size", "Match")
         self.snippet_tree = ttk.Treeview(left_pane, columns=columns, show="headings", selectmode="browse")
         self.snippet_tree.heading("ID", text="ID")
         self.snippet_tree.heading("Title", text="Title")
@@ -177,16 +483,24 @@ class SnippetManager:
         self.snippet_tree.heading("Tags", text="Tags")
         self.snippet_tree.heading("Modified", text="Modified")
         self.snippet_tree.heading("Favorite", text="⭐")
+        self.snippet_tree.heading("Size", text="Size")
+        self.snippet_tree.heading("Match", text="Match")
         self.snippet_tree.column("ID", width=50, anchor=tk.CENTER)
         self.snippet_tree.column("Title", width=200)
         self.snippet_tree.column("Language", width=100)
         self.snippet_tree.column("Tags", width=150)
         self.snippet_tree.column("Modified", width=100)
         self.snippet_tree.column("Favorite", width=50, anchor=tk.CENTER)
-        list_scroll = ttk.Scrollbar(left_pane, orient=tk.VERTICAL, command=self.snippet_tree.yview)
-        self.snippet_tree.configure(yscrollcommand=list_scroll.set)
+        self.snippet_tree.column("Size", width=70, anchor=tk.E)
+        self.snippet_tree.column("Match", width=250)
+        self.list_scroll = ttk.Scrollbar(left_pane, orient=tk.VERTICAL, command=self.snippet_tree.yview)
+        self.snippet_tree.configure(yscrollcommand=self.on_list_scroll)
         self.snippet_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        list_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.list_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.row_keys = {}
+        self.has_more_before = self.has_more_after = False
+        self.page_after_id = None
+        self.current_snippet_id = None
         self.snippet_tree.bind("<<TreeviewSelect>>", self.load_snippet_details)
         self.snippet_tree.bind("<Double-1>", self.edit_snippet)
 
@@ -204,6 +518,8 @@ class SnippetManager:
         self.copy_btn.pack(side=tk.RIGHT, padx=5)
         self.delete_btn = ttk.Button(btn_frame, text="🗑️ Delete", command=self.delete_snippet, bootstyle=DANGER)
         self.delete_btn.pack(side=tk.RIGHT, padx=5)
+        self.similar_btn = ttk.Button(btn_frame, text="🔍 Similar", command=self.find_similar_snippets, bootstyle=INFO)
+        self.similar_btn.pack(side=tk.RIGHT, padx=5)
         details_frame = ttk.Frame(right_pane)
         details_frame.pack(fill=tk.BOTH, expand=True)
         title_frame = ttk.Frame(details_frame)
@@ -216,7 +532,7 @@ class SnippetManager:
         lang_frame = ttk.Frame(lang_tags_frame)
         lang_frame.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 5))
         ttk.Label(lang_frame, text="Language:", font=("Arial", 11)).pack(side=tk.LEFT)
-        self.lang_combo = ttk.Combobox(lang_frame, values=sorted([name for name, _, _, _ in get_all_lexers()]))
+        self.lang_combo = ttk.Combobox(lang_frame)
         self.lang_combo.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 0))
         tags_frame = ttk.Frame(lang_tags_frame)
         tags_frame.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 0))
@@ -233,8 +549,10 @@ class SnippetManager:
         code_container.pack(fill=tk.BOTH, expand=True)
         self.code_text = scrolledtext.ScrolledText(code_container, wrap=tk.NONE, font=("Consolas", 12))
         self.code_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.code_text.configure(yscrollcommand=self.on_code_scroll)
         # Bind key release to schedule preview update
         self.code_text.bind("<KeyRelease>", self.schedule_preview_update)
+        self.lang_combo.bind("<<ComboboxSelected>>", self.schedule_preview_update)
         preview_label = ttk.Label(details_frame, text="Preview (Text Only):", font=("Arial", 11))
         preview_label.pack(anchor=tk.W, pady=(5, 0))
         # Using a simple label for preview instead of HTML
@@ -242,8 +560,14 @@ class SnippetManager:
         self.preview_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 5))
 
     def setup_statusbar(self):
-        self.statusbar = ttk.Label(self.main_container, text="Ready", relief=tk.SUNKEN, padding=(5, 2))
-        self.statusbar.pack(fill=tk.X, pady=(10, 0))
+        status_frame = ttk.Frame(self.main_container)
+        status_frame.pack(fill=tk.X, pady=(10, 0))
+        self.statusbar = ttk.Label(status_frame, text="Ready", relief=tk.SUNKEN, padding=(5, 2))
+        self.statusbar.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        # Shown only while an import/export runs in the background
+        self.transfer_cancel_btn = ttk.Button(status_frame, text="Cancel", command=self.cancel_transfer, bootstyle=DANGER)
+        self.transfer_progress = ttk.Progressbar(status_frame, length=200, maximum=1.0)
+        self.transfer_cancel_event = None
         activity_frame = ttk.Frame(self.main_container)
         activity_frame.pack(fill=tk.X, pady=(5, 0))
         ttk.Label(activity_frame, text="Recent Activity:", font=("Arial", 10, "italic")).pack(side=tk.LEFT)
@@ -265,43 +589,40 @@ class SnippetManager:
     def update_preview(self):
         try:
             code = self.code_text.get("1.0", tk.END).strip()
-            language = self.lang_combo.get()
-            if code:
-                try:
-                    lexer = get_lexer_by_name(language.lower(), stripall=True)
-                    formatter = HtmlFormatter(style="monokai", full=True)
-                    highlighted_code = highlight(code, lexer, formatter)
-                    # For this simplified preview, strip HTML tags (or simply display plain code)
-                    # Here, we display the plain code.
-                    self.preview_frame.config(text=code)
-                except Exception as e:
-                    self.preview_frame.config(text=code)
-                    self.log_activity(f"Error highlighting code: {e}")
-            else:
-                self.preview_frame.config(text="")
+            self.preview_frame.config(text=code)
+            try:
+                if self.highlighter is None:
+                    from highlighter import TextHighlighter
+                    self.highlighter = TextHighlighter(self.code_text)
+                self.highlighter.highlight(self.lang_combo.get())
+            except Exception as e:
+                self.log_activity(f"Error highlighting code: {e}")
         except Exception as e:
             self.log_activity(f"Error updating preview: {e}")
 
+    def on_code_scroll(self, first, last):
+        self.code_text.vbar.set(first, last)
+        if self.highlighter is not None:
+            self.highlighter.tag_visible()
+
     def load_snippet_details(self, event=None):
+        selected = self.snippet_tree.selection()
+        if selected:
+            self.show_snippet(self.snippet_tree.item(selected)["values"][0])
+
+    def show_snippet(self, snippet_id):
         try:
-            selected = self.snippet_tree.selection()
-            if not selected:
-                return
-            snippet_id = self.snippet_tree.item(selected)["values"][0]
-            self.cursor.execute("""
-                SELECT title, code, language, tags, description, favorite
-                FROM snippets WHERE id=?
-            """, (snippet_id,))
-            snippet = self.cursor.fetchone()
+            self.current_snippet_id = snippet_id
+            snippet = self.store.get(snippet_id)
             if snippet:
                 self.clear_fields()
-                self.title_entry.insert(0, snippet[0])
-                self.code_text.insert("1.0", snippet[1])
-                self.lang_combo.set(snippet[2])
-                self.tags_entry.insert(0, snippet[3])
-                if snippet[4]:
-                    self.description_text.insert("1.0", snippet[4])
-                self.current_favorite = snippet[5]
+                self.title_entry.insert(0, snippet["title"])
+                self.code_text.insert("1.0", snippet["code"])
+                self.lang_combo.set(snippet["language"])
+                self.tags_entry.insert(0, snippet["tags"])
+                if snippet["description"]:
+                    self.description_text.insert("1.0", snippet["description"])
+                self.current_favorite = snippet["favorite"]
                 self.update_preview()
         except Exception as e:
             self.log_activity(f"Error loading snippet details: {e}")
@@ -311,45 +632,44 @@ class SnippetManager:
         self.lang_combo.set("")
         self.tags_entry.delete(0, tk.END)
         self.code_text.delete("1.0", tk.END)
+        if self.highlighter is not None:
+            self.highlighter.reset()
         self.description_text.delete("1.0", tk.END)
         self.preview_frame.config(text="")
 
     def new_snippet(self):
         self.clear_fields()
+        self.current_snippet_id = None
         self.title_entry.focus()
         self.snippet_tree.selection_remove(self.snippet_tree.selection())
 
     def delete_snippet(self):
         try:
-            selected = self.snippet_tree.selection()
-            if not selected:
+            snippet_id = self.selected_snippet_id()
+            if snippet_id is None:
                 messagebox.showwarning("Delete Error", "No snippet selected!")
                 return
-            snippet_id = self.snippet_tree.item(selected)["values"][0]
             if messagebox.askyesno("Confirm Delete", "Are you sure you want to delete this snippet?"):
-                self.cursor.execute("DELETE FROM snippets WHERE id=?", (snippet_id,))
-                self.conn.commit()
+                self.store.delete(snippet_id)
                 self.log_activity("Snippet deleted successfully!")
                 self.clear_fields()
-                self.load_snippets()
+                self.current_snippet_id = None
+                self.remove_row(snippet_id)
+                self.refresh_tags()
+        except sqlite3.OperationalError as e:
+            self.warn_database_busy("Delete", e)
         except Exception as e:
             messagebox.showerror("Error", f"An error occurred: {e}")
 
     def copy_to_clipboard(self):
         code = self.code_text.get("1.0", tk.END).strip()
         if code:
+            import pyperclip
             pyperclip.copy(code)
             self.log_activity("Code copied to clipboard!")
         else:
             messagebox.showwarning("Copy Error", "No code to copy!")
 
-    def guess_language(self, code):
-        try:
-            lexer = guess_lexer(code)
-            return lexer.name
-        except Exception:
-            return "text"
-
     def toggle_theme(self):
         current_theme = self.root.style.theme.name
         new_theme = "cosmo" if current_theme == "darkly" else "darkly"
@@ -358,25 +678,22 @@ class SnippetManager:
 
     def toggle_favorite(self):
         try:
-            selected = self.snippet_tree.selection()
-            if not selected:
+            snippet_id = self.selected_snippet_id()
+            if snippet_id is None:
                 messagebox.showwarning("Favorite Error", "No snippet selected!")
                 return
-            snippet_id = self.snippet_tree.item(selected)["values"][0]
-            self.cursor.execute("SELECT favorite FROM snippets WHERE id=?", (snippet_id,))
-            current = self.cursor.fetchone()[0]
-            new_val = 0 if current else 1
-            self.cursor.execute("UPDATE snippets SET favorite=? WHERE id=?", (new_val, snippet_id))
-            self.conn.commit()
+            self.store.toggle_favorite(snippet_id)
             self.log_activity("Snippet favorite status updated!")
-            self.load_snippets()
+            self.apply_row_change(snippet_id)
+        except sqlite3.OperationalError as e:
+            self.warn_database_busy("Favorite", e)
         except Exception as e:
             messagebox.showerror("Error", f"An error occurred: {e}")
 
     def show_settings(self):
         settings_window = tb.Toplevel(self.root)
         settings_window.title("Settings")
-        settings_window.geometry("500x400")
+        settings_window.geometry("760x520")
         tab_control = ttk.Notebook(settings_window)
         general_tab = ttk.Frame(tab_control)
         tab_control.add(general_tab, text="General")
@@ -391,53 +708,248 @@ class SnippetManager:
         ttk.Label(font_frame, text="Font Size:").pack(side=tk.LEFT)
         font_size = ttk.Spinbox(font_frame, from_=8, to=24, width=5)
         font_size.pack(side=tk.LEFT, padx=5)
+        diagnostics_tab = ttk.Frame(tab_control)
+        tab_control.add(diagnostics_tab, text="Diagnostics")
+        self.setup_diagnostics_tab(diagnostics_tab)
         tab_control.pack(expand=True, fill=tk.BOTH)
 
+    def setup_diagnostics_tab(self, tab):
+        toolbar = ttk.Frame(tab)
+        toolbar.pack(fill=tk.X, padx=10, pady=5)
+        stall_label = ttk.Label(toolbar)
+        stall_label.pack(side=tk.LEFT)
+        profile_btn = ttk.Button(toolbar, bootstyle=WARNING)
+        ops_frame = ttk.LabelFrame(tab, text="Operation latency (rolling window)", padding=5)
+        ops_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        ops = ttk.Treeview(ops_frame, columns=("Operation", "Count", "p50", "p95", "p99", "Max"), show="headings", height=8)
+        for column, width in (("Operation", 280), ("Count", 60), ("p50", 70), ("p95", 70), ("p99", 70), ("Max", 70)):
+            ops.heading(column, text=column if column in ("Operation", "Count") else f"{column} (ms)")
+            ops.column(column, width=width, anchor=tk.W if column == "Operation" else tk.E)
+        ops.pack(fill=tk.BOTH, expand=True)
+        queries_frame = ttk.LabelFrame(tab, text="Slowest recent queries", padding=5)
+        queries_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        queries = ttk.Treeview(queries_frame, columns=("ms", "At", "SQL"), show="headings", height=5)
+        for column, width in (("ms", 70), ("At", 70), ("SQL", 560)):
+            queries.heading(column, text=column)
+            queries.column(column, width=width, anchor=tk.W if column == "SQL" else tk.E)
+        queries.pack(fill=tk.BOTH, expand=True)
+
+        def refresh():
+            ops.delete(*ops.get_children())
+            for name, summary in self.metrics.summaries().items():
+                ops.insert("", tk.END, values=(
+                    name, summary["count"], f"{summary['p50_ms']:.1f}", f"{summary['p95_ms']:.1f}",
+                    f"{summary['p99_ms']:.1f}", f"{summary['max_ms']:.1f}"
+                ))
+            queries.delete(*queries.get_children())
+            for seconds, at, sql in self.metrics.slowest_queries():
+                queries.insert("", tk.END, values=(f"{seconds * 1000:.1f}", at, sql[:200]))
+            stalls = list(self.metrics.stalls)
+            worst = max((seconds for _, seconds in stalls), default=0)
+            stall_label.config(text=f"Main-loop stalls: {len(stalls)} (worst {worst * 1000:.0f} ms)")
+            profile_btn.config(text="⏹ Stop Profiling" if self.profiler else "⏺ Start Profiling")
+
+        def toggle_profiling():
+            self.toggle_profiling()
+            refresh()
+        profile_btn.config(command=toggle_profiling)
+        ttk.Button(toolbar, text="Export JSON", command=self.export_diagnostics, bootstyle=INFO).pack(side=tk.RIGHT, padx=5)
+        profile_btn.pack(side=tk.RIGHT, padx=5)
+        ttk.Button(toolbar, text="Refresh", command=refresh).pack(side=tk.RIGHT, padx=5)
+        refresh()
+
+    def export_diagnostics(self):
+        file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON files", "*.json")])
+        if file_path:
+            with open(file_path, "w", encoding="utf-8") as file:
+                json.dump(self.metrics.snapshot(), file, indent=2)
+            self.log_activity("Diagnostics exported")
+
+    def toggle_profiling(self):
+        # Profiles the Tk thread, where every callback runs; saved as a pstats file
+        import cProfile
+        if self.profiler is None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+            self.log_activity("Profiling started")
+            return
+        self.profiler.disable()
+        profiler, self.profiler = self.profiler, None
+        file_path = filedialog.asksaveasfilename(defaultextension=".prof", filetypes=[("cProfile output", "*.prof")])
+        if file_path:
+            profiler.dump_stats(file_path)
+            self.log_activity(f"Profile saved to {file_path}")
+
     def export_snippets(self):
         file_path = filedialog.asksaveasfilename(
             defaultextension=".json",
-            filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+            filetypes=TRANSFER_FILETYPES
         )
         if file_path:
-            try:
-                self.cursor.execute("""
-                    SELECT id, title, code, language, tags, description, 
-                           favorite, created_at, last_modified 
-                    FROM snippets
-                """)
-                snippets = [dict(zip([col[0] for col in self.cursor.description], row))
-                            for row in self.cursor.fetchall()]
-                with open(file_path, "w", encoding='utf-8') as file:
-                    json.dump(snippets, file, indent=2, ensure_ascii=False)
-                self.log_activity("Snippets exported successfully!")
-            except Exception as e:
-                messagebox.showerror("Export Error", f"Failed to export snippets: {e}")
+            self.run_transfer(
+                "Exporting", transfer.export_snippets, file_path,
+                lambda count: self.log_activity(f"{count} snippets exported successfully!"),
+                "Export Error", "Failed to export snippets"
+            )
 
     def import_snippets(self):
         file_path = filedialog.askopenfilename(
-            filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+            filetypes=TRANSFER_FILETYPES
         )
-        if file_path:
+        if not file_path:
+            return
+        update_newer = messagebox.askyesnocancel(
+            "Import Snippets",
+            "Snippets already in your library are skipped.\n\n"
+            "Should existing snippets be updated when the imported copy is newer?"
+        )
+        if update_newer is None:
+            return
+        mode = "upsert" if update_newer else "merge"
+
+        def done(counts):
+            self.log_activity(
+                f"Import finished: {counts['inserted']} added, {counts['updated']} updated, "
+                f"{counts['skipped']} skipped"
+            )
+            self.refresh_tags()
+            self.load_snippets()
+        self.run_transfer("Importing", lambda store, path, progress, cancel: transfer.import_snippets(
+            store, path, progress, cancel, mode
+        ), file_path, done, "Import Error", "Failed to import snippets")
+
+    def ingest_directory(self):
+        directory = filedialog.askdirectory(title="Choose a source tree to harvest snippets from")
+        if not directory:
+            return
+
+        def job(store, path, progress, cancel):
+            import ingest
+            return ingest.ingest_tree(store, path, progress=progress, cancel=cancel)
+
+        def done(counts):
+            self.log_activity(
+                f"Ingest finished: {counts['inserted']} snippets added from {counts['files']} files "
+                f"({counts['unchanged']} unchanged, {counts['removed']} outdated removed)"
+            )
+            self.refresh_tags()
+            self.load_snippets()
+        self.run_transfer("Ingesting", job, directory, done, "Ingest Error", "Failed to ingest directory")
+
+    def run_transfer(self, label, job, file_path, on_done, error_title, error_message):
+        # Runs job(store, path, progress, cancel) on a background thread with its own connection
+        if self.transfer_cancel_event is not None:
+            messagebox.showwarning("Busy", "Another background job is still running.")
+            return
+        cancel = self.transfer_cancel_event = threading.Event()
+        self.transfer_progress.config(value=0)
+        self.transfer_progress.pack(side=tk.LEFT, padx=(5, 0))
+        self.transfer_cancel_btn.pack(side=tk.LEFT, padx=(5, 0))
+        self.statusbar.config(text=f"{label}...")
+
+        def progress(done, total):
+            self.call_in_ui(self.transfer_progress.config, {"value": done / max(total, 1)})
+
+        def finish(result, error):
+            self.transfer_cancel_event = None
+            self.transfer_progress.pack_forget()
+            self.transfer_cancel_btn.pack_forget()
+            if isinstance(error, transfer.TransferCancelled):
+                self.log_activity(f"{label} cancelled")
+            elif error is not None:
+                messagebox.showerror(error_title, f"{error_message}: {error}")
+            else:
+                on_done(result)
+
+        def work():
+            store = SnippetStore(DB_PATH, factory=self.connection_factory)
             try:
-                with open(file_path, "r", encoding='utf-8') as file:
-                    snippets = json.load(file)
-                for snippet in snippets:
-                    self.cursor.execute("""
-                        INSERT INTO snippets (
-                            title, code, language, tags, description, 
-                            favorite, created_at, last_modified
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        snippet['title'], snippet['code'], snippet['language'],
-                        snippet['tags'], snippet.get('description', ''), snippet.get('favorite', 0),
-                        snippet.get('created_at', datetime.now().strftime('%Y-%m-%d %H:%M:%S')),
-                        snippet.get('last_modified', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-                    ))
-                self.conn.commit()
-                self.log_activity("Snippets imported successfully!")
-                self.load_snippets()
+                result, error = job(store, file_path, progress, cancel), None
             except Exception as e:
-                messagebox.showerror("Import Error", f"Failed to import snippets: {e}")
+                result, error = None, e
+            finally:
+                store.close()
+            self.call_in_ui(finish, result, error)
+
+        threading.Thread(target=work, name="transfer", daemon=True).start()
+
+    def find_similar_snippets(self):
+        snippet_id = self.selected_snippet_id()
+        if snippet_id is None:
+            messagebox.showwarning("Similar Snippets", "No snippet selected!")
+            return
+
+        def job(store, _, progress, cancel):
+            from similarity import SimilarityIndex
+            index = SimilarityIndex(store)
+            index.refresh(progress, cancel)
+            return index.similar(snippet_id)
+        self.run_transfer("Indexing snippets", job, None, lambda results: self.show_similar_results(snippet_id, results),
+                          "Similarity Error", "Failed to find similar snippets")
+
+    def show_similar_results(self, snippet_id, results):
+        if not results:
+            self.log_activity("No similar snippets found")
+            return
+        window = tb.Toplevel(self.root)
+        window.title(f"Snippets similar to #{snippet_id}")
+        window.geometry("500x350")
+        tree = ttk.Treeview(window, columns=("Similarity", "ID", "Title"), show="headings")
+        for column, width in (("Similarity", 90), ("ID", 60), ("Title", 300)):
+            tree.heading(column, text=column)
+            tree.column(column, width=width, anchor=tk.W if column == "Title" else tk.CENTER)
+        for score, other, title in results:
+            tree.insert("", tk.END, values=(f"{score:.0%}", other, title))
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        tree.bind("<Double-1>", lambda e: self.open_result(tree, 1))
+
+    def find_duplicate_clusters(self):
+        def job(store, _, progress, cancel):
+            from similarity import SimilarityIndex
+            index = SimilarityIndex(store)
+            index.refresh(progress, cancel)
+            clusters = index.duplicate_clusters()
+            titles = {
+                snippet["id"]: snippet["title"]
+                for snippet in store.get_many(snippet_id for cluster in clusters for snippet_id in cluster)
+            }
+            return [[(snippet_id, titles.get(snippet_id, "")) for snippet_id in cluster] for cluster in clusters]
+        self.run_transfer("Indexing snippets", job, None, self.show_duplicate_clusters,
+                          "Duplicate Report Error", "Failed to find duplicate clusters")
+
+    def show_duplicate_clusters(self, clusters):
+        if not clusters:
+            self.log_activity("No near-duplicate snippets found")
+            return
+        window = tb.Toplevel(self.root)
+        window.title("Duplicate Clusters")
+        window.geometry("500x400")
+        tree = ttk.Treeview(window, columns=("ID",), show="tree headings")
+        tree.heading("#0", text="Title")
+        tree.heading("ID", text="ID")
+        tree.column("ID", width=60, anchor=tk.CENTER)
+        for number, cluster in enumerate(clusters, 1):
+            parent = tree.insert("", tk.END, text=f"Cluster {number} ({len(cluster)} snippets)", open=number <= 10)
+            for snippet_id, title in cluster:
+                tree.insert(parent, tk.END, text=title, values=(snippet_id,))
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        tree.bind("<Double-1>", lambda e: self.open_result(tree, 0))
+        self.log_activity(f"{len(clusters)} duplicate clusters found")
+
+    def open_result(self, tree, id_column):
+        selected = tree.selection()
+        values = tree.item(selected[0])["values"] if selected else ()
+        if values:
+            snippet_id = values[id_column]
+            if self.snippet_tree.exists(str(snippet_id)):
+                self.snippet_tree.selection_set(str(snippet_id))
+                self.snippet_tree.see(str(snippet_id))
+            else:
+                self.show_snippet(snippet_id)
+
+    def cancel_transfer(self):
+        if self.transfer_cancel_event is not None:
+            self.transfer_cancel_event.set()
 
     def show_about(self):
         messagebox.showinfo("About", "Code Snippet Manager Pro\nVersion 1.1\n© 2025 Premium Devs Inc.")
@@ -455,11 +967,25 @@ class SnippetManager:
     def on_search_change(self, *args):
         if self.search_timer is not None:
             self.root.after_cancel(self.search_timer)
-        self.search_timer = self.root.after(300, self.load_snippets)
+        self.search_timer = self.root.after(self.searcher.debounce_ms, self.start_search)
 
     def run(self):
         self.root.mainloop()
+        self.uninstall_tk_hooks()
+        if self.server is not None:
+            self.server.close()
+        self.searcher.close()
+        self.detector.close()
+        self.store.close()
 
 if __name__ == "__main__":
-    app = SnippetManager()
+    parser = argparse.ArgumentParser(description="Code Snippet Manager Pro")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print how long each startup phase took")
+    parser.add_argument("--serve", action="store_true", help="also serve the local JSON API (see server.py)")
+    parser.add_argument("--port", type=int, help="API port on localhost (default 8765)")
+    parser.add_argument("--socket", metavar="PATH", help="serve the API on this Unix socket instead")
+    args = parser.parse_args()
+    serve = (args.port, args.socket) if args.serve else None
+    app = SnippetManager(profile_startup=args.profile_startup, serve=serve)
     app.run()
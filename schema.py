@@ -0,0 +1,495 @@
+"""Database connection settings and versioned schema migrations.
+
+The schema version lives in ``PRAGMA user_version``. Opening an up-to-date
+database costs a single pragma read. Older databases run each pending
+migration once, each in its own transaction.
+"""
+import hashlib
+import sqlite3
+import zlib
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",  # Safe with WAL; only the last commits can be lost on power failure
+    "PRAGMA cache_size = -32000",  # 32 MB page cache
+    "PRAGMA mmap_size = 268435456",  # Read through a 256 MB memory map
+    "PRAGMA temp_store = MEMORY",
+)
+
+# Code bodies at least this many UTF-8 bytes are stored compressed, when that
+# saves at least COMPRESS_MIN_SAVING of their size. "zstd" compresses better
+# but needs the zstandard package on every machine that opens the database.
+COMPRESS_THRESHOLD = 4096
+COMPRESS_MIN_SAVING = 0.1
+CODE_CODEC = "zlib"
+PREVIEW_CHARS = 120
+
+
+def snippet_hash(code, language):
+    """Identity of a snippet: its code (ignoring line endings and trailing
+    whitespace) plus its language, case-insensitively."""
+    lines = code.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    normalized = "\n".join(line.rstrip() for line in lines).strip("\n")
+    key = f"{(language or '').strip().lower()}\0{normalized}"
+    return hashlib.sha256(key.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def code_preview(code):
+    """The first non-blank line of code, shortened for the list."""
+    line = next((line.strip() for line in code.splitlines() if line.strip()), "")
+    return line if len(line) <= PREVIEW_CHARS else line[:PREVIEW_CHARS - 1] + "…"
+
+
+def encode_code(code, codec=CODE_CODEC):
+    """(stored value, codec, size in bytes, preview) for a code body; codec is
+    "" when the code is stored as plain text."""
+    data = code.encode("utf-8", "surrogatepass")
+    preview = code_preview(code)
+    if len(data) >= COMPRESS_THRESHOLD:
+        if codec == "zstd":
+            if zstandard is None:
+                raise RuntimeError("Install the 'zstandard' package to store zstd-compressed code")
+            packed = zstandard.ZstdCompressor().compress(data)
+        else:
+            packed = zlib.compress(data, 6)
+        if len(packed) <= len(data) * (1 - COMPRESS_MIN_SAVING):
+            return packed, codec, len(data), preview
+    return code, "", len(data), preview
+
+
+def decompress_code(stored, codec):
+    """Inverse of encode_code; also registered as an SQL function on
+    connections from connect(), for reads only: writes must work from any
+    SQLite client."""
+    if not codec or stored is None:
+        return stored
+    if codec == "zlib":
+        data = zlib.decompress(stored)
+    elif codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Install the 'zstandard' package to read zstd-compressed snippets")
+        data = zstandard.ZstdDecompressor().decompress(stored)
+    else:
+        raise ValueError(f"Unknown code codec: {codec}")
+    return data.decode("utf-8", "surrogatepass")
+
+
+def split_tags(text):
+    """Normalized tag names in a comma-separated tags value, without duplicates."""
+    names = (name.strip().lower() for name in (text or "").split(","))
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def index_code(cursor, rows):
+    """Give the search index the code text of compressed rows, which its
+    triggers can't decompress; rows are (code, snippet id) pairs."""
+    cursor.executemany("UPDATE snippets_fts SET code=? WHERE rowid=?", rows)
+
+
+def migrate_base_schema(cursor):
+    # Also upgrades databases created before versioning, which may lack columns
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS snippets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            code TEXT NOT NULL,
+            language TEXT NOT NULL,
+            tags TEXT NOT NULL,
+            description TEXT,
+            favorite INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_modified TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            content_hash TEXT
+        )
+    """)
+    existing_columns = [row[1] for row in cursor.execute("PRAGMA table_info(snippets)")]
+    current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    if 'description' not in existing_columns:
+        cursor.execute("ALTER TABLE snippets ADD COLUMN description TEXT")
+    if 'created_at' not in existing_columns:
+        cursor.execute("ALTER TABLE snippets ADD COLUMN created_at TIMESTAMP")
+        cursor.execute("UPDATE snippets SET created_at = ?", (current_time,))
+    if 'last_modified' not in existing_columns:
+        cursor.execute("ALTER TABLE snippets ADD COLUMN last_modified TIMESTAMP")
+        cursor.execute("UPDATE snippets SET last_modified = ?", (current_time,))
+    if 'content_hash' not in existing_columns:
+        cursor.execute("ALTER TABLE snippets ADD COLUMN content_hash TEXT")
+    # Keyset pagination compares on last_modified, so it must never be NULL
+    cursor.execute("""
+        UPDATE snippets SET last_modified = COALESCE(created_at, CURRENT_TIMESTAMP)
+        WHERE last_modified IS NULL
+    """)
+
+
+def migrate_content_hashes(cursor):
+    # Backfill hashes, merge exact duplicates, then enforce uniqueness. The most
+    # recently modified copy is kept and gains the others' tags, descriptions,
+    # favorite flag and earliest created_at; the others are moved to
+    # merged_duplicates so their titles stay recoverable.
+    rows = cursor.execute("SELECT id, code, language FROM snippets WHERE content_hash IS NULL").fetchall()
+    if rows:
+        cursor.executemany(
+            "UPDATE snippets SET content_hash=? WHERE id=?",
+            [(snippet_hash(code, language), snippet_id) for snippet_id, code, language in rows]
+        )
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS merged_duplicates (
+            id INTEGER PRIMARY KEY,
+            kept_id INTEGER NOT NULL,
+            title TEXT,
+            code TEXT,
+            language TEXT,
+            tags TEXT,
+            description TEXT,
+            favorite INTEGER,
+            created_at TIMESTAMP,
+            last_modified TIMESTAMP,
+            merged_at TIMESTAMP NOT NULL
+        )
+    """)
+    duplicated = cursor.execute(
+        "SELECT content_hash FROM snippets GROUP BY content_hash HAVING COUNT(*) > 1"
+    ).fetchall()
+    merged = 0
+    merged_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    for (content_hash,) in duplicated:
+        copies = cursor.execute("""
+            SELECT id, tags, description, favorite, created_at FROM snippets
+            WHERE content_hash = ? ORDER BY last_modified DESC, id DESC
+        """, (content_hash,)).fetchall()
+        kept_id, kept_tags = copies[0][0], copies[0][1] or ""
+        seen = {name.lower() for name in split_tags(kept_tags)}
+        extra_tags = []
+        for _, tags, _, _, _ in copies[1:]:
+            for name in (name.strip() for name in (tags or "").split(",")):
+                if name and name.lower() not in seen:
+                    seen.add(name.lower())
+                    extra_tags.append(name)
+        descriptions = list(dict.fromkeys(
+            description.strip() for _, _, description, _, _ in copies if description and description.strip()
+        ))
+        created = [created_at for _, _, _, _, created_at in copies if created_at]
+        cursor.execute(
+            "UPDATE snippets SET tags=?, description=?, favorite=?, created_at=? WHERE id=?",
+            (", ".join(part for part in [kept_tags] + extra_tags if part),
+             "\n\n".join(descriptions) or copies[0][2], max(favorite or 0 for _, _, _, favorite, _ in copies),
+             min(created) if created else None, kept_id)
+        )
+        losers = [(kept_id, merged_at, snippet_id) for snippet_id, _, _, _, _ in copies[1:]]
+        cursor.executemany("""
+            INSERT INTO merged_duplicates (
+                kept_id, merged_at, id, title, code, language, tags, description, favorite, created_at, last_modified
+            )
+            SELECT ?, ?, id, title, code, language, tags, description, favorite, created_at, last_modified
+            FROM snippets WHERE id = ?
+        """, losers)
+        cursor.executemany("DELETE FROM snippets WHERE id = ?", [(snippet_id,) for _, _, snippet_id in losers])
+        merged += len(losers)
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_snippets_content_hash ON snippets(content_hash)")
+    if merged:
+        return (f"Merged {merged} duplicate snippet{'s' if merged != 1 else ''} into their newest copies; "
+                "the originals are kept in the merged_duplicates table")
+    return None
+
+
+def migrate_search_index(cursor):
+    if cursor.execute("SELECT 1 FROM sqlite_master WHERE name='snippets_fts'").fetchone():
+        return
+    try:
+        cursor.execute("""
+            CREATE VIRTUAL TABLE snippets_fts USING fts5(
+                title, tags, language, description, code,
+                content='snippets', content_rowid='id', prefix='2 3'
+            )
+        """)
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5: search falls back to LIKE scans
+        return
+    cursor.execute("""
+        CREATE TRIGGER snippets_fts_insert AFTER INSERT ON snippets BEGIN
+            INSERT INTO snippets_fts(rowid, title, tags, language, description, code)
+            VALUES (new.id, new.title, new.tags, new.language, new.description, new.code);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER snippets_fts_delete AFTER DELETE ON snippets BEGIN
+            INSERT INTO snippets_fts(snippets_fts, rowid, title, tags, language, description, code)
+            VALUES ('delete', old.id, old.title, old.tags, old.language, old.description, old.code);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER snippets_fts_update AFTER UPDATE OF title, tags, language, description, code ON snippets BEGIN
+            INSERT INTO snippets_fts(snippets_fts, rowid, title, tags, language, description, code)
+            VALUES ('delete', old.id, old.title, old.tags, old.language, old.description, old.code);
+            INSERT INTO snippets_fts(rowid, title, tags, language, description, code)
+            VALUES (new.id, new.title, new.tags, new.language, new.description, new.code);
+        END
+    """)
+    cursor.execute("INSERT INTO snippets_fts(snippets_fts) VALUES ('rebuild')")
+
+
+def migrate_list_index(cursor):
+    # Serves ORDER BY favorite DESC, last_modified DESC, id DESC and its keyset
+    # range scans straight from the index, without a temp B-tree sort
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_snippets_list ON snippets(favorite, last_modified, id)")
+    cursor.execute("ANALYZE")
+
+
+def migrate_tags(cursor):
+    # snippets.tags stays the display value; the store keeps these tables in step
+    # with it. Counts are adjusted per link by triggers so facets never GROUP BY.
+    cursor.execute("""
+        CREATE TABLE tags (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            snippet_count INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE snippet_tags (
+            snippet_id INTEGER NOT NULL,
+            tag_id INTEGER NOT NULL,
+            PRIMARY KEY (snippet_id, tag_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX idx_snippet_tags_tag ON snippet_tags(tag_id, snippet_id)")
+    links = [
+        (snippet_id, name)
+        for snippet_id, tags in cursor.execute("SELECT id, tags FROM snippets").fetchall()
+        for name in split_tags(tags)
+    ]
+    cursor.executemany("INSERT OR IGNORE INTO tags(name) VALUES (?)", {(name,) for _, name in links})
+    cursor.executemany(
+        "INSERT INTO snippet_tags(snippet_id, tag_id) SELECT ?, id FROM tags WHERE name = ?", links
+    )
+    cursor.execute("""
+        UPDATE tags SET snippet_count = (SELECT COUNT(*) FROM snippet_tags WHERE tag_id = tags.id)
+    """)
+    cursor.execute("""
+        CREATE TRIGGER snippet_tags_insert AFTER INSERT ON snippet_tags BEGIN
+            UPDATE tags SET snippet_count = snippet_count + 1 WHERE id = new.tag_id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER snippet_tags_delete AFTER DELETE ON snippet_tags BEGIN
+            UPDATE tags SET snippet_count = snippet_count - 1 WHERE id = old.tag_id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER snippets_tags_delete AFTER DELETE ON snippets BEGIN
+            DELETE FROM snippet_tags WHERE snippet_id = old.id;
+        END
+    """)
+
+
+def migrate_similarity_index(cursor):
+    # MinHash signatures and their LSH band buckets (see similarity.py), filled lazily
+    cursor.execute("""
+        CREATE TABLE snippet_signatures (
+            snippet_id INTEGER PRIMARY KEY,
+            last_modified TIMESTAMP,
+            signature BLOB NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE snippet_lsh (
+            band INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            snippet_id INTEGER NOT NULL,
+            PRIMARY KEY (band, bucket, snippet_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX idx_snippet_lsh_snippet ON snippet_lsh(snippet_id)")
+    cursor.execute("""
+        CREATE TRIGGER snippets_similarity_delete AFTER DELETE ON snippets BEGIN
+            DELETE FROM snippet_signatures WHERE snippet_id = old.id;
+            DELETE FROM snippet_lsh WHERE snippet_id = old.id;
+        END
+    """)
+
+
+def migrate_ingest_files(cursor):
+    # Files already harvested by ingest.py, so reruns skip unchanged ones
+    cursor.execute("""
+        CREATE TABLE ingest_files (
+            path TEXT PRIMARY KEY,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            file_hash TEXT NOT NULL
+        )
+    """)
+
+
+def migrate_code_compression(cursor):
+    # The list reads title, tags, preview and size from a covering index, and
+    # code is compressed once large. Compressed code can't feed an external-
+    # content search index, so the index is recreated as one that stores its
+    # own text: excerpts never read snippets.code and rows leave it by rowid.
+    # Its triggers call no SQL functions, so any SQLite client can write; they
+    # index plain code themselves and SnippetStore fills in compressed code
+    # (see index_code).
+    cursor.execute("ALTER TABLE snippets ADD COLUMN codec TEXT NOT NULL DEFAULT ''")
+    cursor.execute("ALTER TABLE snippets ADD COLUMN code_size INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("ALTER TABLE snippets ADD COLUMN preview TEXT NOT NULL DEFAULT ''")
+    search = cursor.execute("SELECT 1 FROM sqlite_master WHERE name='snippets_fts'").fetchone() is not None
+    if search:
+        for trigger in ("snippets_fts_insert", "snippets_fts_delete", "snippets_fts_update"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        cursor.execute("DROP TABLE snippets_fts")
+        cursor.execute("""
+            CREATE VIRTUAL TABLE snippets_fts USING fts5(
+                title, tags, language, description, code, prefix='2 3'
+            )
+        """)
+    last_id = 0
+    while True:
+        rows = cursor.execute(
+            "SELECT id, title, tags, language, description, code FROM snippets WHERE id > ? ORDER BY id LIMIT 500",
+            (last_id,)
+        ).fetchall()
+        if not rows:
+            break
+        cursor.executemany(
+            "UPDATE snippets SET code=?, codec=?, code_size=?, preview=? WHERE id=?",
+            [encode_code(row[5]) + (row[0],) for row in rows]
+        )
+        if search:
+            cursor.executemany(
+                "INSERT INTO snippets_fts(rowid, title, tags, language, description, code) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        last_id = rows[-1][0]
+    if search:
+        cursor.execute("""
+            CREATE TRIGGER snippets_fts_insert AFTER INSERT ON snippets BEGIN
+                INSERT INTO snippets_fts(rowid, title, tags, language, description, code)
+                VALUES (new.id, new.title, new.tags, new.language, new.description,
+                        CASE WHEN new.codec = '' THEN new.code ELSE '' END);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER snippets_fts_delete AFTER DELETE ON snippets BEGIN
+                DELETE FROM snippets_fts WHERE rowid = old.id;
+            END
+        """)
+        # Code that stays compressed and unchanged keeps the text already indexed
+        cursor.execute("""
+            CREATE TRIGGER snippets_fts_update AFTER UPDATE OF title, tags, language, description, code, codec
+            ON snippets BEGIN
+                UPDATE snippets_fts
+                SET title = new.title, tags = new.tags, language = new.language, description = new.description,
+                    code = CASE WHEN new.codec = '' THEN new.code WHEN new.code IS old.code THEN code ELSE '' END
+                WHERE rowid = new.id;
+            END
+        """)
+    cursor.execute("DROP INDEX IF EXISTS idx_snippets_list")
+    cursor.execute("""
+        CREATE INDEX idx_snippets_list ON snippets(
+            favorite, last_modified, id, title, language, tags, code_size, preview
+        )
+    """)
+    cursor.execute("ANALYZE")
+
+
+def migrate_language_cache(cursor):
+    # Detected languages by content hash (see langdetect.py), which used to
+    # create this table itself
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS language_cache (
+            content_hash TEXT PRIMARY KEY,
+            language TEXT NOT NULL
+        )
+    """)
+
+
+def migrate_ingest_snippets(cursor):
+    # The snippets each ingested file produced, so a changed file replaces
+    # them. Editing a snippet's code or deleting it detaches it from its file.
+    cursor.execute("""
+        CREATE TABLE ingest_snippets (
+            path TEXT NOT NULL,
+            snippet_id INTEGER NOT NULL,
+            PRIMARY KEY (path, snippet_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX idx_ingest_snippets_snippet ON ingest_snippets(snippet_id)")
+    cursor.execute("""
+        CREATE TRIGGER snippets_ingest_delete AFTER DELETE ON snippets BEGIN
+            DELETE FROM ingest_snippets WHERE snippet_id = old.id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER snippets_ingest_edit AFTER UPDATE OF content_hash ON snippets
+        WHEN new.content_hash IS NOT old.content_hash BEGIN
+            DELETE FROM ingest_snippets WHERE snippet_id = old.id;
+        END
+    """)
+
+
+
+def migrate_signature_hashes(cursor):
+    # Signatures also remember the content hash they were computed from (see
+    # similarity.STALE_ROWS); existing ones are recomputed on the next refresh
+    cursor.execute("ALTER TABLE snippet_signatures ADD COLUMN content_hash TEXT")
+
+
+# Append only: position + 1 is the user_version a migration upgrades to
+MIGRATIONS = (
+    migrate_base_schema,
+    migrate_content_hashes,
+    migrate_search_index,
+    migrate_list_index,
+    migrate_tags,
+    migrate_similarity_index,
+    migrate_ingest_files,
+    migrate_code_compression,
+    migrate_language_cache,
+    migrate_ingest_snippets,
+    migrate_signature_hashes,
+)
+
+
+def connect(path, readonly=False, check_same_thread=True, factory=sqlite3.Connection):
+    if readonly:
+        # journal_mode is a property of the file; the reader inherits WAL from the writer
+        uri = f"{Path(path).absolute().as_uri()}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=check_same_thread, factory=factory)
+        pragmas = CONNECTION_PRAGMAS[2:]
+    else:
+        conn = sqlite3.connect(path, check_same_thread=check_same_thread, factory=factory)
+        pragmas = CONNECTION_PRAGMAS
+    for pragma in pragmas:
+        conn.execute(pragma)
+    conn.create_function("decompress_code", 2, decompress_code, deterministic=True)
+    return conn
+
+
+def migrate(conn):
+    """Run pending migrations; returns the notes they left for the user
+    (migrations return a message when they changed the user's data)."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    notes = []
+    for target, migration in enumerate(MIGRATIONS[version:], version + 1):
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        try:
+            note = migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        if note:
+            notes.append(note)
+    return notes
+
+
+def has_search_index(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name='snippets_fts'").fetchone() is not None
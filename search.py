@@ -0,0 +1,121 @@
+"""Search-as-you-type on a background thread.
+
+Queries run on their own read-only connection, so a slow search never blocks
+the Tk thread or the writer. Every submitted query gets a generation number;
+submitting a new one interrupts the query in flight, and results of
+superseded generations are never delivered; a query that fails for any
+other reason is reported through on_error.
+"""
+import sqlite3
+import sys
+import threading
+import time
+
+from store import SnippetStore
+
+# Debounce bounds (ms) and how quickly the running average follows new timings
+MIN_DEBOUNCE_MS = 30
+MAX_DEBOUNCE_MS = 300
+AVERAGE_WEIGHT = 0.3
+
+
+class SearchWorker:
+    def __init__(self, db_path, on_result, limit=100, on_error=None, factory=sqlite3.Connection):
+        """on_result(generation, list_query, rows, has_more) and
+        on_error(generation, error) are called on the worker thread; the
+        caller must hand them over to its own thread. Without on_error,
+        failures are printed to stderr. factory is the connection class, as
+        for SnippetStore."""
+        self.on_result = on_result
+        self.on_error = on_error
+        self.limit = limit
+        self.generation = 0
+        self.average_ms = 0.0
+        self._store = SnippetStore(db_path, readonly=True, check_same_thread=False, factory=factory)
+        self._pending = None
+        self._running = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="search", daemon=True)
+        self._thread.start()
+
+    @property
+    def debounce_ms(self):
+        # About twice the recent query time: fast libraries search on nearly
+        # every keystroke, slow ones wait for a pause in typing
+        return int(min(max(2 * self.average_ms, MIN_DEBOUNCE_MS), MAX_DEBOUNCE_MS))
+
+    def submit(self, query, tags=(), match_all=False):
+        """Queue a search (see SnippetStore.list_query), superseding any
+        earlier one; returns its generation."""
+        with self._lock:
+            self.generation += 1
+            self._pending = (self.generation, (query, tuple(tags), match_all))
+            self._interrupt_stale()
+        self._wakeup.set()
+        return self.generation
+
+    def cancel(self):
+        """Drop the pending and running searches without starting a new one."""
+        with self._lock:
+            self.generation += 1
+            self._pending = None
+            self._interrupt_stale()
+
+    def is_current(self, generation):
+        return generation == self.generation
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._pending = None
+            self._interrupt_stale()
+        self._wakeup.set()
+        self._thread.join()
+        self._store.close()
+
+    def _interrupt_stale(self):
+        if self._running is not None and self._running != self.generation:
+            self._store.conn.interrupt()
+
+    def _report(self, generation, error):
+        # The list keeps showing the previous results
+        if not self.is_current(generation):
+            return
+        if self.on_error is not None:
+            self.on_error(generation, error)
+        else:
+            print(f"search failed: {error}", file=sys.stderr)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            with self._lock:
+                self._wakeup.clear()
+                if self._closed:
+                    return
+                if self._pending is None:
+                    continue
+                generation, arguments = self._pending
+                self._pending = None
+                self._running = generation
+            started = time.perf_counter()
+            try:
+                list_query = self._store.list_query(*arguments)
+                rows, has_more = self._store.page(list_query, limit=self.limit)
+            except sqlite3.OperationalError as e:
+                # Interrupted because a newer query arrived: nothing to report
+                if str(e) != "interrupted":
+                    self._report(generation, e)
+                continue
+            except sqlite3.Error as e:
+                self._report(generation, e)
+                continue
+            finally:
+                with self._lock:
+                    self._running = None
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.average_ms += AVERAGE_WEIGHT * (elapsed_ms - self.average_ms)
+            if self.is_current(generation):
+                self.on_result(generation, list_query, rows, has_more)
@@ -0,0 +1,411 @@
+"""Local JSON API for editors and scripts.
+
+    GET  /search?q=QUERY[&tags=a,b][&all=1][&limit=N]
+    GET  /snippets/ID
+    GET  /snippets?ids=1,2,3
+    POST /snippets    {"title": ..., "code": ..., "language", "tags", "description" optional}
+    GET  /export      every snippet as JSON Lines, streamed
+
+A small HTTP/1.1 handler (keep-alive, no TLS, no auth) on asyncio streams,
+meant to listen on localhost or a Unix socket only. Since any web page can
+send requests to localhost, requests must name a loopback Host (against DNS
+rebinding), must not come from another Origin, and POST bodies must be
+declared application/json, which a page can't send cross-origin without a
+CORS preflight this server never grants. Reads run on a pool of
+read-only connections, so they proceed alongside each other, the writer and
+the GUI; inserts go through a single writer thread in arrival order. GET
+responses carry an ETag derived from PRAGMA data_version, are cached until
+any connection commits, and get a 304 when the client's copy is current.
+"""
+import asyncio
+import itertools
+import json
+import os
+import queue
+import secrets
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+import schema
+from store import DB_PATH, LIST_COLUMNS, DuplicateSnippetError, SnippetStore
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+READERS = 4
+CACHE_ENTRIES = 1024
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 1000
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 16 * 1024 * 1024
+EXPORT_BATCH = 500
+# Idle keep-alive connections are dropped after this many seconds
+KEEP_ALIVE_SECONDS = 30
+LOOPBACK_NAMES = ("localhost", "127.0.0.1", "[::1]")
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message=None):
+        super().__init__(message or status.phrase)
+        self.status = status
+
+
+def parse_head(head):
+    """(method, target, version, headers) of a request head; header names lowercased."""
+    lines = head.decode("latin-1").split("\r\n")
+    parts = lines[0].split(" ")
+    if len(parts) != 3 or not parts[2].startswith("HTTP/1."):
+        raise HTTPError(HTTPStatus.BAD_REQUEST)
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+    return parts[0], parts[1], parts[2], headers
+
+
+def response_head(status, headers):
+    lines = [f"HTTP/1.1 {status.value} {status.phrase}"]
+    lines.extend(f"{name}: {value}" for name, value in headers.items())
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+def encode_json(value):
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+def parse_int(text, name):
+    try:
+        return int(text)
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"{name} must be an integer") from None
+
+
+def insert_snippet(store, snippet):
+    # Runs on the writer thread
+    code = snippet["code"].strip()
+    language = snippet.get("language")
+    if not language:
+        from langdetect import detect_from_hints, detect_uncached
+        language = detect_from_hints(code, snippet["title"]) or detect_uncached(code)
+    return store.save(None, snippet["title"], code, language, snippet.get("tags") or "",
+                      snippet.get("description") or "")
+
+
+class SnippetServer:
+    def __init__(self, db_path=DB_PATH, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None,
+                 readers=READERS, on_change=None):
+        """socket_path, when given, is used instead of host and port.
+        on_change(snippet_id) is called on the server thread after an insert."""
+        self.db_path = db_path
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.on_change = on_change
+        # Tells responses of this run apart from a previous run's with the same data_version
+        self.instance = secrets.token_hex(4)
+        self.generation = 0
+        # The writer opens first so the database is migrated before the readers open
+        self._writer_store = SnippetStore(db_path, check_same_thread=False)
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix="server-writer")
+        self._reader_stores = [SnippetStore(db_path, readonly=True, check_same_thread=False)
+                               for _ in range(readers)]
+        self._idle_readers = queue.Queue()
+        for store in self._reader_stores:
+            self._idle_readers.put(store)
+        self._readers = ThreadPoolExecutor(readers, thread_name_prefix="server-reader")
+        # data_version changes whenever another connection commits, including the GUI's
+        self._version_conn = schema.connect(db_path, readonly=True, check_same_thread=False)
+        self._data_version = None
+        self._cache = OrderedDict()
+        self._handlers = set()
+        self._loop = None
+        self._stopped = None
+        self._thread = None
+
+    @property
+    def address(self):
+        return self.socket_path or f"http://{self.host}:{self.port}"
+
+    # Lifecycle
+
+    def run(self, ready=None):
+        """Serve until close() is called from another thread; ready() is
+        called once the socket is listening."""
+        asyncio.run(self._serve(ready))
+
+    def start_thread(self):
+        """Serve on a daemon thread; returns once listening, or raises if the
+        socket couldn't be opened."""
+        listening = threading.Event()
+        errors = []
+
+        def target():
+            try:
+                self.run(listening.set)
+            except Exception as e:
+                errors.append(e)
+                listening.set()
+        self._thread = threading.Thread(target=target, name="server", daemon=True)
+        self._thread.start()
+        listening.wait()
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._stopped.set)
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    async def _serve(self, ready):
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        try:
+            if self.socket_path:
+                server = await asyncio.start_unix_server(self.handle, self.socket_path, limit=MAX_HEADER_BYTES)
+            else:
+                server = await asyncio.start_server(self.handle, self.host, self.port, limit=MAX_HEADER_BYTES)
+                self.port = server.sockets[0].getsockname()[1]
+            if ready:
+                ready()
+            async with server:
+                await self._stopped.wait()
+                # Closing the transports ends idle keep-alive connections at their next read
+                for _, writer in list(self._handlers):
+                    writer.close()
+                await asyncio.gather(*(task for task, _ in self._handlers), return_exceptions=True)
+        finally:
+            self._release()
+
+    def _release(self):
+        self._readers.shutdown(cancel_futures=True)
+        self._writer.shutdown()
+        for store in self._reader_stores:
+            store.close()
+        self._writer_store.close()
+        self._version_conn.close()
+        if self.socket_path and os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    # Connections
+
+    async def read(self, func, *args):
+        """func(store, *args) on a reader thread with a read-only store."""
+        return await self._loop.run_in_executor(self._readers, self._with_reader, func, args)
+
+    def _with_reader(self, func, args):
+        # One thread per store, so this never waits
+        store = self._idle_readers.get()
+        try:
+            return func(store, *args)
+        finally:
+            self._idle_readers.put(store)
+
+    async def write(self, func, *args):
+        """func(store, *args) on the writer thread, after every earlier write."""
+        return await self._loop.run_in_executor(self._writer, func, self._writer_store, *args)
+
+    def current_generation(self):
+        version = self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._data_version = version
+            self.generation += 1
+            self._cache.clear()
+        return self.generation
+
+    # HTTP
+
+    async def handle(self, reader, writer):
+        handler = (asyncio.current_task(), writer)
+        self._handlers.add(handler)
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_SECONDS)
+                except asyncio.LimitOverrunError:
+                    await self.send(writer, HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, {},
+                                    encode_json({"error": "Request head too large"}), keep_alive=False)
+                    return
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    return
+                method, keep_alive, body_read = "GET", False, False
+                try:
+                    method, target, version, headers = parse_head(head)
+                    connection = headers.get("connection", "").lower()
+                    keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+                    # Refused requests never get their body read
+                    self.check_request(method, headers)
+                    body = await self.read_body(reader, method, headers)
+                    body_read = True
+                    if method in ("GET", "HEAD") and urlsplit(target).path.rstrip("/") == "/export":
+                        try:
+                            await self.export(writer, head_only=method == "HEAD")
+                        except Exception:
+                            # The status line is already out; closing tells the client the stream is incomplete
+                            return
+                        if not keep_alive:
+                            return
+                        continue
+                    status, extra, payload = await self.dispatch(method, target, headers, body)
+                except HTTPError as e:
+                    status, extra, payload = e.status, {}, encode_json({"error": str(e)})
+                    # An unread body would be parsed as the next request
+                    keep_alive = keep_alive and body_read
+                except DuplicateSnippetError as e:
+                    status, extra, payload = HTTPStatus.CONFLICT, {}, encode_json({"error": str(e)})
+                except asyncio.IncompleteReadError:
+                    return
+                except Exception as e:
+                    status, extra, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {}, encode_json({"error": str(e)})
+                await self.send(writer, status, extra, payload, keep_alive, head_only=method == "HEAD")
+                if not keep_alive:
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            self._handlers.discard(handler)
+            writer.close()
+
+    def allowed_hosts(self):
+        names = list(LOOPBACK_NAMES)
+        host = f"[{self.host}]" if ":" in self.host else self.host
+        if host not in names:
+            names.append(host)
+        return {f"{name}:{self.port}" for name in names}
+
+    def check_request(self, method, headers):
+        hosts = None if self.socket_path else self.allowed_hosts()
+        # Browsers can't reach a Unix socket, so any Host will do there
+        if hosts is not None and headers.get("host", "").lower() not in hosts:
+            raise HTTPError(HTTPStatus.FORBIDDEN, "Host must be a loopback address with the server's port")
+        origin = headers.get("origin")
+        if origin is not None and (hosts is None or urlsplit(origin).netloc.lower() not in hosts
+                                   or not origin.lower().startswith("http://")):
+            raise HTTPError(HTTPStatus.FORBIDDEN, "Cross-origin requests are not allowed")
+        if method == "POST" and headers.get("content-type", "").split(";")[0].strip().lower() != "application/json":
+            raise HTTPError(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, "Content-Type must be application/json")
+
+    async def read_body(self, reader, method, headers):
+        """The body of a POST. Other methods don't take one; if they send one
+        anyway it is read and dropped, so it doesn't linger on the connection."""
+        if "transfer-encoding" in headers:
+            raise HTTPError(HTTPStatus.NOT_IMPLEMENTED, "Chunked request bodies are not supported")
+        if "content-length" not in headers:
+            if method == "POST":
+                raise HTTPError(HTTPStatus.LENGTH_REQUIRED)
+            return b""
+        length = parse_int(headers["content-length"], "Content-Length")
+        if length < 0:
+            raise HTTPError(HTTPStatus.BAD_REQUEST)
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        body = await reader.readexactly(length)
+        return body if method == "POST" else b""
+
+    async def send(self, writer, status, headers, payload, keep_alive=True, head_only=False):
+        headers = dict(headers)
+        if status != HTTPStatus.NOT_MODIFIED:
+            headers["Content-Type"] = "application/json; charset=utf-8"
+        headers["Content-Length"] = str(len(payload))
+        if not keep_alive:
+            headers["Connection"] = "close"
+        writer.write(response_head(status, headers) + (b"" if head_only else payload))
+        await writer.drain()
+
+    async def dispatch(self, method, target, headers, body):
+        """(status, headers, payload) for every request but /export."""
+        url = urlsplit(target)
+        path = url.path.rstrip("/") or "/"
+        params = parse_qs(url.query)
+        if method == "POST":
+            if path != "/snippets":
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED if path == "/search" else HTTPStatus.NOT_FOUND)
+            return await self.insert(body)
+        if method not in ("GET", "HEAD"):
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+        generation = self.current_generation()
+        etag = f'"{self.instance}-{generation}"'
+        if etag in (tag.strip() for tag in headers.get("if-none-match", "").split(",")):
+            return HTTPStatus.NOT_MODIFIED, {"ETag": etag}, b""
+        cached = self._cache.get(target)
+        if cached is not None:
+            self._cache.move_to_end(target)
+            return HTTPStatus.OK, {"ETag": etag}, cached
+        if path == "/search":
+            tags = [tag for value in params.get("tags", ()) for tag in value.split(",") if tag.strip()]
+            limit = parse_int(params["limit"][0], "limit") if "limit" in params else DEFAULT_LIMIT
+            limit = min(max(limit, 1), MAX_LIMIT)
+            payload = encode_json(await self.read(
+                self.search, params.get("q", [""])[0], tags, params.get("all", ["0"])[0] in ("1", "true"), limit
+            ))
+        elif path == "/snippets" and "ids" in params:
+            try:
+                ids = [int(part) for value in params["ids"] for part in value.split(",") if part.strip()]
+            except ValueError:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "ids must be integers") from None
+            payload = encode_json(await self.read(SnippetStore.get_many, ids))
+        elif path.startswith("/snippets/"):
+            snippet = await self.read(SnippetStore.get, parse_int(path[len("/snippets/"):], "id"))
+            if snippet is None:
+                raise HTTPError(HTTPStatus.NOT_FOUND, "No such snippet")
+            payload = encode_json(snippet)
+        else:
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+        # A commit seen meanwhile may already be in the result; don't cache it under the new version
+        if self.generation == generation:
+            self._cache[target] = payload
+            if len(self._cache) > CACHE_ENTRIES:
+                self._cache.popitem(last=False)
+        return HTTPStatus.OK, {"ETag": etag}, payload
+
+    @staticmethod
+    def search(store, query, tags, match_all, limit):
+        rows, has_more = store.page(store.list_query(query, tags, match_all), limit=limit)
+        return {
+            "results": [dict(zip(LIST_COLUMNS, row)) for row in rows],
+            "has_more": has_more,
+        }
+
+    async def insert(self, body):
+        try:
+            snippet = json.loads(body)
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Body must be a JSON object") from None
+        if not isinstance(snippet, dict) or not all(
+                isinstance(snippet.get(key), str) and snippet[key].strip() for key in ("title", "code")):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "title and code are required")
+        snippet_id = await self.write(insert_snippet, snippet)
+        if self.on_change:
+            self.on_change(snippet_id)
+        return HTTPStatus.CREATED, {"Location": f"/snippets/{snippet_id}"}, encode_json({"id": snippet_id})
+
+    async def export(self, writer, head_only=False):
+        # Streamed in chunks from its own connection, so a long export holds no pooled reader
+        writer.write(response_head(HTTPStatus.OK, {
+            "Content-Type": "application/x-ndjson; charset=utf-8", "Transfer-Encoding": "chunked",
+        }))
+        if head_only:
+            await writer.drain()
+            return
+        store = await self._loop.run_in_executor(
+            self._readers, lambda: SnippetStore(self.db_path, readonly=True, check_same_thread=False)
+        )
+        snippets = store.iter_all(EXPORT_BATCH)
+
+        def next_chunk():
+            records = itertools.islice(snippets, EXPORT_BATCH)
+            return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+        try:
+            while True:
+                chunk = await self._loop.run_in_executor(self._readers, next_chunk)
+                writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                await writer.drain()
+                if not chunk:
+                    break
+        finally:
+            snippets.close()
+            store.close()
@@ -0,0 +1,312 @@
+"""Near-duplicate detection with MinHash signatures and LSH banding.
+
+Each snippet's code is reduced to a set of token shingles and summarized by a
+MinHash signature, whose matching positions estimate the Jaccard similarity
+of two snippets. Signatures are split into bands; snippets sharing any band
+bucket become candidates, so finding similar snippets never compares against
+the whole library. Signatures live in the database next to the snippets and
+are only recomputed for rows whose content hash or last_modified changed.
+
+NumPy vectorizes the hashing when it is installed; the pure Python fallback
+produces identical signatures.
+"""
+import hashlib
+import multiprocessing
+import os
+import random
+import re
+import zlib
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from transfer import TransferCancelled
+
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+SHINGLE_SIZE = 5
+# Mersenne prime for the hash family; a * x + b stays below 2**63, so NumPy's
+# uint64 arithmetic never overflows
+PRIME = (1 << 31) - 1
+SEED = 0x5EED
+# Below this many stale rows, starting worker processes costs more than it saves
+POOL_MIN_ROWS = 2000
+CHUNK_ROWS = 500
+
+_rng = random.Random(SEED)
+COEFFICIENTS = [(_rng.randrange(1, PRIME), _rng.randrange(PRIME)) for _ in range(NUM_PERM)]
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def shingles(code):
+    """Hashes of every run of SHINGLE_SIZE code tokens, so whitespace and
+    layout changes don't affect them."""
+    tokens = TOKEN_RE.findall(code)
+    if len(tokens) <= SHINGLE_SIZE:
+        return {zlib.crc32(" ".join(tokens).encode("utf-8", "surrogatepass"))}
+    return {
+        zlib.crc32(" ".join(tokens[i:i + SHINGLE_SIZE]).encode("utf-8", "surrogatepass"))
+        for i in range(len(tokens) - SHINGLE_SIZE + 1)
+    }
+
+
+def signature(code):
+    """MinHash signature of code as a tuple of NUM_PERM ints."""
+    values = [value % PRIME for value in shingles(code)]
+    if numpy is not None:
+        x = numpy.array(values, dtype=numpy.uint64)[:, None]
+        a = numpy.array([a for a, _ in COEFFICIENTS], dtype=numpy.uint64)
+        b = numpy.array([b for _, b in COEFFICIENTS], dtype=numpy.uint64)
+        return tuple(int(v) for v in ((a * x + b) % PRIME).min(axis=0))
+    return tuple(min((a * x + b) % PRIME for x in values) for a, b in COEFFICIENTS)
+
+
+def band_buckets(sig):
+    """(band, bucket) keys of a signature for the LSH table."""
+    keys = []
+    for band in range(BANDS):
+        rows = array("I", sig[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]).tobytes()
+        bucket = int.from_bytes(hashlib.blake2b(rows, digest_size=8).digest(), "little", signed=True)
+        keys.append((band, bucket))
+    return keys
+
+
+def similarity(sig1, sig2):
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return sum(1 for a, b in zip(sig1, sig2) if a == b) / NUM_PERM
+
+
+def pack(sig):
+    return array("I", sig).tobytes()
+
+
+def unpack(blob):
+    return tuple(array("I", blob))
+
+
+def spawn_pool(workers=None):
+    """A process pool for the background jobs. Spawn rather than fork: the GUI
+    runs those jobs on a thread next to Tk, which a forked child would inherit."""
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def bounded_map(pool, func, tasks, workers=None):
+    """pool.map(func, tasks) that draws tasks lazily, keeping at most two per
+    worker in flight, so the tasks never all sit in memory at once."""
+    limit = 2 * (workers or os.cpu_count() or 1)
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.submit(func, task))
+        if len(pending) >= limit:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def compute_rows(rows):
+    """(id, content_hash, last_modified, signature blob, buckets) for
+    (id, code, content_hash, last_modified) rows.
+    Top-level so worker processes can run it."""
+    results = []
+    for snippet_id, code, content_hash, last_modified in rows:
+        sig = signature(code)
+        results.append((snippet_id, content_hash, last_modified, pack(sig), band_buckets(sig)))
+    return results
+
+
+def similar_pairs(task):
+    """Pairs of snippet ids in the same bucket whose signatures pass threshold.
+    task is (buckets of ids, {id: packed signature}, threshold); top-level so
+    worker processes can run it. Pairs already linked through earlier pairs
+    of the task are skipped, which is all single linkage needs."""
+    buckets, blobs, threshold = task
+    signatures = {snippet_id: unpack(blob) for snippet_id, blob in blobs.items()}
+    linked = DisjointSet()
+    pairs = []
+    for ids in buckets:
+        for i, a in enumerate(ids):
+            for b in ids[i + 1:]:
+                if linked.find(a) == linked.find(b):
+                    continue
+                if similarity(signatures[a], signatures[b]) >= threshold:
+                    linked.union(a, b)
+                    pairs.append((a, b))
+    return pairs
+
+
+class DisjointSet:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        parent = self.parent.setdefault(item, item)
+        if parent != item:
+            parent = self.parent[item] = self.find(parent)
+        return parent
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+
+# Snippets without a current signature. last_modified alone has one-second
+# resolution, so two saves within a second are told apart by content_hash;
+# last_modified still catches code edits by clients that don't set the hash.
+STALE_ROWS = """
+    FROM snippets s
+    LEFT JOIN snippet_signatures g ON g.snippet_id = s.id
+    WHERE g.snippet_id IS NULL OR g.content_hash IS NOT s.content_hash OR g.last_modified IS NOT s.last_modified
+"""
+
+
+class SimilarityIndex:
+    """Signature and LSH tables of one SnippetStore (which must be writable)."""
+
+    def __init__(self, store):
+        self.store = store
+        self.conn = store.conn
+
+    def stale_count(self):
+        return self.conn.execute(f"SELECT COUNT(*) {STALE_ROWS}").fetchone()[0]
+
+    def refresh(self, progress=None, cancel=None, workers=None):
+        """Recompute signatures of new and changed snippets; returns how many."""
+        stale = [row[0] for row in self.conn.execute(f"SELECT s.id {STALE_ROWS}")]
+        if not stale:
+            return 0
+        # Code is read one chunk at a time, as the workers ask for it
+        chunks = (self._code_rows(stale[start:start + CHUNK_ROWS]) for start in range(0, len(stale), CHUNK_ROWS))
+        done = 0
+        if len(stale) < POOL_MIN_ROWS:
+            results = map(compute_rows, chunks)
+            pool = None
+        else:
+            pool = spawn_pool(workers)
+            results = bounded_map(pool, compute_rows, chunks, workers)
+        try:
+            for computed in results:
+                self._store_signatures(computed)
+                done += len(computed)
+                if cancel is not None and cancel.is_set():
+                    raise TransferCancelled()
+                if progress:
+                    progress(done, len(stale))
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        return done
+
+    def _code_rows(self, snippet_ids):
+        return self.conn.execute(
+            "SELECT id, decompress_code(code, codec), content_hash, last_modified FROM snippets "
+            f"WHERE id IN ({', '.join('?' * len(snippet_ids))})",
+            snippet_ids
+        ).fetchall()
+
+    def _store_signatures(self, computed):
+        ids = [(row[0],) for row in computed]
+        self.conn.executemany("DELETE FROM snippet_lsh WHERE snippet_id=?", ids)
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO snippet_signatures(snippet_id, content_hash, last_modified, signature) "
+            "VALUES (?, ?, ?, ?)",
+            [row[:4] for row in computed]
+        )
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO snippet_lsh(band, bucket, snippet_id) VALUES (?, ?, ?)",
+            [(band, bucket, row[0]) for row in computed for band, bucket in row[4]]
+        )
+        self.conn.commit()
+
+    def signatures(self, snippet_ids):
+        snippet_ids = list(snippet_ids)
+        found = {}
+        for start in range(0, len(snippet_ids), CHUNK_ROWS):
+            chunk = snippet_ids[start:start + CHUNK_ROWS]
+            found.update(
+                (snippet_id, unpack(blob)) for snippet_id, blob in self.conn.execute(
+                    f"SELECT snippet_id, signature FROM snippet_signatures WHERE snippet_id IN ({', '.join('?' * len(chunk))})",
+                    chunk
+                )
+            )
+        return found
+
+    def similar(self, snippet_id, threshold=0.5, limit=20):
+        """[(similarity, id, title)] of snippets resembling snippet_id, best first."""
+        candidates = [row[0] for row in self.conn.execute("""
+            SELECT DISTINCT other.snippet_id
+            FROM snippet_lsh own
+            JOIN snippet_lsh other ON other.band = own.band AND other.bucket = own.bucket
+            WHERE own.snippet_id = ? AND other.snippet_id != own.snippet_id
+        """, (snippet_id,))]
+        signatures = self.signatures([snippet_id] + candidates)
+        if snippet_id not in signatures:
+            return []
+        own = signatures[snippet_id]
+        scored = sorted(
+            ((similarity(own, signatures[other]), other) for other in candidates if other in signatures),
+            key=lambda item: (-item[0], item[1])
+        )
+        scored = [(score, other) for score, other in scored if score >= threshold][:limit]
+        titles = {snippet["id"]: snippet["title"] for snippet in self.store.get_many(other for _, other in scored)}
+        return [(score, other, titles.get(other, "")) for score, other in scored]
+
+    def duplicate_clusters(self, threshold=0.8, workers=None):
+        """Groups of two or more snippet ids whose signatures pass threshold
+        pairwise-linked (single linkage), largest first. Buckets are compared
+        in a process pool on large libraries."""
+        clusters = DisjointSet()
+        tasks = self._bucket_tasks(threshold)
+        pool = None
+        if self.conn.execute("SELECT COUNT(*) FROM snippet_signatures").fetchone()[0] < POOL_MIN_ROWS:
+            results = map(similar_pairs, tasks)
+        else:
+            pool = spawn_pool(workers)
+            results = bounded_map(pool, similar_pairs, tasks, workers)
+        try:
+            for pairs in results:
+                for a, b in pairs:
+                    clusters.union(a, b)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        groups = {}
+        for snippet_id in list(clusters.parent):
+            groups.setdefault(clusters.find(snippet_id), []).append(snippet_id)
+        return sorted((sorted(group) for group in groups.values() if len(group) > 1), key=lambda g: (-len(g), g[0]))
+
+    def _bucket_tasks(self, threshold):
+        # Shared buckets batched to about CHUNK_ROWS members, each batch with
+        # the packed signatures it needs
+        buckets = self.conn.execute("""
+            SELECT group_concat(snippet_id) FROM snippet_lsh
+            GROUP BY band, bucket HAVING COUNT(*) > 1
+        """)
+        batch, members = [], set()
+
+        def task():
+            ids = list(members)
+            blobs = {}
+            for start in range(0, len(ids), CHUNK_ROWS):
+                chunk = ids[start:start + CHUNK_ROWS]
+                blobs.update(self.conn.execute(
+                    f"SELECT snippet_id, signature FROM snippet_signatures WHERE snippet_id IN ({', '.join('?' * len(chunk))})",
+                    chunk
+                ))
+            return [[snippet_id for snippet_id in ids if snippet_id in blobs] for ids in batch], blobs, threshold
+
+        for (group,) in buckets:
+            ids = sorted(int(member) for member in group.split(","))
+            batch.append(ids)
+            members.update(ids)
+            if len(members) >= CHUNK_ROWS:
+                yield task()
+                batch, members = [], set()
+        if batch:
+            yield task()
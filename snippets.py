@@ -0,0 +1,218 @@
+"""Command-line access to the snippet library.
+
+    python snippets.py search QUERY [--limit N] [--json]
+    python snippets.py get ID [ID ...] [--json]
+    python snippets.py add --title TITLE [--language LANG] [--tags TAGS] [FILE]
+    python snippets.py export PATH
+    python snippets.py import PATH [--mode merge|upsert]
+    python snippets.py ingest DIR [--tags TAGS] [--no-split] [--ignore PATTERN ...]
+    python snippets.py similar ID [--threshold T]
+    python snippets.py duplicates [--threshold T] [--json]
+    python snippets.py serve [--host HOST] [--port N | --socket PATH] [--readers N]
+
+Built on SnippetStore only, so it starts without importing Tk or Pygments.
+"""
+import argparse
+import json
+import sys
+
+from store import DB_PATH, IMPORT_MODES, DuplicateSnippetError, SnippetStore
+
+
+def print_json(value):
+    json.dump(value, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+
+
+def cmd_search(store, args):
+    results = store.search(" ".join(args.query), limit=args.limit)
+    if args.json:
+        print_json(results)
+        return 0
+    for result in results:
+        fav = "*" if result["favorite"] else " "
+        print(f"{result['id']}\t{fav}\t{result['language']}\t{result['title']}")
+    return 0
+
+
+def cmd_get(store, args):
+    snippets = store.get_many(args.ids)
+    if args.json:
+        print_json(snippets if len(args.ids) > 1 else (snippets[0] if snippets else None))
+    else:
+        for snippet in snippets:
+            sys.stdout.write(snippet["code"])
+            if not snippet["code"].endswith("\n"):
+                sys.stdout.write("\n")
+    return 0 if len(snippets) == len(args.ids) else 1
+
+
+def cmd_add(store, args):
+    if args.file and args.file != "-":
+        with open(args.file, encoding="utf-8") as file:
+            code = file.read()
+    else:
+        code = sys.stdin.read()
+    code = code.strip()
+    if not code:
+        print("error: no code given", file=sys.stderr)
+        return 2
+    language = args.language
+    if not language:
+        from langdetect import LanguageDetector
+        detector = LanguageDetector(store.path)
+        language = detector.detect(code, args.file or args.title)
+        detector.close()
+    try:
+        snippet_id = store.save(None, args.title, code, language, args.tags, args.description)
+    except DuplicateSnippetError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    print(snippet_id)
+    return 0
+
+
+def cmd_export(store, args):
+    import transfer
+    count = transfer.export_snippets(store, args.path)
+    print(f"{count} snippets exported", file=sys.stderr)
+    return 0
+
+
+def cmd_import(store, args):
+    import transfer
+    counts = transfer.import_snippets(store, args.path, mode=args.mode)
+    print(f"{counts['inserted']} added, {counts['updated']} updated, {counts['skipped']} skipped", file=sys.stderr)
+    return 0
+
+
+def cmd_ingest(store, args):
+    import ingest
+
+    def progress(done, total):
+        print(f"\r{done}/{total} files", end="", file=sys.stderr, flush=True)
+    counts = ingest.ingest_tree(
+        store, args.path, tags=args.tags, split=not args.no_split,
+        ignore=ingest.DEFAULT_IGNORE + tuple(args.ignore),
+        extensions=None if args.all_files else ingest.DEFAULT_EXTENSIONS,
+        max_size=args.max_size * 1024, workers=args.workers, progress=progress,
+    )
+    print(
+        f"\n{counts['files']} files ({counts['unchanged']} unchanged, {counts['failed']} unreadable): "
+        f"{counts['inserted']} added, {counts['skipped']} skipped, {counts['removed']} removed from changed files",
+        file=sys.stderr
+    )
+    return 0
+
+
+def cmd_similar(store, args):
+    from similarity import SimilarityIndex
+    index = SimilarityIndex(store)
+    index.refresh()
+    for score, snippet_id, title in index.similar(args.id, threshold=args.threshold, limit=args.limit):
+        print(f"{score:.2f}\t{snippet_id}\t{title}")
+    return 0
+
+
+def cmd_duplicates(store, args):
+    from similarity import SimilarityIndex
+    index = SimilarityIndex(store)
+    index.refresh()
+    clusters = index.duplicate_clusters(threshold=args.threshold)
+    if args.json:
+        print_json(clusters)
+    else:
+        for cluster in clusters:
+            print(" ".join(map(str, cluster)))
+    print(f"{len(clusters)} clusters", file=sys.stderr)
+    return 0
+
+
+def cmd_serve(store, args):
+    from server import SnippetServer
+    options = {"host": args.host, "port": args.port, "socket_path": args.socket, "readers": args.readers}
+    server = SnippetServer(store.path, **{name: value for name, value in options.items() if value is not None})
+    try:
+        server.run(lambda: print(f"Serving on {server.address}", file=sys.stderr))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="snippets", description="Query and manage the snippet library.")
+    parser.add_argument("--db", default=DB_PATH, help="database file (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    search = commands.add_parser("search", help="full-text search")
+    search.add_argument("query", nargs="*")
+    search.add_argument("--limit", type=int, default=50)
+    search.add_argument("--json", action="store_true")
+    search.set_defaults(func=cmd_search)
+
+    get = commands.add_parser("get", help="print snippets by id")
+    get.add_argument("ids", nargs="+", type=int)
+    get.add_argument("--json", action="store_true", help="print all fields instead of just the code")
+    get.set_defaults(func=cmd_get)
+
+    add = commands.add_parser("add", help="add a snippet from a file or stdin")
+    add.add_argument("file", nargs="?", help="file with the code (default: stdin)")
+    add.add_argument("--title", required=True)
+    add.add_argument("--language", help="detected when omitted")
+    add.add_argument("--tags", default="")
+    add.add_argument("--description", default="")
+    add.set_defaults(func=cmd_add)
+
+    export = commands.add_parser("export", help="export all snippets (.json, .jsonl, optionally .gz/.zst)")
+    export.add_argument("path")
+    export.set_defaults(func=cmd_export)
+
+    import_ = commands.add_parser("import", help="import snippets exported by the app or the CLI")
+    import_.add_argument("path")
+    import_.add_argument("--mode", choices=IMPORT_MODES, default="merge")
+    import_.set_defaults(func=cmd_import)
+
+    ingest = commands.add_parser("ingest", help="add functions and classes from a source tree")
+    ingest.add_argument("path")
+    ingest.add_argument("--tags", default="")
+    ingest.add_argument("--no-split", action="store_true", help="one snippet per file")
+    ingest.add_argument("--ignore", action="append", default=[], metavar="PATTERN",
+                        help="extra name or path pattern to skip (repeatable)")
+    ingest.add_argument("--all-files", action="store_true", help="not just known source extensions")
+    ingest.add_argument("--max-size", type=int, default=256, metavar="KB")
+    ingest.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    ingest.set_defaults(func=cmd_ingest)
+
+    similar = commands.add_parser("similar", help="list snippets similar to one snippet")
+    similar.add_argument("id", type=int)
+    similar.add_argument("--threshold", type=float, default=0.5)
+    similar.add_argument("--limit", type=int, default=20)
+    similar.set_defaults(func=cmd_similar)
+
+    duplicates = commands.add_parser("duplicates", help="report clusters of near-duplicate snippets")
+    duplicates.add_argument("--threshold", type=float, default=0.8)
+    duplicates.add_argument("--json", action="store_true")
+    duplicates.set_defaults(func=cmd_duplicates)
+
+    serve = commands.add_parser("serve", help="serve the local JSON API for editors and scripts")
+    serve.add_argument("--host", help="default: 127.0.0.1")
+    serve.add_argument("--port", type=int, help="default: 8765")
+    serve.add_argument("--socket", metavar="PATH", help="listen on a Unix socket instead of host and port")
+    serve.add_argument("--readers", type=int, help="read connections (default: 4)")
+    serve.set_defaults(func=cmd_serve)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    store = SnippetStore(args.db)
+    for note in store.migration_notes:
+        print(note, file=sys.stderr)
+    try:
+        return args.func(store, args)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
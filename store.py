@@ -0,0 +1,360 @@
+"""UI-free data access for the snippet library.
+
+Only the standard library and the schema module are imported here, so
+command-line tools can use the store without loading Tk or Pygments.
+"""
+import sqlite3
+from datetime import datetime
+
+import schema
+
+DB_PATH = "snippets.db"
+
+# Column weights for bm25(): title, tags, language, description, code
+FTS_WEIGHTS = (10.0, 5.0, 3.0, 2.0, 1.0)
+
+SNIPPET_COLUMNS = (
+    "id", "title", "code", "language", "tags", "description",
+    "favorite", "created_at", "last_modified",
+)
+# Code may be stored compressed (see schema.encode_code); reads decompress in SQL
+SNIPPET_SELECT = ", ".join("decompress_code(code, codec)" if column == "code" else column for column in SNIPPET_COLUMNS)
+LIST_COLUMNS = ("id", "title", "language", "tags", "modified", "favorite", "match", "size")
+
+# merge: add new snippets, skip ones already in the library
+# upsert: like merge, but also update existing snippets the file has a newer copy of
+IMPORT_MODES = ("merge", "upsert")
+# Keeps IN (...) lists under SQLite's bound-parameter limit
+MAX_PARAMS = 500
+
+
+# The Match cell: the best-matching excerpt, with newlines flattened for the
+# Treeview. The search index holds its own copy of the text, so excerpts
+# never read (or decompress) snippets.code.
+MATCH_EXCERPT = "replace(replace(snippet(snippets_fts, -1, '[', ']', '…', 8), char(13), ''), char(10), ' ')"
+
+
+def build_fts_query(text):
+    # Quote every term so user input can't inject FTS5 syntax, and prefix-match each one
+    terms = [term.replace('"', '""') for term in text.split()]
+    return " ".join(f'"{term}"*' for term in terms if term)
+
+
+def tag_filter(column, tags, match_all=False):
+    """SQL condition (and params) restricting column, a snippet id, to snippets
+    carrying any (or with match_all, every one) of the given tag names."""
+    names = list(dict.fromkeys(name.lower() for name in tags))
+    placeholders = ", ".join("?" * len(names))
+    sql = f"""{column} IN (
+        SELECT snippet_id FROM snippet_tags
+        WHERE tag_id IN (SELECT id FROM tags WHERE name IN ({placeholders}))"""
+    if match_all and len(names) > 1:
+        return sql + " GROUP BY snippet_id HAVING COUNT(*) = ?)", tuple(names) + (len(names),)
+    return sql + ")", tuple(names)
+
+
+def now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+class DuplicateSnippetError(Exception):
+    def __init__(self, title):
+        super().__init__(f"An identical snippet already exists: {title}")
+        self.title = title
+
+
+class SnippetStore:
+    def __init__(self, path=DB_PATH, readonly=False, check_same_thread=True, factory=sqlite3.Connection):
+        """With readonly=True the database must already exist and be migrated
+        (by a writable store); such a store can only list, search and read.
+        factory is the sqlite3.Connection class to use, e.g. to time statements."""
+        self.path = path
+        self.readonly = readonly
+        self.conn = schema.connect(path, readonly, check_same_thread, factory)
+        # Messages from migrations that changed the user's data, to be shown once
+        self.migration_notes = [] if readonly else schema.migrate(self.conn)
+        self.fts_enabled = schema.has_search_index(self.conn)
+
+    def close(self):
+        if not self.readonly:
+            self.conn.execute("PRAGMA optimize")
+        self.conn.close()
+
+    def commit(self):
+        self.conn.commit()
+
+    # Listing and search. A list query is an (sql, params) pair whose rows are
+    # LIST_COLUMNS followed by the sort key (k1, k2, k3), ordered descending.
+
+    def list_query(self, query="", tags=(), match_all=False):
+        query = query.strip()
+        match = build_fts_query(query) if self.fts_enabled else ""
+        conditions, params = [], ()
+        if tags:
+            condition, params = tag_filter("s.id" if match else "id", tags, match_all)
+            conditions.append(condition)
+        if match:
+            sql = f"""
+                SELECT
+                    s.id,
+                    s.title,
+                    s.language,
+                    s.tags,
+                    COALESCE(strftime('%Y-%m-%d', s.last_modified), 'N/A') as modified_date,
+                    s.favorite,
+                    {MATCH_EXCERPT} as match,
+                    s.code_size,
+                    s.favorite as k1,
+                    -bm25(snippets_fts, {", ".join(map(str, FTS_WEIGHTS))}) as k2,
+                    s.id as k3
+                FROM snippets_fts
+                JOIN snippets s ON s.id = snippets_fts.rowid
+                WHERE snippets_fts MATCH ?
+            """
+            return sql + "".join(f" AND {condition}" for condition in conditions), (match,) + params
+        sql = """
+            SELECT
+                id,
+                title,
+                language,
+                tags,
+                COALESCE(strftime('%Y-%m-%d', last_modified), 'N/A') as modified_date,
+                favorite,
+                preview as match,
+                code_size,
+                favorite as k1,
+                last_modified as k2,
+                id as k3
+            FROM snippets
+        """
+        if query and not self.fts_enabled:
+            conditions.insert(0, "(title LIKE ? OR tags LIKE ? OR language LIKE ?)")
+            params = (f"%{query}%",) * 3 + params
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        return sql, params
+
+    def page(self, list_query, after=None, before=None, limit=100):
+        """Keyset-paginated rows of list_query; returns (rows, has_more)."""
+        sql, params = list_query
+        order = "DESC"
+        if after is not None:
+            sql, params = f"SELECT * FROM ({sql}) WHERE (k1, k2, k3) < (?, ?, ?)", params + tuple(after)
+        elif before is not None:
+            sql, params = f"SELECT * FROM ({sql}) WHERE (k1, k2, k3) > (?, ?, ?)", params + tuple(before)
+            order = "ASC"
+        rows = self.conn.execute(
+            f"{sql} ORDER BY k1 {order}, k2 {order}, k3 {order} LIMIT ?", params + (limit + 1,)
+        ).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if before is not None:
+            rows.reverse()
+        return rows, has_more
+
+    def list_row(self, list_query, snippet_id):
+        """The row list_query yields for one snippet, or None if it doesn't match."""
+        sql, params = list_query
+        return self.conn.execute(f"SELECT * FROM ({sql}) WHERE k3 = ?", params + (snippet_id,)).fetchone()
+
+    def search(self, query, limit=50):
+        rows, _ = self.page(self.list_query(query), limit=limit)
+        return [dict(zip(LIST_COLUMNS, row)) for row in rows]
+
+    # Single snippets
+
+    def get(self, snippet_id):
+        snippets = self.get_many([snippet_id])
+        return snippets[0] if snippets else None
+
+    def get_many(self, snippet_ids):
+        """Snippets as dicts, in the order of snippet_ids (missing ids are skipped)."""
+        snippet_ids = list(snippet_ids)
+        found = {}
+        for start in range(0, len(snippet_ids), MAX_PARAMS):
+            chunk = snippet_ids[start:start + MAX_PARAMS]
+            for row in self.conn.execute(
+                f"SELECT {SNIPPET_SELECT} FROM snippets WHERE id IN ({', '.join('?' * len(chunk))})",
+                chunk
+            ):
+                found[row[0]] = dict(zip(SNIPPET_COLUMNS, row))
+        return [found[snippet_id] for snippet_id in snippet_ids if snippet_id in found]
+
+    def save(self, snippet_id, title, code, language, tags, description):
+        """Insert (snippet_id None) or update a snippet; returns its id."""
+        current_time = now()
+        content_hash = schema.snippet_hash(code, language)
+        stored = schema.encode_code(code)
+        try:
+            if snippet_id is not None:
+                self.conn.execute("""
+                    UPDATE snippets
+                    SET title=?, code=?, codec=?, code_size=?, preview=?, language=?, tags=?,
+                        description=?, last_modified=?, content_hash=?
+                    WHERE id=?
+                """, (title, *stored, language, tags, description, current_time, content_hash, snippet_id))
+            else:
+                snippet_id = self.conn.execute("""
+                    INSERT INTO snippets (
+                        title, code, codec, code_size, preview, language, tags, description,
+                        created_at, last_modified, content_hash
+                    )
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (title, *stored, language, tags, description, current_time, current_time,
+                      content_hash)).lastrowid
+        except sqlite3.IntegrityError:
+            self.conn.rollback()
+            duplicate = self.conn.execute(
+                "SELECT title FROM snippets WHERE content_hash=?", (content_hash,)
+            ).fetchone()
+            raise DuplicateSnippetError(duplicate[0] if duplicate else title)
+        except sqlite3.OperationalError:
+            self.conn.rollback()
+            raise
+        if self.fts_enabled and stored[1]:
+            schema.index_code(self.conn, [(code, snippet_id)])
+        self._link_tags([(content_hash, tags)], clear=True)
+        self.conn.commit()
+        return snippet_id
+
+    def delete(self, snippet_id):
+        self._write("DELETE FROM snippets WHERE id=?", (snippet_id,))
+
+    def toggle_favorite(self, snippet_id):
+        self._write("UPDATE snippets SET favorite = 1 - COALESCE(favorite, 0) WHERE id=?", (snippet_id,))
+
+    def _write(self, sql, params):
+        try:
+            self.conn.execute(sql, params)
+        except sqlite3.OperationalError:
+            # Typically "database is locked" while an import holds the write lock;
+            # don't leave a transaction open that would pin an old snapshot
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+
+    def _index_compressed_code(self, compressed):
+        # compressed: {content_hash: code} of compressed rows just written
+        hashes = list(compressed)
+        for start in range(0, len(hashes), MAX_PARAMS):
+            chunk = hashes[start:start + MAX_PARAMS]
+            ids = self.conn.execute(
+                f"SELECT id, content_hash FROM snippets WHERE content_hash IN ({', '.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            schema.index_code(self.conn, [(compressed[content_hash], snippet_id) for snippet_id, content_hash in ids])
+
+    def _link_tags(self, tagged, clear=False):
+        # tagged: (content_hash, tags) pairs; clear drops the snippets' old links first.
+        # The snippet_tags triggers keep tags.snippet_count in step.
+        if clear:
+            self.conn.executemany(
+                "DELETE FROM snippet_tags WHERE snippet_id = (SELECT id FROM snippets WHERE content_hash=?)",
+                [(content_hash,) for content_hash, _ in tagged]
+            )
+        links = [(content_hash, name) for content_hash, tags in tagged for name in schema.split_tags(tags)]
+        if not links:
+            return
+        self.conn.executemany("INSERT OR IGNORE INTO tags(name) VALUES (?)", {(name,) for _, name in links})
+        self.conn.executemany("""
+            INSERT OR IGNORE INTO snippet_tags(snippet_id, tag_id)
+            SELECT s.id, t.id FROM snippets s, tags t WHERE s.content_hash=? AND t.name=?
+        """, links)
+
+    # Tags
+
+    def tag_counts(self):
+        """(name, snippet_count) of every tag in use, most used first."""
+        return self.conn.execute(
+            "SELECT name, snippet_count FROM tags WHERE snippet_count > 0 ORDER BY snippet_count DESC, name"
+        ).fetchall()
+
+    # Bulk access
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM snippets").fetchone()[0]
+
+    def iter_all(self, batch_size=1000):
+        """Yield every snippet as a dict, streaming from the cursor."""
+        cursor = self.conn.execute(f"SELECT {SNIPPET_SELECT} FROM snippets ORDER BY id")
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                for row in rows:
+                    yield dict(zip(SNIPPET_COLUMNS, row))
+        finally:
+            cursor.close()
+
+    def upsert_many(self, snippets, mode="merge", commit=True):
+        """Add snippet dicts, deduplicating on content hash; see IMPORT_MODES.
+
+        Returns a dict of inserted/updated/skipped counts. With commit=False the
+        caller owns the transaction, so several batches can share one.
+        """
+        if mode not in IMPORT_MODES:
+            raise ValueError(f"Unknown import mode: {mode}")
+        current_time = now()
+        rows = [(
+            snippet['title'], snippet['code'], snippet['language'],
+            snippet['tags'], snippet.get('description', ''), snippet.get('favorite', 0),
+            snippet.get('created_at') or current_time,
+            snippet.get('last_modified') or current_time,
+            schema.snippet_hash(snippet['code'], snippet['language']),
+        ) for snippet in snippets]
+        # One lookup per batch decides which rows are new, newer or already present
+        existing = {}
+        hashes = list({row[8] for row in rows})
+        for start in range(0, len(hashes), MAX_PARAMS):
+            chunk = hashes[start:start + MAX_PARAMS]
+            existing.update(self.conn.execute(
+                f"SELECT content_hash, last_modified FROM snippets WHERE content_hash IN ({', '.join('?' * len(chunk))})",
+                chunk
+            ))
+        counts = {"inserted": 0, "updated": 0, "skipped": 0}
+        inserts, updates = [], []
+        inserted_tags, updated_tags = [], []
+        # content_hash: code of the rows stored compressed, for the search index
+        compressed = {}
+        for row in rows:
+            last_modified, content_hash = row[7], row[8]
+            # Compress only what is actually written
+            if content_hash not in existing:
+                stored = schema.encode_code(row[1])
+                inserts.append((row[0], *stored, *row[2:]))
+                inserted_tags.append((content_hash, row[3]))
+                existing[content_hash] = last_modified
+            elif mode == "upsert" and last_modified > (existing[content_hash] or ""):
+                title, code, _, tags, description, favorite = row[:6]
+                stored = schema.encode_code(code)
+                updates.append((title, *stored, tags, description, favorite, last_modified, content_hash))
+                updated_tags.append((content_hash, tags))
+                existing[content_hash] = last_modified
+            else:
+                counts["skipped"] += 1
+                continue
+            if stored[1]:
+                compressed[content_hash] = row[1]
+        if inserts:
+            self.conn.executemany("""
+                INSERT INTO snippets (
+                    title, code, codec, code_size, preview, language, tags, description,
+                    favorite, created_at, last_modified, content_hash
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, inserts)
+        if updates:
+            self.conn.executemany("""
+                UPDATE snippets
+                SET title=?, code=?, codec=?, code_size=?, preview=?, tags=?, description=?,
+                    favorite=?, last_modified=?
+                WHERE content_hash=?
+            """, updates)
+        if compressed and self.fts_enabled:
+            self._index_compressed_code(compressed)
+        self._link_tags(inserted_tags)
+        self._link_tags(updated_tags, clear=True)
+        counts["inserted"] = len(inserts)
+        counts["updated"] = len(updates)
+        if commit:
+            self.conn.commit()
+        return counts
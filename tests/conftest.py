@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the repository root rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from store import SnippetStore  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "snippets.db")
+
+
+@pytest.fixture
+def store(db_path):
+    store = SnippetStore(db_path)
+    yield store
+    store.close()
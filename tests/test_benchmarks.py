@@ -0,0 +1,54 @@
+import json
+
+from benchmarks import corpus, run
+
+
+def test_corpus_is_reproducible():
+    first = list(corpus.generate(50, seed=1))
+    assert first == list(corpus.generate(50, seed=1))
+    assert first != list(corpus.generate(50, seed=2))
+
+
+def test_compare_flags_slower_medians_only():
+    baseline = {"results": {
+        "fast": {"median": 0.010},
+        "slow": {"median": 0.010},
+        "tiny": {"median": 0.0001},
+        "skipped": {"skipped": "no display"},
+    }}
+    results = {
+        "fast": {"median": 0.011},
+        "slow": {"median": 0.020},
+        # Slower by far, but under the noise floor
+        "tiny": {"median": 0.0005},
+        "skipped": {"median": 1.0},
+        "new": {"median": 1.0},
+    }
+    assert run.compare(results, baseline, 0.2) == [("slow", 0.010, 0.020, 2.0)]
+    assert run.compare(results, baseline, 1.5) == []
+
+
+def rewrite_medians(path, median):
+    with open(path, encoding="utf-8") as file:
+        report = json.load(file)
+    for stats in report["results"].values():
+        stats["median"] = median
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(report, file)
+
+
+def test_exit_status_reports_regressions(tmp_path, monkeypatch):
+    args = ["--size", "200", "--repeat", "2", "--only", "list_first_page", "search"]
+    baseline = str(tmp_path / "baseline.json")
+    assert run.main(args + ["--save-baseline", baseline]) == 0
+    with open(baseline, encoding="utf-8") as file:
+        report = json.load(file)
+    assert report["meta"]["size"] == 200
+    assert "list.first_page" in report["results"] and "search.cache" in report["results"]
+
+    rewrite_medians(baseline, 100.0)
+    assert run.main(args + ["--baseline", baseline]) == 0
+    # A baseline far faster than anything measurable regresses every scenario
+    monkeypatch.setattr(run, "NOISE_FLOOR", 0)
+    rewrite_medians(baseline, 1e-9)
+    assert run.main(args + ["--baseline", baseline]) == 1
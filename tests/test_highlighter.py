@@ -0,0 +1,123 @@
+import random
+import time
+
+import pytest
+
+pytest.importorskip("pygments")
+
+from pygments.lexers import get_lexer_by_name  # noqa: E402
+from pygments.token import Comment  # noqa: E402
+
+from highlighter import HighlightCache, TextHighlighter, lex_full, lex_incremental  # noqa: E402
+
+SOURCES = {
+    "python": '''import os
+
+
+def read(path):
+    """Read a file.
+
+    Returns its text."""
+    with open(path) as f:  # comment
+        return f.read()
+
+
+class Cache:
+    items = {"a": 1, 'b': [1, 2, 3]}
+    text = """multi
+line string"""
+''',
+    "javascript": '''/* block
+   comment */
+function add(a, b) {
+    const s = `template ${a}
+spanning lines`;
+    return a + b; // done
+}
+''',
+    "html": '''<html>
+<head><style>
+body { color: red; }
+</style></head>
+<body><!-- note
+--><p class="x">Hi</p>
+<script>let x = "<b>";</script>
+</body>
+</html>
+''',
+}
+FRAGMENTS = ('"""', "'", '"', "\n", "#", "/*", "*/", "<!--", "-->", "`", "x = 1\n", "def f():\n    pass\n", "<p>")
+
+
+def random_edit(rng, text):
+    start = rng.randrange(len(text) + 1)
+    end = min(len(text), start + rng.randrange(6))
+    return text[:start] + rng.choice(("",) + FRAGMENTS) + text[end:]
+
+
+@pytest.mark.parametrize("language", sorted(SOURCES))
+def test_incremental_lex_matches_a_full_lex(language):
+    lexer = get_lexer_by_name(language)
+    rng = random.Random(language)
+    text = SOURCES[language]
+    result = lex_full(lexer, text)
+    exact = 0
+    for _ in range(300):
+        new_text = random_edit(rng, text)
+        new_result, first, last, old_end = lex_incremental(lexer, text, result, new_text)
+        # Only lines [first, last) were re-lexed; the rest is the old result
+        assert new_result.lines[:first] == result.lines[:first]
+        assert new_result.lines[last:] == result.lines[old_end:]
+        expected = lex_full(lexer, new_text)
+        # Unless the edit closed a construct left open above it (see
+        # lex_incremental), the result is exactly a full lex
+        if expected.lines[:first] == result.lines[:first] and expected.states[:first + 1] == result.states[:first + 1]:
+            assert new_result.lines == expected.lines
+            assert new_result.states == expected.states
+            exact += 1
+        text, result = new_text, expected
+    assert exact > 250
+
+
+def test_lines_cover_the_text():
+    text = SOURCES["python"]
+    result = lex_full(get_lexer_by_name("python"), text)
+    lines = text.split("\n")
+    assert len(result.lines) == len(lines)
+    for line, segments in zip(lines, result.lines):
+        assert sum(end - start for start, end, _ in segments) == len(line)
+
+
+def test_cache_evicts_least_recently_used():
+    cache = HighlightCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None and cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_idle_full_lex_corrects_constructs_closed_below():
+    tkinter = pytest.importorskip("tkinter")
+    try:
+        root = tkinter.Tk()
+    except tkinter.TclError:
+        pytest.skip("no display")
+    try:
+        root.withdraw()
+        widget = tkinter.Text(root)
+        highlighter = TextHighlighter(widget)
+        widget.insert("1.0", "let a = 1;\n/* start\nlet b = 2;\nlet c = 3;\n")
+        highlighter.highlight("JavaScript")
+        widget.insert("4.end", " */")
+        highlighter.highlight("JavaScript")
+        expected = lex_full(highlighter.get_lexer("JavaScript"), widget.get("1.0", "end-1c"))
+        assert highlighter.result.lines != expected.lines
+        deadline = time.monotonic() + 5
+        while highlighter.verify_id is not None and time.monotonic() < deadline:
+            root.update()
+            time.sleep(0.01)
+        assert highlighter.result.lines == expected.lines
+        assert any(ttype in Comment for _, _, ttype in highlighter.result.lines[2])
+    finally:
+        root.destroy()
@@ -0,0 +1,104 @@
+import os
+import threading
+
+import pytest
+
+import ingest
+from transfer import TransferCancelled
+
+MODULE = '''import os
+
+
+# Reads the config
+@cached
+def load(path):
+    with open(path) as file:
+        return file.read()
+
+
+class Loader:
+    """Loads things."""
+
+    def run(self):
+        return load(os.getcwd())
+'''
+
+
+def write(root, relpath, text):
+    path = root / relpath
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    return path
+
+
+def titles(store):
+    return sorted(snippet["title"] for snippet in store.iter_all())
+
+
+def test_split_definitions_keeps_comments_decorators_and_bodies():
+    pieces = ingest.split_definitions(MODULE, "Python")
+    assert [(name, line) for name, line, _ in pieces] == [("load", 4), ("Loader", 11)]
+    assert pieces[0][2].startswith("# Reads the config\n@cached\ndef load(path):")
+    assert pieces[0][2].endswith("return file.read()")
+    assert pieces[1][2].endswith("return load(os.getcwd())")
+
+
+def test_split_definitions_without_definitions_or_lexer():
+    assert ingest.split_definitions("x = 1\nprint(x)\n", "Python") == []
+    assert ingest.split_definitions("anything", "No Such Language") == []
+
+
+def test_walk_skips_ignored_and_oversized_files(tmp_path):
+    write(tmp_path, "src/app.py", "x = 1\n")
+    write(tmp_path, "node_modules/lib.js", "var x = 1;\n")
+    write(tmp_path, ".git/hook.py", "x = 1\n")
+    write(tmp_path, "notes.txt", "text\n")
+    write(tmp_path, "big.py", "x = 1\n" * 100)
+    found = sorted(os.path.relpath(path, tmp_path) for path, _, _ in ingest.walk(tmp_path, max_size=100))
+    assert found == [os.path.join("src", "app.py")]
+
+
+def test_rerun_skips_unchanged_files(store, tmp_path):
+    write(tmp_path, "mod.py", MODULE)
+    write(tmp_path, "plain.py", "x = 1\n")
+    counts = ingest.ingest_tree(store, str(tmp_path), tags="proj")
+    assert (counts["files"], counts["inserted"], counts["unchanged"]) == (2, 3, 0)
+    assert titles(store) == ["Loader (mod.py)", "load (mod.py)", "plain.py"]
+    assert store.get(1)["tags"] == "proj"
+    counts = ingest.ingest_tree(store, str(tmp_path), tags="proj")
+    assert (counts["files"], counts["inserted"], counts["unchanged"]) == (2, 0, 2)
+
+
+def test_changed_file_replaces_its_snippets(store, tmp_path):
+    path = write(tmp_path, "mod.py", MODULE)
+    write(tmp_path, "copy.py", "def shared():\n    return 1\n")
+    ingest.ingest_tree(store, str(tmp_path))
+    loader = next(snippet for snippet in store.iter_all() if snippet["title"] == "Loader (mod.py)")
+    # An edited snippet is the user's now and survives changes to its file
+    store.save(loader["id"], loader["title"], loader["code"] + "\n\n    # mine", "Python", "", "")
+    path.write_text("def load(path):\n    return None\n\n\ndef shared():\n    return 1\n")
+    os.utime(path, ns=(1, 1))
+    counts = ingest.ingest_tree(store, str(tmp_path))
+    assert counts["removed"] == 1
+    assert titles(store) == ["Loader (mod.py)", "load (mod.py)", "shared (copy.py)"]
+    assert "return None" in next(s["code"] for s in store.iter_all() if s["title"] == "load (mod.py)")
+    # shared() is produced by both files now; dropping it from one keeps it
+    path.write_text("def load(path):\n    return None\n")
+    os.utime(path, ns=(2, 2))
+    assert ingest.ingest_tree(store, str(tmp_path))["removed"] == 0
+    assert "shared (copy.py)" in titles(store)
+
+
+def test_cancelled_run_resumes_where_it_stopped(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "FILES_PER_TASK", 1)
+    monkeypatch.setattr(ingest, "BATCH_SIZE", 1)
+    for i in range(3):
+        write(tmp_path, f"file{i}.py", f"def f{i}():\n    return {i}\n")
+    cancel = threading.Event()
+    with pytest.raises(TransferCancelled):
+        ingest.ingest_tree(store, str(tmp_path), workers=1, cancel=cancel, progress=lambda done, total: cancel.set())
+    committed = store.count()
+    assert 1 <= committed < 3
+    counts = ingest.ingest_tree(store, str(tmp_path), workers=1)
+    assert counts["unchanged"] == committed and counts["inserted"] == 3 - committed
+    assert store.count() == 3
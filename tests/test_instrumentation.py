@@ -0,0 +1,145 @@
+import queue
+import threading
+
+import pytest
+
+tkinter = pytest.importorskip("tkinter")
+
+from instrumentation import (  # noqa: E402
+    LatencyWindow, Metrics, StallMonitor, callback_name, install_tk_hooks,
+)
+from search import SearchWorker  # noqa: E402
+from store import SnippetStore  # noqa: E402
+
+
+class FakeRoot:
+    def __init__(self):
+        self.scheduled = []
+
+    def _root(self):
+        return self
+
+    def after(self, ms, func):
+        self.scheduled.append(func)
+        return len(self.scheduled)
+
+    def after_cancel(self, after_id):
+        pass
+
+
+class FakeWidget:
+    def __init__(self, root):
+        self._root = lambda: root
+
+
+def test_latency_window_percentiles():
+    window = LatencyWindow(size=100)
+    for ms in range(1, 201):
+        window.add(ms / 1000)
+    summary = window.summary()
+    # Only the last 100 samples count, but every sample is counted
+    assert summary["count"] == 200 and summary["window"] == 100
+    assert summary["p50_ms"] == pytest.approx(151) and summary["max_ms"] == pytest.approx(200)
+    assert LatencyWindow().summary() is None
+
+
+def test_timed_block_and_function():
+    metrics = Metrics()
+
+    @metrics.timed("work")
+    def work():
+        return 42
+    assert work() == 42
+    with metrics.timed("work"):
+        pass
+    assert metrics.summaries()["work"]["count"] == 2
+
+
+def test_connection_factory_times_statements(db_path):
+    metrics = Metrics(slow_query_ms=0)
+    store = SnippetStore(db_path, factory=metrics.connection_factory())
+    try:
+        store.save(None, "one", "print(1)", "Python", "", "")
+        store.get(1)
+    finally:
+        store.close()
+    operations = metrics.summaries()
+    assert "sql.SELECT" in operations and "sql.INSERT" in operations
+    assert any(sql.startswith("INSERT INTO snippets") for _, _, sql in metrics.slowest_queries(1000))
+
+
+def test_search_worker_connection_is_timed(store, db_path):
+    store.save(None, "one", "print(1)", "Python", "", "")
+    metrics = Metrics(slow_query_ms=0)
+    results = queue.Queue()
+    worker = SearchWorker(db_path, lambda *args: results.put(args), factory=metrics.connection_factory())
+    try:
+        worker.submit("one")
+        results.get(timeout=10)
+    finally:
+        worker.close()
+    assert any("snippets_fts MATCH" in sql for _, _, sql in metrics.slowest_queries(1000))
+
+
+def test_slow_queries_can_be_read_while_threads_record():
+    metrics = Metrics(slow_query_ms=0)
+    stop = threading.Event()
+
+    def record():
+        while not stop.is_set():
+            metrics.record_query("SELECT 1", 0.001)
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    try:
+        for _ in range(200):
+            metrics.slowest_queries()
+            metrics.snapshot()
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def test_callback_name_sees_through_after():
+    def on_tick():
+        pass
+
+    def callit():
+        return func()
+    func = on_tick
+    assert callback_name(callit) == "test_callback_name_sees_through_after.<locals>.on_tick"
+
+
+def test_tk_hooks_time_only_this_roots_callbacks():
+    metrics = Metrics()
+    root, other = FakeRoot(), FakeRoot()
+    original = tkinter.CallWrapper
+    uninstall = install_tk_hooks(metrics, root)
+    try:
+        def ours():
+            return "ours"
+
+        def theirs():
+            return "theirs"
+        assert tkinter.CallWrapper(ours, None, FakeWidget(root))() == "ours"
+        assert tkinter.CallWrapper(theirs, None, FakeWidget(other))() == "theirs"
+    finally:
+        uninstall()
+    assert tkinter.CallWrapper is original
+    names = set(metrics.summaries())
+    assert any(name.endswith(".ours") for name in names)
+    assert not any(name.endswith(".theirs") for name in names)
+
+
+def test_stall_monitor_records_late_beats():
+    metrics = Metrics()
+    root = FakeRoot()
+    monitor = StallMonitor(root, metrics, interval_ms=100, threshold_ms=200)
+    monitor.start()
+    monitor.expected -= 1.0
+    root.scheduled[-1]()
+    assert len(metrics.stalls) == 1 and metrics.stalls[0][1] >= 0.8
+    root.scheduled[-1]()
+    assert len(metrics.stalls) == 1
+    assert metrics.summaries()["loop.heartbeat_lag"]["count"] == 2
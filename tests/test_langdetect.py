@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+
+import langdetect
+from langdetect import LanguageDetector, detect_from_hints, detect_uncached
+
+
+@pytest.mark.parametrize("code, filename, language", [
+    ("#!/usr/bin/env python3\nprint(1)", None, "Python"),
+    ("#!/bin/bash\necho hi", None, "Bash"),
+    ("x = 1", "script.rb", "Ruby"),
+    ("all:\n\tcc main.c", "Makefile", "Makefile"),
+    ("x = 1\n# vim: set ft=javascript:", None, "JavaScript"),
+    ("# -*- mode: python -*-\nx = 1", None, "Python"),
+    ("x = 1", None, None),
+    ("x = 1", "notes.unknown", None),
+])
+def test_hints(code, filename, language):
+    assert detect_from_hints(code, filename) == language
+
+
+@pytest.mark.parametrize("code, language", [
+    ("import os\n\ndef main(argv):\n    if argv:\n        return None\n    elif os.sep:\n        pass\n", "Python"),
+    ('package main\n\nimport "fmt"\n\nfunc main() {\n    x := 1\n    fmt.Println(x)\n}\n', "Go"),
+    ("SELECT id, name FROM users WHERE id = 1;\nINSERT INTO logs VALUES (1);\n", "SQL"),
+    ('#include <stdio.h>\n\nint main(void) {\n    printf("hi");\n    return 0;\n}\n', "C"),
+])
+def test_keyword_pass(code, language):
+    assert detect_uncached(code) == language
+
+
+def test_detector_caches_by_content(store, db_path, monkeypatch):
+    calls = []
+    real = langdetect.detect_uncached
+
+    def counting(code, shortlist):
+        calls.append(code)
+        return real(code, shortlist)
+    monkeypatch.setattr(langdetect, "detect_uncached", counting)
+    code = "def main():\n    return None\n"
+    detector = LanguageDetector(db_path)
+    try:
+        assert detector.detect(code) == "Python"
+        assert detector.detect(code) == "Python"
+        # Hints win without touching the cache
+        assert detector.detect(code, "main.rb") == "Ruby"
+        assert len(calls) == 1
+    finally:
+        detector.close()
+    # The cache lives in the snippets database and outlasts the detector
+    assert store.conn.execute("SELECT language FROM language_cache").fetchall() == [("Python",)]
+    detector = LanguageDetector(db_path)
+    try:
+        assert detector.detect(code) == "Python" and len(calls) == 1
+    finally:
+        detector.close()
+
+
+def test_detect_async_reports_on_the_worker(db_path):
+    detector = LanguageDetector(db_path)
+    done = threading.Event()
+    results = []
+
+    def callback(language):
+        results.append((language, threading.current_thread().name))
+        done.set()
+    try:
+        detector.detect_async("#!/bin/sh\necho hi", callback)
+        assert done.wait(10)
+        assert results[0][0] == "Bash" and results[0][1].startswith("langdetect")
+    finally:
+        detector.close()
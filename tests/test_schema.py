@@ -0,0 +1,143 @@
+import sqlite3
+
+import pytest
+
+import schema
+from store import SnippetStore
+
+# The snippets table as the first release of the app created it
+BASELINE_SCHEMA = """
+    CREATE TABLE snippets (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        code TEXT NOT NULL,
+        language TEXT NOT NULL,
+        tags TEXT NOT NULL,
+        description TEXT,
+        favorite INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_modified TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+def make_baseline(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute(BASELINE_SCHEMA)
+    conn.executemany("""
+        INSERT INTO snippets (title, code, language, tags, description, favorite, created_at, last_modified)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    conn.commit()
+    conn.close()
+
+
+def test_baseline_database_migrates_to_latest(db_path):
+    make_baseline(db_path, [
+        ("one", "print(1)", "Python", "a", "first", 1, "2023-01-01 00:00:00", "2023-01-01 00:00:00"),
+        ("two", "print(2)", "Python", "b", None, 0, "2024-01-01 00:00:00", None),
+    ])
+    store = SnippetStore(db_path)
+    try:
+        assert store.conn.execute("PRAGMA user_version").fetchone()[0] == len(schema.MIGRATIONS)
+        assert store.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert store.migration_notes == []
+        assert [snippet["title"] for snippet in store.iter_all()] == ["one", "two"]
+        # Keyset paging needs a last_modified on every row
+        assert store.get(2)["last_modified"] == "2024-01-01 00:00:00"
+        assert [row[0] for row in store.page(store.list_query(""))[0]] == [1, 2]
+    finally:
+        store.close()
+
+
+def test_migrations_run_once(db_path):
+    SnippetStore(db_path).close()
+    conn = schema.connect(db_path)
+    try:
+        assert schema.migrate(conn) == []
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(schema.MIGRATIONS)
+    finally:
+        conn.close()
+
+
+def test_failed_migration_rolls_back(db_path, monkeypatch):
+    def broken(cursor):
+        cursor.execute("CREATE TABLE half_done (id INTEGER)")
+        raise RuntimeError("boom")
+    SnippetStore(db_path).close()
+    monkeypatch.setattr(schema, "MIGRATIONS", schema.MIGRATIONS + (broken,))
+    conn = schema.connect(db_path)
+    try:
+        with pytest.raises(RuntimeError):
+            schema.migrate(conn)
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(schema.MIGRATIONS) - 1
+        assert conn.execute("SELECT 1 FROM sqlite_master WHERE name='half_done'").fetchone() is None
+    finally:
+        conn.close()
+
+
+def test_duplicates_are_merged_into_the_newest_copy(db_path):
+    make_baseline(db_path, [
+        ("old copy", "print(1)", "Python", "x, Shared", "first", 1, "2023-01-01 00:00:00", "2023-01-01 00:00:00"),
+        ("new copy", "print(1)\n", "Python", "shared, y", "second", 0, "2024-01-01 00:00:00", "2024-01-01 00:00:00"),
+        ("other", "print(2)", "Python", "", None, 0, "2024-02-01 00:00:00", "2024-02-01 00:00:00"),
+    ])
+    store = SnippetStore(db_path)
+    try:
+        assert len(store.migration_notes) == 1 and "Merged 1 duplicate" in store.migration_notes[0]
+        kept = store.conn.execute(
+            "SELECT title, tags, description, favorite, created_at FROM snippets WHERE code LIKE 'print(1)%'"
+        ).fetchall()
+        assert kept == [("new copy", "shared, y, x", "second\n\nfirst", 1, "2023-01-01 00:00:00")]
+        assert store.conn.execute("SELECT title, kept_id FROM merged_duplicates").fetchall() == [("old copy", 2)]
+        assert store.count() == 2
+    finally:
+        store.close()
+    assert SnippetStore(db_path).migration_notes == []
+
+
+LARGE_CODE = "\n".join(f"def handler_{i}(value):\n    return value * {i}" for i in range(400))
+
+
+def test_large_code_is_compressed_and_stays_searchable(db_path):
+    make_baseline(db_path, [
+        ("large", LARGE_CODE, "Python", "big", None, 0, "2024-02-01 00:00:00", "2024-02-01 00:00:00"),
+    ])
+    store = SnippetStore(db_path)
+    try:
+        codec, code_size, preview = store.conn.execute("SELECT codec, code_size, preview FROM snippets").fetchone()
+        assert codec == schema.CODE_CODEC and code_size == len(LARGE_CODE.encode())
+        assert preview == "def handler_0(value):"
+        assert store.get(1)["code"] == LARGE_CODE
+        assert [result["title"] for result in store.search("handler_399")] == ["large"]
+    finally:
+        store.close()
+
+
+def test_plain_connections_keep_search_in_step(store, db_path):
+    snippet_id = store.save(None, "alpha title", "print(1)", "Python", "", "")
+    large_id = store.save(None, "large", LARGE_CODE, "Python", "", "")
+    # Other SQLite clients don't have decompress_code(); their writes must work
+    # and leave the index right
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE snippets SET title='beta' WHERE id=?", (snippet_id,))
+    conn.execute("UPDATE snippets SET title='renamed large' WHERE id=?", (large_id,))
+    conn.execute("""
+        INSERT INTO snippets (title, code, language, tags, content_hash) VALUES ('gadget', 'x = 1', 'Python', '', 'h')
+    """)
+    conn.execute("DELETE FROM snippets WHERE content_hash='h'")
+    conn.execute("""
+        INSERT INTO snippets (title, code, language, tags, content_hash) VALUES ('widget', 'y', 'Text', '', 'i')
+    """)
+    conn.commit()
+    conn.close()
+
+    def titles(query):
+        return [result["title"] for result in store.search(query)]
+    assert titles("alpha") == [] and titles("beta") == ["beta"]
+    assert titles("handler_399") == ["renamed large"]
+    assert titles("gadget") == [] and titles("widget") == ["widget"]
+
+    store.save(snippet_id, "gamma title", "print(1)", "Python", "", "")
+    assert titles("alpha") == [] and titles("beta") == [] and titles("gamma") == ["gamma title"]
+    store.conn.execute("INSERT INTO snippets_fts(snippets_fts, rank) VALUES ('integrity-check', 1)")
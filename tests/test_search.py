@@ -0,0 +1,80 @@
+import queue
+import sqlite3
+import time
+
+import pytest
+
+from search import SearchWorker
+
+# Never finishes on its own, so only an interrupt ends it
+ENDLESS = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT COUNT(*) FROM c"
+
+
+@pytest.fixture
+def worker(store, db_path):
+    for i in range(5):
+        store.save(None, f"snippet {i}", f"print({i})", "Python", "", "")
+    events = queue.Queue()
+    worker = SearchWorker(
+        db_path,
+        lambda generation, list_query, rows, has_more: events.put(("result", generation, rows)),
+        on_error=lambda generation, error: events.put(("error", generation, error)),
+    )
+    worker.events = events
+    yield worker
+    worker.close()
+
+
+def wait_running(worker, generation):
+    deadline = time.monotonic() + 10
+    while worker._running != generation:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_results_arrive_for_the_current_generation(worker):
+    generation = worker.submit("snippet")
+    kind, delivered, rows = worker.events.get(timeout=10)
+    assert (kind, delivered) == ("result", generation) and len(rows) == 5
+    generation = worker.submit("", ["missing"])
+    assert worker.events.get(timeout=10)[:2] == ("result", generation)
+
+
+def test_newer_query_interrupts_the_running_one(worker, monkeypatch):
+    page = worker._store.page
+
+    def slow_page(list_query, **kwargs):
+        if list_query[1] and list_query[1][0] == '"slow"*':
+            worker._store.conn.execute(ENDLESS).fetchone()
+        return page(list_query, **kwargs)
+    monkeypatch.setattr(worker._store, "page", slow_page)
+    slow = worker.submit("slow")
+    wait_running(worker, slow)
+    fast = worker.submit("snippet")
+    kind, generation, rows = worker.events.get(timeout=10)
+    # The interrupted search reports neither results nor an error
+    assert (kind, generation) == ("result", fast) and len(rows) == 5
+    assert worker.events.empty()
+
+
+def test_cancel_drops_the_running_query(worker, monkeypatch):
+    def endless_page(list_query, **kwargs):
+        worker._store.conn.execute(ENDLESS).fetchone()
+    monkeypatch.setattr(worker._store, "page", endless_page)
+    generation = worker.submit("anything")
+    wait_running(worker, generation)
+    worker.cancel()
+    deadline = time.monotonic() + 10
+    while worker._running is not None:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+    assert worker.events.empty()
+
+
+def test_failures_are_reported(worker, monkeypatch):
+    def broken(list_query, **kwargs):
+        raise sqlite3.DatabaseError("database disk image is malformed")
+    monkeypatch.setattr(worker._store, "page", broken)
+    generation = worker.submit("snippet")
+    kind, reported, error = worker.events.get(timeout=10)
+    assert (kind, reported) == ("error", generation) and "malformed" in str(error)
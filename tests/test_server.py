@@ -0,0 +1,146 @@
+import http.client
+import json
+import socket
+
+import pytest
+
+from server import SnippetServer
+
+
+@pytest.fixture
+def server(db_path):
+    changes = []
+    server = SnippetServer(db_path, host="127.0.0.1", port=0, readers=2, on_change=changes.append)
+    server.changes = changes
+    server.start_thread()
+    yield server
+    server.close()
+
+
+def request(server, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection(server.host, server.port, timeout=10)
+    try:
+        headers = dict(headers or {})
+        if body is not None and not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+            headers.setdefault("Content-Type", "application/json")
+        conn.request(method, path, body, headers)
+        response = conn.getresponse()
+        payload = response.read()
+        return response.status, response.headers, payload
+    finally:
+        conn.close()
+
+
+def exchange(server, data):
+    """Send raw bytes on one connection; the status codes of every response
+    that comes back before the server closes it."""
+    statuses = []
+    with socket.create_connection((server.host, server.port), timeout=10) as sock:
+        sock.sendall(data)
+        stream = sock.makefile("rb")
+        while status_line := stream.readline():
+            statuses.append(int(status_line.split()[1]))
+            length = 0
+            while (line := stream.readline()) not in (b"\r\n", b""):
+                name, _, value = line.decode().partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            stream.read(length)
+    return statuses
+
+
+def post(server, snippet):
+    return request(server, "POST", "/snippets", snippet)
+
+
+def test_insert_get_and_search(server):
+    status, headers, payload = post(server, {"title": "Hello", "code": "print('hello world')", "tags": "greeting"})
+    assert status == 201
+    snippet_id = json.loads(payload)["id"]
+    assert headers["Location"] == f"/snippets/{snippet_id}"
+    assert server.changes == [snippet_id]
+
+    status, _, payload = request(server, "GET", f"/snippets/{snippet_id}")
+    assert status == 200 and json.loads(payload)["code"] == "print('hello world')"
+    status, _, payload = request(server, "GET", f"/snippets?ids={snippet_id},999")
+    assert [snippet["id"] for snippet in json.loads(payload)] == [snippet_id]
+
+    status, _, payload = request(server, "GET", "/search?q=hello&tags=greeting")
+    result = json.loads(payload)
+    assert status == 200 and [row["id"] for row in result["results"]] == [snippet_id]
+    assert result["has_more"] is False
+
+
+def test_etag_revalidation(server):
+    post(server, {"title": "One", "code": "1"})
+    status, headers, _ = request(server, "GET", "/search?q=")
+    etag = headers["ETag"]
+    status, headers, payload = request(server, "GET", "/search?q=", headers={"If-None-Match": etag})
+    assert status == 304 and payload == b"" and headers["ETag"] == etag
+
+    # A write changes the version, so the old tag no longer matches
+    post(server, {"title": "Two", "code": "2"})
+    status, headers, payload = request(server, "GET", "/search?q=", headers={"If-None-Match": etag})
+    assert status == 200 and headers["ETag"] != etag
+    assert len(json.loads(payload)["results"]) == 2
+
+
+def test_duplicate_insert_conflicts(server):
+    assert post(server, {"title": "One", "code": "print(1)"})[0] == 201
+    status, _, payload = post(server, {"title": "Again", "code": "print(1)\n"})
+    assert status == 409 and "error" in json.loads(payload)
+    assert len(server.changes) == 1
+
+
+@pytest.mark.parametrize("body", [b"{not json", b"[]", b'{"title": "no code"}', b'{"title": " ", "code": "x"}'])
+def test_bad_bodies_are_rejected(server, body):
+    status, _, payload = request(server, "POST", "/snippets", body, {"Content-Type": "application/json"})
+    assert status == 400 and "error" in json.loads(payload)
+
+
+@pytest.mark.parametrize("path, status", [
+    ("/snippets/abc", 400),
+    ("/snippets?ids=1,x", 400),
+    ("/search?limit=many", 400),
+    ("/snippets/42", 404),
+    ("/nowhere", 404),
+])
+def test_bad_requests(server, path, status):
+    assert request(server, "GET", path)[0] == status
+
+
+def test_foreign_hosts_and_origins_are_refused(server):
+    assert request(server, "GET", "/search", headers={"Host": f"evil.example:{server.port}"})[0] == 403
+    assert request(server, "GET", "/search", headers={"Origin": "http://evil.example"})[0] == 403
+    assert request(server, "GET", "/search", headers={"Origin": f"http://localhost:{server.port}"})[0] == 200
+    status, _, _ = request(server, "POST", "/snippets", b'{"title": "t", "code": "c"}', {"Content-Type": "text/plain"})
+    assert status == 415
+    assert server.changes == []
+
+
+def test_export_streams_every_snippet(server):
+    for i in range(3):
+        post(server, {"title": f"Snippet {i}", "code": f"print({i})"})
+    status, headers, payload = request(server, "GET", "/export")
+    assert status == 200 and headers["Content-Type"].startswith("application/x-ndjson")
+    assert [json.loads(line)["title"] for line in payload.decode().splitlines()] == [f"Snippet {i}" for i in range(3)]
+
+
+def test_bodies_of_other_methods_are_dropped(server):
+    # The body of a GET looks like a request of its own; it must not be served as one
+    smuggled = b"GET /nowhere HTTP/1.1\r\nHost: localhost\r\n\r\n"
+    head = f"GET /search?q= HTTP/1.1\r\nHost: localhost:{server.port}\r\nContent-Length: {len(smuggled)}\r\n\r\n"
+    last = f"GET /search?q= HTTP/1.1\r\nHost: localhost:{server.port}\r\nConnection: close\r\n\r\n"
+    assert exchange(server, head.encode() + smuggled + last.encode()) == [200, 200]
+
+
+def test_refused_requests_close_the_connection(server):
+    body = b'{"title": "t", "code": "c"}'
+    refused = (f"POST /snippets HTTP/1.1\r\nHost: evil.example:{server.port}\r\nContent-Type: application/json\r\n"
+               f"Content-Length: {len(body)}\r\n\r\n").encode() + body
+    follow_up = f"GET /search HTTP/1.1\r\nHost: localhost:{server.port}\r\n\r\n".encode()
+    assert exchange(server, refused + follow_up) == [403]
+    chunked = f"GET /search HTTP/1.1\r\nHost: localhost:{server.port}\r\nTransfer-Encoding: chunked\r\n\r\n"
+    assert exchange(server, chunked.encode() + b"0\r\n\r\n") == [501]
+    assert server.changes == []
@@ -0,0 +1,75 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import similarity
+from similarity import SimilarityIndex
+
+BASE = "\n".join(f"def step_{i}(items):\n    return [item * {i} for item in items if item > {i}]" for i in range(20))
+
+
+@pytest.fixture
+def index(store):
+    return SimilarityIndex(store)
+
+
+def test_signatures_ignore_layout_and_estimate_overlap():
+    sig = similarity.signature(BASE)
+    assert similarity.signature(BASE.replace("\n    ", "\n        ")) == sig
+    assert similarity.unpack(similarity.pack(sig)) == sig
+    assert similarity.similarity(sig, similarity.signature(BASE + "\nx = 1")) > 0.8
+    assert similarity.similarity(sig, similarity.signature("print('something else entirely')")) < 0.2
+
+
+def test_python_and_numpy_signatures_agree(monkeypatch):
+    if similarity.numpy is None:
+        pytest.skip("NumPy is not installed")
+    vectorized = similarity.signature(BASE)
+    monkeypatch.setattr(similarity, "numpy", None)
+    assert similarity.signature(BASE) == vectorized
+
+
+def test_similar_snippets_and_clusters(store, index):
+    first = store.save(None, "first", BASE, "Python", "", "")
+    second = store.save(None, "second", BASE + "\n# tweak", "Python", "", "")
+    other = store.save(None, "other", "SELECT name FROM users WHERE id = 1", "SQL", "", "")
+    assert index.stale_count() == 3
+    assert index.refresh() == 3 and index.stale_count() == 0
+    assert [(snippet_id, title) for _, snippet_id, title in index.similar(first)] == [(second, "second")]
+    assert index.similar(other) == []
+    assert index.duplicate_clusters() == [[first, second]]
+
+
+def test_edits_within_the_same_second_are_seen(store, index):
+    snippet_id = store.save(None, "first", BASE, "Python", "", "")
+    index.refresh()
+    store.save(snippet_id, "first", "SELECT 1", "SQL", "", "")
+    # Both saves share a last_modified at one-second resolution
+    store.conn.execute("UPDATE snippets SET last_modified='2024-01-01 00:00:00'")
+    store.conn.execute("UPDATE snippet_signatures SET last_modified='2024-01-01 00:00:00'")
+    store.commit()
+    assert index.stale_count() == 1 and index.refresh() == 1
+    assert index.signatures([snippet_id])[snippet_id] == similarity.signature("SELECT 1")
+
+
+def test_deleted_snippets_leave_the_index(store, index):
+    first = store.save(None, "first", BASE, "Python", "", "")
+    second = store.save(None, "second", BASE + "\n# tweak", "Python", "", "")
+    index.refresh()
+    store.delete(second)
+    assert index.similar(first) == []
+    assert store.conn.execute("SELECT COUNT(*) FROM snippet_lsh WHERE snippet_id=?", (second,)).fetchone()[0] == 0
+
+
+def test_bounded_map_keeps_order_and_draws_tasks_lazily():
+    drawn = []
+
+    def tasks():
+        for i in range(20):
+            drawn.append(i)
+            yield i
+    with ThreadPoolExecutor(2) as pool:
+        results = similarity.bounded_map(pool, lambda x: x * x, tasks(), workers=2)
+        assert next(results) == 0
+        assert len(drawn) == 4
+        assert list(results) == [i * i for i in range(1, 20)]
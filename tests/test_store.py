@@ -0,0 +1,122 @@
+import sqlite3
+
+import pytest
+
+from store import DuplicateSnippetError, SnippetStore
+
+
+def fill(store, count):
+    store.upsert_many([{
+        "title": f"snippet {i}",
+        "code": f"print({i})",
+        "language": "Python",
+        "tags": "even" if i % 2 == 0 else "odd",
+        "favorite": int(i % 10 == 0),
+        "last_modified": f"2024-01-01 00:{i // 60 % 60:02d}:{i % 60:02d}",
+    } for i in range(count)])
+
+
+def test_keyset_pages_cover_the_list_once_in_order(store):
+    fill(store, 250)
+    query = store.list_query("")
+    everything, _ = store.page(query, limit=1000)
+    pages, rows, has_more = [], *store.page(query, limit=40)
+    pages.append(rows)
+    while has_more:
+        rows, has_more = store.page(query, after=rows[-1][8:11], limit=40)
+        pages.append(rows)
+    assert [row for page in pages for row in page] == everything
+    assert len(everything) == 250
+    assert all(row[5] for row in everything[:25]) and not any(row[5] for row in everything[25:])
+
+    # Paging back from the third page returns the second
+    back, has_more = store.page(query, before=pages[2][0][8:11], limit=40)
+    assert back == pages[1] and has_more
+
+
+def test_list_row_matches_its_page_row(store):
+    fill(store, 30)
+    query = store.list_query("")
+    rows, _ = store.page(query, limit=30)
+    assert store.list_row(query, rows[7][0]) == rows[7]
+    assert store.list_row(query, 999) is None
+
+
+def test_duplicate_save_is_refused(store):
+    store.save(None, "first", "print(1)", "Python", "", "")
+    with pytest.raises(DuplicateSnippetError):
+        store.save(None, "second", "print(1)\r\n", "Python", "", "")
+    assert store.count() == 1
+    # The same code in another language is a different snippet
+    store.save(None, "third", "print(1)", "Text", "", "")
+
+
+def test_tag_filter_pages(store):
+    fill(store, 50)
+    rows, has_more = store.page(store.list_query("", ["even"]), limit=100)
+    assert len(rows) == 25 and not has_more
+    assert len(store.page(store.list_query("", ["Even", "odd"]), limit=100)[0]) == 50
+    assert store.page(store.list_query("", ["even", "odd"], match_all=True), limit=100)[0] == []
+
+
+def test_tag_counts_follow_edits(store):
+    first = store.save(None, "one", "print(1)", "Python", "a, B", "")
+    store.save(None, "two", "print(2)", "Python", "b", "")
+    assert store.tag_counts() == [("b", 2), ("a", 1)]
+    store.save(first, "one", "print(1)", "Python", "c", "")
+    assert store.tag_counts() == [("b", 1), ("c", 1)]
+    store.delete(first)
+    assert store.tag_counts() == [("b", 1)]
+
+
+LARGE_CODE = "\n".join(f"def handler_{i}(value):\n    return value * {i}" for i in range(400))
+
+
+def test_search_index_follows_saves_upserts_and_deletes(store):
+    snippet_id = store.save(None, "large", LARGE_CODE, "Python", "", "one\ntwo words")
+    store.save(snippet_id, "large", LARGE_CODE.replace("handler_399", "renamed_fn"), "Python", "", "one\ntwo words")
+    assert store.search("handler_399") == []
+    assert [result["id"] for result in store.search("renamed_fn")] == [snippet_id]
+    assert store.search("words")[0]["match"] == "one two [words]"
+    # Hits in code are excerpted too, from the index's own copy of the text
+    assert "[renamed_fn]" in store.search("renamed_fn")[0]["match"]
+    store.upsert_many([{
+        "title": "large", "code": LARGE_CODE.replace("handler_399", "renamed_fn"), "language": "Python",
+        "tags": "", "last_modified": "2999-01-01 00:00:00", "description": "upserted",
+    }], mode="upsert")
+    assert [result["id"] for result in store.search("upserted renamed_fn")] == [snippet_id]
+    store.delete(snippet_id)
+    assert store.search("renamed_fn") == []
+    store.conn.execute("INSERT INTO snippets_fts(snippets_fts, rank) VALUES ('integrity-check', 1)")
+
+
+def test_search_never_reads_code(store):
+    store.save(None, "large", LARGE_CODE, "Python", "", "")
+    statements = []
+    store.conn.set_trace_callback(statements.append)
+    assert store.search("handler_7")
+    store.conn.set_trace_callback(None)
+    assert not any("code" in statement.replace("code_size", "") for statement in statements)
+
+
+def test_writes_while_another_connection_holds_the_lock_fail_cleanly(store, db_path):
+    snippet_id = store.save(None, "one", "print(1)", "Python", "", "")
+    store.conn.execute("PRAGMA busy_timeout=0")
+    importer = SnippetStore(db_path)
+    try:
+        importer.conn.execute("BEGIN IMMEDIATE")
+        importer.conn.execute(
+            "INSERT INTO snippets (title, code, language, tags, content_hash) VALUES ('two', 'x', 'Text', '', 'h')"
+        )
+        for write in (lambda: store.save(snippet_id, "renamed", "print(1)", "Python", "", ""),
+                      lambda: store.delete(snippet_id), lambda: store.toggle_favorite(snippet_id)):
+            with pytest.raises(sqlite3.OperationalError):
+                write()
+            assert not store.conn.in_transaction
+        importer.commit()
+        # No stale snapshot: the import is visible, and writes work again
+        assert store.count() == 2
+        store.toggle_favorite(snippet_id)
+        assert store.get(snippet_id)["favorite"] == 1
+    finally:
+        importer.close()
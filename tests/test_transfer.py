@@ -0,0 +1,88 @@
+import io
+import os
+import threading
+
+import pytest
+
+import transfer
+from store import SnippetStore
+
+LARGE_CODE = "\n".join(f"def handler_{i}(value):\n    return value * {i}" for i in range(400))
+
+
+def snippets(store):
+    return [{key: value for key, value in snippet.items() if key != "id"} for snippet in store.iter_all()]
+
+
+@pytest.fixture
+def target(tmp_path):
+    store = SnippetStore(str(tmp_path / "target.db"))
+    yield store
+    store.close()
+
+
+@pytest.mark.parametrize("name", ["backup.json", "backup.jsonl", "backup.jsonl.gz"])
+def test_export_import_round_trip(store, target, tmp_path, name):
+    store.save(None, "small", "print('hi')", "Python", "a, b", "desc")
+    store.save(None, "large", LARGE_CODE, "Python", "big", "")
+    path = str(tmp_path / name)
+    assert transfer.export_snippets(store, path) == 2
+    assert transfer.import_snippets(target, path) == {"inserted": 2, "updated": 0, "skipped": 0}
+    assert snippets(target) == snippets(store)
+
+
+def test_cancelled_import_is_rolled_back(store, target, tmp_path, monkeypatch):
+    monkeypatch.setattr(transfer, "BATCH_SIZE", 2)
+    for i in range(5):
+        store.save(None, f"snippet {i}", f"print({i})", "Python", "", "")
+    path = str(tmp_path / "backup.jsonl")
+    transfer.export_snippets(store, path)
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(transfer.TransferCancelled):
+        transfer.import_snippets(target, path, cancel=cancel)
+    assert target.count() == 0
+
+
+def test_cancelled_export_leaves_no_file(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(transfer, "BATCH_SIZE", 2)
+    for i in range(5):
+        store.save(None, f"snippet {i}", f"print({i})", "Python", "", "")
+    path = str(tmp_path / "backup.json")
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(transfer.TransferCancelled):
+        transfer.export_snippets(store, path, cancel=cancel)
+    assert not os.path.exists(path)
+    assert not os.path.exists(path + ".part")
+
+
+def test_json_array_reader_handles_records_larger_than_a_chunk(monkeypatch):
+    monkeypatch.setattr(transfer, "CHUNK_SIZE", 8)
+    stream = io.StringIO('[ {"code": "' + "x" * 100 + '"},\n {"code": "y"} ]')
+    assert [record["code"] for record in transfer.iter_json_array(stream)] == ["x" * 100, "y"]
+
+
+def test_reimport_skips_snippets_already_present(store, target, tmp_path):
+    store.save(None, "small", "print('hi')", "Python", "a", "")
+    path = str(tmp_path / "backup.jsonl")
+    transfer.export_snippets(store, path)
+    transfer.import_snippets(target, path)
+    assert transfer.import_snippets(target, path) == {"inserted": 0, "updated": 0, "skipped": 1}
+    assert target.count() == 1
+
+
+def test_upsert_updates_newer_copies(store, target, tmp_path):
+    store.save(None, "title", "print(1)", "Python", "old", "")
+    path = str(tmp_path / "backup.jsonl")
+    transfer.export_snippets(store, path)
+    transfer.import_snippets(target, path)
+    store.save(1, "new title", "print(1)", "Python", "new", "")
+    # Both saves can fall in the same second; make the edit unambiguously newer
+    store.conn.execute("UPDATE snippets SET last_modified='2999-01-01 00:00:00'")
+    store.commit()
+    transfer.export_snippets(store, path)
+    assert transfer.import_snippets(target, path) == {"inserted": 0, "updated": 0, "skipped": 1}
+    assert transfer.import_snippets(target, path, mode="upsert") == {"inserted": 0, "updated": 1, "skipped": 0}
+    assert target.get(1)["title"] == "new title"
+    assert [result["title"] for result in target.search("new title")] == ["new title"]
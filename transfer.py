@@ -0,0 +1,181 @@
+"""Streaming import and export of snippets.
+
+Both directions work row by row, so memory stays flat regardless of library
+size. Files may be a JSON array (the original backup format) or JSON Lines
+(``.jsonl``/``.ndjson``), optionally gzip (``.gz``) or zstd (``.zst``)
+compressed. Progress is reported through a callback and a threading.Event can
+cancel the job; a cancelled import is rolled back and a cancelled export
+leaves no partial file behind.
+"""
+import gzip
+import io
+import json
+import os
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BATCH_SIZE = 1000
+# Read size for incremental JSON parsing; grows while a single record doesn't fit
+CHUNK_SIZE = 1 << 16
+
+
+class TransferCancelled(Exception):
+    pass
+
+
+def split_compression(path):
+    root, ext = os.path.splitext(path.lower())
+    if ext in (".gz", ".zst"):
+        return root, ext
+    return path.lower(), ""
+
+
+def is_jsonl(path):
+    return split_compression(path)[0].endswith((".jsonl", ".ndjson"))
+
+
+def _require_zstd():
+    if zstandard is None:
+        raise RuntimeError("Install the 'zstandard' package to use .zst files")
+
+
+def open_writer(raw, path):
+    compression = split_compression(path)[1]
+    if compression == ".gz":
+        binary = gzip.GzipFile(fileobj=raw, mode="wb")
+    elif compression == ".zst":
+        _require_zstd()
+        binary = zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+    else:
+        binary = raw
+    return io.TextIOWrapper(binary, encoding="utf-8", newline="\n")
+
+
+def open_reader(raw, path):
+    compression = split_compression(path)[1]
+    if compression == ".gz":
+        binary = gzip.GzipFile(fileobj=raw, mode="rb")
+    elif compression == ".zst":
+        _require_zstd()
+        binary = zstandard.ZstdDecompressor().stream_reader(raw, closefd=False)
+    else:
+        binary = raw
+    return io.TextIOWrapper(binary, encoding="utf-8-sig")
+
+
+def iter_json_array(stream):
+    """Yield the elements of a top-level JSON array without loading it all."""
+    decoder = json.JSONDecoder()
+    buffer, pos, eof, started = "", 0, False, False
+    read_size = CHUNK_SIZE
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(buffer):
+            if eof:
+                raise ValueError("Unexpected end of JSON file")
+            chunk = stream.read(read_size)
+            buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+            continue
+        if not started:
+            if buffer[pos] != "[":
+                raise ValueError("Expected a JSON array of snippets")
+            started = True
+            pos += 1
+            continue
+        if buffer[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # Record continues past the buffer: read more, doubling so huge
+            # records don't get re-parsed once per chunk
+            chunk = stream.read(max(read_size, len(buffer) - pos))
+            buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+            continue
+        pos = end
+        yield item
+
+
+def iter_json_lines(stream):
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def export_snippets(store, path, progress=None, cancel=None):
+    """Write every snippet to path; returns the number of snippets written."""
+    total = store.count()
+    jsonl = is_jsonl(path)
+    partial = path + ".part"
+    count = 0
+    snippets = store.iter_all(BATCH_SIZE)
+    try:
+        with open(partial, "wb") as raw, open_writer(raw, path) as out:
+            if not jsonl:
+                out.write("[")
+            for record in snippets:
+                if jsonl:
+                    out.write(json.dumps(record, ensure_ascii=False))
+                    out.write("\n")
+                else:
+                    # Same layout json.dump(indent=2) produced for the whole list
+                    out.write(",\n  " if count else "\n  ")
+                    out.write(json.dumps(record, indent=2, ensure_ascii=False).replace("\n", "\n  "))
+                count += 1
+                if count % BATCH_SIZE == 0:
+                    if cancel is not None and cancel.is_set():
+                        raise TransferCancelled()
+                    if progress:
+                        progress(count, total)
+            if not jsonl:
+                out.write("\n]" if count else "]")
+        os.replace(partial, path)
+    except BaseException:
+        snippets.close()
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    if progress:
+        progress(count, total)
+    return count
+
+
+def import_snippets(store, path, progress=None, cancel=None, mode="merge"):
+    """Import every snippet in path in one transaction.
+
+    Returns a dict of inserted/updated/skipped counts; see store.IMPORT_MODES.
+    """
+    size = os.path.getsize(path) or 1
+    counts = {"inserted": 0, "updated": 0, "skipped": 0}
+
+    def apply(batch):
+        for key, value in store.upsert_many(batch, mode, commit=False).items():
+            counts[key] += value
+
+    with open(path, "rb") as raw, open_reader(raw, path) as stream:
+        records = iter_json_lines(stream) if is_jsonl(path) else iter_json_array(stream)
+        batch = []
+        try:
+            for snippet in records:
+                batch.append(snippet)
+                if len(batch) >= BATCH_SIZE:
+                    apply(batch)
+                    batch = []
+                    if cancel is not None and cancel.is_set():
+                        raise TransferCancelled()
+                    if progress:
+                        progress(raw.tell(), size)
+            apply(batch)
+            store.commit()
+        except BaseException:
+            store.conn.rollback()
+            raise
+    if progress:
+        progress(size, size)
+    return counts